@@ -0,0 +1,165 @@
+import contextvars
+import functools
+import math
+import os
+import time
+
+import anyio
+import anyio.to_thread
+
+from tracing import ADMISSIONS, ADMISSION_WAIT, log_event
+
+# Admission control per endpoint class. Each class has its own bounded number
+# of requests in flight and a bounded queue in front of it; a request that
+# finds the queue full, or waits longer than the queue timeout, is shed with
+# 429 and a Retry-After estimated from how long the class's requests take.
+#
+# Blocking work of the expensive classes also runs on its own thread limiter
+# (run_in_threadpool below) instead of the default threadpool, so a burst of
+# vision pipelines holding threads on OpenAI calls can't take the threads the
+# sync /food and /search-foods endpoints run on.
+#
+# ADMISSION_<CLASS>_CONCURRENCY / _QUEUE / _QUEUE_TIMEOUT_S / _THREADS tune a
+# class; ADMISSION_ENABLED=0 turns admission off (the thread limiters stay).
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+
+# Weight of the newest request in the per-class duration average
+DURATION_EWMA_WEIGHT = 0.2
+
+def pool_config(name, concurrency, queue, queue_timeout_s, threads):
+    prefix = f"ADMISSION_{name.upper()}_"
+    return {
+        "concurrency": int(os.getenv(prefix + "CONCURRENCY", str(concurrency))),
+        "queue": int(os.getenv(prefix + "QUEUE", str(queue))),
+        "queue_timeout_s": float(os.getenv(prefix + "QUEUE_TIMEOUT_S", str(queue_timeout_s))),
+        "threads": int(os.getenv(prefix + "THREADS", str(threads))),
+    }
+
+# threads=0 runs the class's blocking work on the default threadpool, where
+# FastAPI also runs sync endpoints
+POOLS = {
+    "interactive": pool_config("interactive", concurrency=64, queue=128, queue_timeout_s=2.0, threads=0),
+    "vision": pool_config("vision", concurrency=16, queue=32, queue_timeout_s=10.0, threads=48),
+    "llm": pool_config("llm", concurrency=8, queue=16, queue_timeout_s=10.0, threads=8),
+}
+
+# Exact paths, and prefixes ending in "/"; anything else (admin, metrics) isn't admitted
+ROUTE_CLASSES = {
+    "/food/": "interactive",
+    "/search-foods": "interactive",
+    "/text-meal": "interactive",
+    "/meal-sessions": "interactive",
+    "/meal-sessions/": "interactive",
+    "/meal-updated": "vision",
+    "/meal": "vision",
+    "/custom-food": "llm",
+    "/ingredients": "llm",
+}
+
+_current_pool = contextvars.ContextVar("eatwell_admission_pool", default=None)
+
+class AdmissionRejected(Exception):
+    def __init__(self, pool, reason, retry_after):
+        super().__init__(f"{pool} requests are over capacity ({reason}), retry in {retry_after:.0f}s")
+        self.pool = pool
+        self.reason = reason
+        self.retry_after = retry_after
+
+class Pool:
+    def __init__(self, name, concurrency, queue, queue_timeout_s, threads):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue = max(0, queue)
+        self.queue_timeout_s = queue_timeout_s
+        self.slots = anyio.CapacityLimiter(self.concurrency)
+        self.limiter = anyio.CapacityLimiter(threads) if threads > 0 else None
+        self.waiting = 0
+        self.avg_duration_s = None
+
+    def retry_after(self):
+        """Seconds until the queue ahead has likely drained, at least 1."""
+        per_request = self.avg_duration_s or self.queue_timeout_s
+        return max(1.0, math.ceil(per_request * (self.waiting + 1) / self.concurrency))
+
+    def reject(self, reason):
+        ADMISSIONS.inc((self.name, reason))
+        error = AdmissionRejected(self.name, reason, self.retry_after())
+        log_event("admission_rejected", pool=self.name, reason=reason, waiting=self.waiting, retry_after_s=error.retry_after)
+        return error
+
+    async def acquire(self):
+        """Take a slot, queueing for up to queue_timeout_s. Raises AdmissionRejected."""
+        if self.waiting == 0 and self.slots.available_tokens > 0:
+            self.slots.acquire_nowait()
+            ADMISSIONS.inc((self.name, "admitted"))
+            return
+        if self.waiting >= self.queue:
+            raise self.reject("queue_full")
+
+        start = time.perf_counter()
+        self.waiting += 1
+        try:
+            with anyio.fail_after(self.queue_timeout_s):
+                await self.slots.acquire()
+        except TimeoutError:
+            raise self.reject("queue_timeout")
+        finally:
+            self.waiting -= 1
+        ADMISSION_WAIT.observe((self.name,), time.perf_counter() - start)
+        ADMISSIONS.inc((self.name, "queued"))
+
+    def release(self, duration_s):
+        self.slots.release()
+        if self.avg_duration_s is None:
+            self.avg_duration_s = duration_s
+        else:
+            self.avg_duration_s += DURATION_EWMA_WEIGHT * (duration_s - self.avg_duration_s)
+
+    def status(self):
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.slots.borrowed_tokens,
+            "queue": self.queue,
+            "waiting": self.waiting,
+            "queue_timeout_s": self.queue_timeout_s,
+            "threads": self.limiter.total_tokens if self.limiter is not None else "default",
+            "threads_busy": self.limiter.borrowed_tokens if self.limiter is not None else None,
+            "avg_duration_ms": round(self.avg_duration_s * 1000, 1) if self.avg_duration_s is not None else None,
+        }
+
+pools = {name: Pool(name, **config) for name, config in POOLS.items()}
+
+def pool_for(path):
+    for route, name in ROUTE_CLASSES.items():
+        if path == route or (route.endswith("/") and path.startswith(route)):
+            return pools[name]
+    return None
+
+async def admit(path, call_next):
+    """Run `call_next()` in the pool for `path` once it has a slot. Raises AdmissionRejected."""
+    pool = pool_for(path)
+    if pool is None:
+        return await call_next()
+
+    token = _current_pool.set(pool)
+    try:
+        if not ADMISSION_ENABLED:
+            return await call_next()
+        await pool.acquire()
+        start = time.perf_counter()
+        try:
+            return await call_next()
+        finally:
+            pool.release(time.perf_counter() - start)
+    finally:
+        _current_pool.reset(token)
+
+async def run_in_threadpool(fn, *args, **kwargs):
+    """starlette's run_in_threadpool, on the thread limiter of the current request's pool."""
+    pool = _current_pool.get()
+    limiter = pool.limiter if pool is not None else None
+    return await anyio.to_thread.run_sync(functools.partial(fn, *args, **kwargs), limiter=limiter)
+
+def admission_status():
+    return {"enabled": ADMISSION_ENABLED, "pools": {name: pool.status() for name, pool in pools.items()}}
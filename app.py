@@ -1,23 +1,216 @@
-from fastapi import FastAPI
-from openai import OpenAI
-import uvicorn
+from fastapi import FastAPI, Request, Header, Depends
+from fastapi.responses import PlainTextResponse, Response, JSONResponse, ORJSONResponse
 import os
 from dotenv import load_dotenv
 from pydantic import BaseModel
 import json
 from fastapi import HTTPException
 import sqlite3
-from helper import get_nutrients, map_nutrients, get_portions, map_portions
-from db.search_service import fuzzy_search, fts_search
-from models.meal_analysis import AnalysisIngredient, InvalidIngredients, AnalysisMeal
+from helper import get_food, get_nutrients, map_nutrients, get_portions, map_portions
+from models.meal_analysis import AnalysisIngredient, InvalidIngredients, AnalysisMeal, TextMealAnalysis
 from helper import get_nutrients, map_nutrients, get_portions, map_portions, calculate_protein, calculate_leucine, calculate_carbohydrates, calculate_omega3s, calculate_fat, calculate_iron, calculate_zinc, calculate_fermented_food_servings, calculate_fiber, calculate_collagen, calculate_vitamin_c, calculate_vitamin_a, calculate_vitamin_e, calculate_selenium
-from query import search_food
+from openai_client import get_openai_client, call_openai, breakers, upstream_status, CircuitOpenError, RateLimitedError
+from image_pipeline import prepare_image, load_image
+from vision_cache import vision_cache, prompt_version
+from singleflight import AsyncSingleFlight
+from portions import parse_quantity, MASS_GRAMS, VOLUME_ML
+from meal_text import parse_meal_text
+from meal_sessions import meal_sessions, SessionError, VersionConflict
+from responses import model_response, parse_fields, compression_middleware
+from custom_foods import lookup as custom_food_lookup, generate_custom_foods, generate_custom_food, schedule_generation as schedule_custom_foods
+from admission import admit, admission_status, run_in_threadpool, AdmissionRejected
+from tracing import Trace, span, start_trace, end_trace, log_event, log_request, render_metrics
+from profiling import profiler
+from warmup import run_warmup, state as warmup_state
+from db.catalog import pin_catalog, unpin_catalog
+from db.snapshots import snapshots, current_db_path, SnapshotError
+from contextlib import asynccontextmanager
+from starlette.routing import Match
+import asyncio
+import logging
+import math
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+def start_snapshot():
+    try:
+        db_path, version = snapshots.startup()
+    except Exception as e:
+        # Runs in a task nobody awaits: record why /ready stays at 503
+        warmup_state["errors"]["snapshot"] = str(e)
+        log_event("snapshot_startup_failed", level=logging.ERROR, error=str(e))
+        return warmup_state
+    return run_warmup(db_path, version)
+
+# Warm caches in the background so the port opens right away; /ready flips once done
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if os.getenv("WARMUP_ENABLED", "1") == "1":
+        warmup = asyncio.create_task(asyncio.to_thread(start_snapshot))
+        if os.getenv("WARMUP_BLOCKING", "0") == "1":
+            await warmup
+    else:
+        await asyncio.to_thread(snapshots.startup)
+        warmup_state["ready"] = True
+    # Pick up newly published food.db snapshots (DB_WATCH_INTERVAL_S)
+    snapshots.start_watcher()
+    yield
 
 # Create a FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Added before the other middleware so it sits innermost and compression shows up in the request timings
+compression = compression_middleware()
+if compression is not None:
+    middleware_class, options = compression
+    app.add_middleware(middleware_class, **options)
+
+# Time every request; stages show up in the Server-Timing header, the request log and /metrics
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    trace, token = start_trace()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["Server-Timing"] = trace.server_timing()
+        return response
+    finally:
+        route = request.scope.get("route")
+        log_request(request.method, request.url.path, route.path if route else "unmatched", status, trace)
+        end_trace(token)
+
+# Pin each request to the food.db snapshot that was live when it started (see db/snapshots.py)
+@app.middleware("http")
+async def pin_snapshot(request: Request, call_next):
+    pin = pin_catalog()
+    try:
+        return await call_next(request)
+    finally:
+        unpin_catalog(pin)
+
+@app.get("/ready")
+async def ready():
+    status_code = 200 if warmup_state["ready"] else 503
+    return JSONResponse(status_code=status_code, content=warmup_state)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+# Profile a sample of requests (PROFILE_SAMPLE_RATE, off by default)
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    if request.url.path.startswith("/admin") or not profiler.should_sample():
+        return await call_next(request)
+    return await profiler.profile(call_next, request)
+
+def route_path(request: Request):
+    """The route template a request matches, before routing has run."""
+    for route in app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+# Admission control per endpoint class, outermost so queued requests hold nothing (see admission.py).
+# Shed requests never reach trace_requests, so they're logged and timed here.
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    trace = Trace()
+    try:
+        return await admit(request.url.path, lambda: call_next(request))
+    except AdmissionRejected as e:
+        log_request(request.method, request.url.path, route_path(request), 429, trace)
+        return JSONResponse(status_code=429, content={"detail": str(e)}, headers={"Retry-After": str(int(e.retry_after))})
+
+# --------------------------------------------------------------------------------
+# Admin
+# --------------------------------------------------------------------------------
+
+def require_admin(x_admin_token: str = Header(None)):
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token or x_admin_token != admin_token:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def profile_status(limit: int = 30):
+    return {**profiler.status(), "top_functions": profiler.top_functions(limit)}
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def configure_profile(mode: str = None, sample_rate: float = None, reset: bool = False):
+    try:
+        profiler.configure(mode, sample_rate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if reset:
+        profiler.reset()
+    return profiler.status()
+
+@app.get("/admin/profile/pstats", dependencies=[Depends(require_admin)])
+async def download_pstats(format: str = "binary"):
+    if format == "text":
+        return PlainTextResponse(profiler.pstats_text())
+    return Response(
+        profiler.pstats_bytes(),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": "attachment; filename=eatwell.pstats"}
+    )
+
+@app.get("/admin/profile/flamegraph", dependencies=[Depends(require_admin)])
+async def download_flamegraph():
+    return PlainTextResponse(
+        profiler.sampler.collapsed(),
+        headers={"Content-Disposition": "attachment; filename=eatwell.collapsed.txt"}
+    )
+
+@app.get("/admin/upstream", dependencies=[Depends(require_admin)])
+async def upstream():
+    return upstream_status()
+
+@app.get("/admin/admission", dependencies=[Depends(require_admin)])
+async def admission():
+    return admission_status()
+
+@app.get("/admin/vision-cache", dependencies=[Depends(require_admin)])
+async def vision_cache_status():
+    return await run_in_threadpool(vision_cache.status)
+
+@app.delete("/admin/vision-cache", dependencies=[Depends(require_admin)])
+async def clear_vision_cache():
+    await run_in_threadpool(vision_cache.clear)
+    return await run_in_threadpool(vision_cache.status)
+
+@app.get("/admin/snapshots", dependencies=[Depends(require_admin)])
+async def snapshot_status():
+    return snapshots.status()
+
+_reloads = set()
+
+async def run_reload(version):
+    try:
+        await asyncio.to_thread(snapshots.reload, version)
+    except Exception:
+        pass  # logged as snapshot_reload_failed, shows up in /admin/snapshots as last_error
+
+@app.post("/admin/snapshots/reload", status_code=202, dependencies=[Depends(require_admin)])
+async def reload_snapshot(version: str = None, wait: bool = False):
+    """Load CURRENT (or `version`) and its indexes in the background, then swap it in. wait=true blocks until it's live."""
+    if snapshots.loading is not None:
+        raise HTTPException(status_code=409, detail=f"Already loading snapshot {snapshots.loading}")
+    if wait:
+        try:
+            await asyncio.to_thread(snapshots.reload, version)
+        except SnapshotError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+    else:
+        task = asyncio.create_task(run_reload(version))
+        _reloads.add(task)
+        task.add_done_callback(_reloads.discard)
+    return snapshots.status()
 
 # source venv/bin/activate
 # uvicorn app:app --reload
@@ -26,87 +219,151 @@ app = FastAPI()
 
 
 # --------------------------------------------------------------------------------
-# NEW analyze meal
+# Vision
 # --------------------------------------------------------------------------------
 
-class AnalyzeImageRequest(BaseModel):
-    image_url: str
+def upstream_unavailable(e: CircuitOpenError | RateLimitedError):
+    # Over our own OpenAI rate limit is a 429, a failing upstream a 503
+    status_code = 429 if isinstance(e, RateLimitedError) else 503
+    return HTTPException(status_code=status_code, detail=str(e), headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+
+VISION_MODEL = "gpt-4o"
+
+MEAL_VISION_PROMPT = """
+Analyze this image and follow these stepes:
+1. Identify the visible food items.
+    - If the meal is composed of distinct, separable foods (grilled chicken, white rice, broccoli, etc.), treat each as an ingredient.
+    - If it's a single, blended, or composite food (pizza, muffin, burger, sandwich, smoothie, soup, etc.), treat it as one unified meal and do not list ingredients.
+2. Give the meal a short descriptive name, including cooking methods if applicable (grilled chicken, boiled eggs, etc.).
+3. Decide the output format based on the meal type:
+    - If the meal has distinct ingredients, return an object like this:
+    {
+        "name": "Chicken and rice",
+        "ingredients": [
+            {
+                "name": "Grilled chicken thigh",
+                "quantity_in_grams": 100.0
+            },
+            {
+                "name": "White rice",
+                "quantity_in_grams": 80.0
+            },
+            ...
+        ]
+    }
+    - If the meal is a composite food, return an object like this instead:
+    {
+        "name": "Chicken and rice",
+        "protein_in_grams": 23.0
+        "leucine_in_grams": 0.6
+        "carbohydrates_in_grams": 34.0
+        "omega3s_in_grams": 0.3
+        "fat_in_grams": 28.0
+        "iron_in_milligrams": 9.0
+        "zinc_in_milligrams": 10.0
+        "fermented_food_servings": 0.3
+        "fiber_in_grams": 5.0
+        "collagen_in_grams": 4.0
+        "vitamin_c_in_milligrams": 32.0
+        "vitamin_a_in_micrograms": 237.0
+        "vitamin_e_in_milligrams": 6.0
+        "selenium_in_micrograms": 31.0
+    }
+4. If no food is visible, return this exact object:
+{
+    "name": "Unknown",
+    "ingredients": []
+}
+5. All numeric values must be floats. Return only valid JSON - no extra text or explanations.
+"""
+
+LEGACY_VISION_PROMPT = """
+Analyze this image and follow these stepes:
+1. Identify each visible food item.
+2. Give the meal a short name less than 5 words that describes it's contents (Ground beef bowl, chicken salad, etc). If it's a single food item, return ONLY the name of the food (apple, banana, etc.).
+2. Estimate the quantity of each item (ONLY respond with oz., g, mg, cup(s), tbsp., tsp., or ser. (number of servings)).
+3. ONLY respond with a JSON object that contains the name and an array of objects following this format exactly:
+{
+    "name": "Chicken salad",
+    "ingredients": [
+        {
+            "name": "Grilled chicken breast",
+            "quantity": "4",
+            "unit": "oz."
+        },
+        {
+            "name": "Sauerkraut",
+            "quantity": "1",
+            "unit": "ser."
+        },
+        ...
+    ]
+}
+4. If there are no food items in the image, return this EXACT object:
+{
+    "name": "Unknown",
+    "ingredients": []
+}
+"""
+
+# A client retrying while its first request is still running waits on that call
+vision_flight = AsyncSingleFlight("vision")
+
+async def analyze_image(image_url, prompt):
+    """
+    Runs the vision prompt on a meal photo and returns the parsed JSON. Repeat
+    submissions of the same (or a near-identical) photo come from the vision cache.
+    """
+    version = prompt_version(VISION_MODEL, prompt)
+    return await vision_flight.do((version, image_url), run_vision, image_url, prompt, version)
+
+async def run_vision(image_url, prompt, version):
+    image_bytes = None
+
+    if vision_cache.enabled:
+        image_bytes = await load_image(image_url)
+        if image_bytes is not None:
+            try:
+                with span("vision_cache"):
+                    analysis, match = await run_in_threadpool(vision_cache.get, image_bytes, version)
+                if analysis is not None:
+                    log_event("vision_cache_hit", match=match, prompt_version=version)
+                    return analysis
+            except Exception as e:
+                log_event("vision_cache_failed", level=logging.WARNING, error=str(e))
+
+    image = await prepare_image(image_url, image_bytes)
 
-@app.post("/meal-updated")
-async def analyze_meal_updated(payload: AnalyzeImageRequest):
-    # Get list of ingredients
     try:
-        vision_completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a nutrition expert and computer vision assistant."
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": """
-                            Analyze this image and follow these stepes:
-                            1. Identify the visible food items.
-                                - If the meal is composed of distinct, separable foods (grilled chicken, white rice, broccoli, etc.), treat each as an ingredient.
-                                - If it's a single, blended, or composite food (pizza, muffin, burger, sandwich, smoothie, soup, etc.), treat it as one unified meal and do not list ingredients.
-                            2. Give the meal a short descriptive name, including cooking methods if applicable (grilled chicken, boiled eggs, etc.).
-                            3. Decide the output format based on the meal type:
-                                - If the meal has distinct ingredients, return an object like this:
-                                {
-                                    "name": "Chicken and rice",
-                                    "ingredients": [
-                                        {
-                                            "name": "Grilled chicken thigh",
-                                            "quantity_in_grams": 100.0
-                                        },
-                                        {
-                                            "name": "White rice",
-                                            "quantity_in_grams": 80.0
-                                        },
-                                        ...
-                                    ]
-                                }
-                                - If the meal is a composite food, return an object like this instead:
-                                {
-                                    "name": "Chicken and rice",
-                                    "protein_in_grams": 23.0
-                                    "leucine_in_grams": 0.6
-                                    "carbohydrates_in_grams": 34.0
-                                    "omega3s_in_grams": 0.3
-                                    "fat_in_grams": 28.0
-                                    "iron_in_milligrams": 9.0
-                                    "zinc_in_milligrams": 10.0
-                                    "fermented_food_servings": 0.3
-                                    "fiber_in_grams": 5.0
-                                    "collagen_in_grams": 4.0
-                                    "vitamin_c_in_milligrams": 32.0
-                                    "vitamin_a_in_micrograms": 237.0
-                                    "vitamin_e_in_milligrams": 6.0
-                                    "selenium_in_micrograms": 31.0
-                                }
-                            4. If no food is visible, return this exact object:
+        with span("vision"):
+            vision_completion = await run_in_threadpool(
+                call_openai, "vision", get_openai_client().chat.completions.create,
+                model=VISION_MODEL,
+                messages=[
+                    {
+                        "role": "system",
+                        "content": "You are a nutrition expert and computer vision assistant."
+                    },
+                    {
+                        "role": "user",
+                        "content": [
                             {
-                                "name": "Unknown",
-                                "ingredients": []
-                            }
-                            5. All numeric values must be floats. Return only valid JSON - no extra text or explanations.
-                            """
-                        },
-                        {
-                            "type": "image_url", 
-                            "image_url": {"url": payload.image_url}
-                        },
-                    ],
-                }
-            ]
-        )
+                                "type": "text",
+                                "text": prompt
+                            },
+                            {
+                                "type": "image_url",
+                                "image_url": image
+                            },
+                        ],
+                    }
+                ]
+            )
+    except (CircuitOpenError, RateLimitedError) as e:
+        raise upstream_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Vision API call failed: {str(e)}")
-    
+
     # Format response from OpenAI
     analysis_response = vision_completion.choices[0].message.content.strip()
     analysis_string = extract_json_from_code_block(analysis_response)
@@ -115,7 +372,43 @@ async def analyze_meal_updated(payload: AnalyzeImageRequest):
         analysis = json.loads(analysis_string)
     except json.JSONDecodeError as e:
         raise HTTPException(status_code=400, detail=f"Failed to parse vision response: {e}")
-    
+    # Both prompts ask for an object; a list or scalar would fail further on as a 500
+    if not isinstance(analysis, dict):
+        raise HTTPException(status_code=400, detail=f"Failed to parse vision response: expected a JSON object, got {type(analysis).__name__}")
+
+    if image_bytes is not None:
+        try:
+            await run_in_threadpool(vision_cache.put, image_bytes, version, analysis)
+        except Exception as e:
+            log_event("vision_cache_failed", level=logging.WARNING, error=str(e))
+
+    return analysis
+
+# --------------------------------------------------------------------------------
+# NEW analyze meal
+# --------------------------------------------------------------------------------
+
+class AnalyzeImageRequest(BaseModel):
+    image_url: str
+
+# How to resolve ingredients that aren't in the database:
+#   llm         ask GPT-4o to generate them (slowest, the original behaviour)
+#   fast        estimate locally from a weaker match or the food category average
+#   background  estimate locally now, generate with the LLM afterwards for next time
+ANALYSIS_MODES = ("llm", "fast", "background")
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "llm")
+
+@app.post("/meal-updated")
+async def analyze_meal_updated(payload: AnalyzeImageRequest, mode: str = None, fields: str = None):
+    mode = mode or ANALYSIS_MODE
+    if mode not in ANALYSIS_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(ANALYSIS_MODES)}")
+    # Reject a bad projection before paying for the vision call
+    parse_fields(AnalysisMeal, fields)
+
+    # Get list of ingredients
+    analysis = await analyze_image(payload.image_url, MEAL_VISION_PROMPT)
+
     # return analysis
     
     meal_name = analysis["name"]
@@ -123,7 +416,7 @@ async def analyze_meal_updated(payload: AnalyzeImageRequest):
     is_composite = "protein_in_grams" in analysis
 
     if is_composite:
-        return AnalysisMeal(
+        return model_response(AnalysisMeal(
             name=meal_name,
             ingredients_new=[],
             protein_float=analysis["protein_in_grams"],
@@ -140,61 +433,92 @@ async def analyze_meal_updated(payload: AnalyzeImageRequest):
             vitamin_a_float=analysis["vitamin_a_in_micrograms"],
             vitamin_e_float=analysis["vitamin_e_in_milligrams"],
             selenium_float=analysis["selenium_in_micrograms"]
-        )
+        ), fields)
     else:
         # Query database
+        from query import search_food
         ingredients = analysis["ingredients"]
 
+        # Estimate misses locally unless we're waiting on the LLM (and it's reachable)
+        estimate = mode != "llm" or breakers["chat"].is_open()
+
+        async def resolve(food):
+            cached = custom_food_lookup(food["name"], food["quantity_in_grams"])
+            if cached is not None:
+                return cached
+            # Searches block (SQLite, embeddings), so run them side by side in the threadpool
+            return await run_in_threadpool(search_food, food["name"], food["quantity_in_grams"], estimate)
+
+        results = await asyncio.gather(*(resolve(food) for food in ingredients))
+
         valid_results = []
         invalid_results = []
-        for food in ingredients:
-            result = search_food(food["name"], food["quantity_in_grams"])
-            if isinstance(result, AnalysisIngredient):
+        for food, result in zip(ingredients, results):
+            missing = {"is_valid": False, "name": food["name"], "quantity_in_grams": food["quantity_in_grams"]}
+            if isinstance(result, AnalysisIngredient) and result.is_estimated and not estimate:
+                # Matched on the text alone during an embedding outage: generate it like a miss
+                invalid_results.append(missing)
+            elif isinstance(result, AnalysisIngredient):
                 valid_results.append(result)
+                if result.is_estimated and mode == "background":
+                    invalid_results.append(missing)
             else:
-                invalid_results.append(result)
+                invalid_results.append(result or missing)
 
         custom_foods: InvalidIngredients = InvalidIngredients(ingredients=[])
 
-        if len(invalid_results) > 0:
+        if len(invalid_results) > 0 and mode == "background":
+            schedule_custom_foods(invalid_results)
+        elif len(invalid_results) > 0 and estimate:
+            # Nothing to estimate from (fast mode, or upstream is degraded)
+            log_event("custom_food_skipped", level=logging.WARNING, mode=mode, ingredients=[r["name"] for r in invalid_results])
+        elif len(invalid_results) > 0:
             # Create custom foods for foods not in database
             try:
-                chat_completion = client.beta.chat.completions.parse(
-                    model="gpt-4o",
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": f"Given this list: {invalid_results}, give me a food object like the USDA Food Central database. For each food, set 'fdc_id' to 1 and the 'amount' field to 1.0. Create one portion for each food with the appropriate gram_weight for that portion size. Provide nutrient values per 100 grams of that food."
-                        }
-                    ],
-                    response_format=InvalidIngredients
-                )
+                with span("custom_food_llm"):
+                    custom_foods.ingredients = await run_in_threadpool(generate_custom_foods, invalid_results)
+            except CircuitOpenError:
+                # The breaker tripped since we checked it: estimate these locally after all
+                log_event("custom_food_degraded", level=logging.WARNING, ingredients=[r["name"] for r in invalid_results])
+                estimates = await asyncio.gather(*(
+                    run_in_threadpool(search_food, r["name"], r["quantity_in_grams"], True) for r in invalid_results
+                ))
+                custom_foods.ingredients = [e for e in estimates if isinstance(e, AnalysisIngredient)]
+            except RateLimitedError as e:
+                raise upstream_unavailable(e)
             except Exception as e:
-                print(e)
+                log_event("custom_food_failed", level=logging.ERROR, error=str(e))
                 raise HTTPException(status_code=500, detail=f"Nutrient analysis failed: {str(e)}")
-            
-            custom_foods = chat_completion.choices[0].message.parsed
 
         database_results = valid_results + custom_foods.ingredients
 
-        return AnalysisMeal(
-            name=meal_name,
-            ingredients_new=database_results,
-            protein_float=calculate_protein(database_results),
-            leucine_float=calculate_leucine(database_results),
-            carbohydrates_float=calculate_carbohydrates(database_results),
-            omega3s_float=calculate_omega3s(database_results),
-            fat_float=calculate_fat(database_results),
-            iron_float=calculate_iron(database_results),
-            zinc_float=calculate_zinc(database_results),
-            fermented_food_servings_float=calculate_fermented_food_servings(database_results),
-            fiber_float=calculate_fiber(database_results),
-            collagen_float=calculate_collagen(database_results),
-            vitamin_c_float=calculate_vitamin_c(database_results),
-            vitamin_a_float=calculate_vitamin_a(database_results),
-            vitamin_e_float=calculate_vitamin_e(database_results),
-            selenium_float=calculate_selenium(database_results)
-        )
+        with span("aggregation"):
+            meal = build_meal(meal_name, database_results)
+
+        with span("serialization"):
+            return model_response(meal, fields)
+
+def build_meal(name, ingredients: list[AnalysisIngredient], model=AnalysisMeal, **extra):
+    """`model` for the meal with its totals added up from `ingredients`."""
+    return model(
+        name=name,
+        ingredients_new=ingredients,
+        protein_float=calculate_protein(ingredients),
+        leucine_float=calculate_leucine(ingredients),
+        carbohydrates_float=calculate_carbohydrates(ingredients),
+        omega3s_float=calculate_omega3s(ingredients),
+        fat_float=calculate_fat(ingredients),
+        iron_float=calculate_iron(ingredients),
+        zinc_float=calculate_zinc(ingredients),
+        fermented_food_servings_float=calculate_fermented_food_servings(ingredients),
+        fiber_float=calculate_fiber(ingredients),
+        collagen_float=calculate_collagen(ingredients),
+        vitamin_c_float=calculate_vitamin_c(ingredients),
+        vitamin_a_float=calculate_vitamin_a(ingredients),
+        vitamin_e_float=calculate_vitamin_e(ingredients),
+        selenium_float=calculate_selenium(ingredients),
+        **extra
+    )
 
 # Helper function
 def extract_json_from_code_block(text: str) -> str:
@@ -216,97 +540,152 @@ def extract_json_from_code_block(text: str) -> str:
 @app.post("/custom-food")
 async def custom_food(name: str, amount: float, modifier: str):
     try:
-        chat_completion = client.beta.chat.completions.parse(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"Give me a food object for {name} like the USDA Food Central database. Set 'fdc_id' to 1 and the 'amount' field to 1.0. Create one portion for {amount} {modifier} with the appropriate gram_weight for that portion size. Provide nutrient values per 100 grams of {name}."
-                }
-            ],
-            response_format=AnalysisIngredient
-        )
+        with span("custom_food_llm"):
+            # Batched with the other requests' unresolved foods
+            food = await run_in_threadpool(generate_custom_food, name, f"{amount} {modifier}")
+    except (CircuitOpenError, RateLimitedError) as e:
+        raise upstream_unavailable(e)
     except Exception as e:
-        print(e)
+        log_event("custom_food_failed", level=logging.ERROR, error=str(e))
         raise HTTPException(status_code=500, detail=f"Nutrient analysis failed: {str(e)}")
+    if food is None:
+        log_event("custom_food_failed", level=logging.ERROR, error="no food generated", name=name)
+        raise HTTPException(status_code=500, detail="Nutrient analysis failed: no food generated")
     
-    return chat_completion.choices[0].message.parsed
+    return food
 
 
 # --------------------------------------------------------------------------------
-# Get food details
+# Typed meal
 # --------------------------------------------------------------------------------
 
-@app.get("/food/{fdc_id}")
-async def food_details(fdc_id: int):
-    DB_PATH = os.getenv("DB_PATH", "food.db")
-
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT fdc_id, data_type, description, fermented_food_serving_size, CAST(collagen AS REAL) AS collagen
-        FROM sr_legacy_food
-        WHERE fdc_id = ?
-    """, (fdc_id,))
-    food_row = cursor.fetchone()
-    colnames = [desc[0] for desc in cursor.description]
-
-    if not food_row:
-        conn.close()
+class TextMealRequest(BaseModel):
+    text: str
+    name: str = None
+
+def resolve_text_item(item):
+    """search_food for a parsed item, locally: lexical rerank and local estimates, no OpenAI calls."""
+    from query import search_food
+
+    if not item["name"]:
         return None
+    result = search_food(item["name"], item["quantity"], True, item["unit"], local=True)
+    # A count unit the food has no portion for ("1 can tuna"): count whole ones instead
+    if not isinstance(result, AnalysisIngredient) and item["unit"] not in MASS_GRAMS and item["unit"] not in VOLUME_ML and item["unit"] != "each":
+        result = search_food(item["name"], item["quantity"], True, "each", local=True)
+    return result if isinstance(result, AnalysisIngredient) else None
+
+@app.post("/text-meal")
+def analyze_text_meal(payload: TextMealRequest, fields: str = None):
+    parse_fields(TextMealAnalysis, fields)
+    with span("text_parse"):
+        items = parse_meal_text(payload.text)
+    if not any(item["name"] for item in items):
+        raise HTTPException(status_code=400, detail="No foods found in text")
+
+    results = [resolve_text_item(item) for item in items]
+    ingredients = [result for result in results if result is not None]
+    unresolved = [item["text"] for item, result in zip(items, results) if result is None]
+    if unresolved:
+        log_event("text_meal_unresolved", level=logging.WARNING, items=unresolved)
+
+    with span("aggregation"):
+        meal = build_meal(payload.name or payload.text.strip(), ingredients, model=TextMealAnalysis, unresolved=unresolved)
+
+    with span("serialization"):
+        return model_response(meal, fields)
 
-    food_data = dict(zip(colnames, food_row))
+# --------------------------------------------------------------------------------
+# Meal sessions
+# --------------------------------------------------------------------------------
 
-    # --- 3. Nutrients (cast nutrient_nbr to INTEGER) ---
-    food_data["food_nutrients"] = get_nutrients(conn, fdc_id)
+class MealEdit(BaseModel):
+    op: str
+    id: str = None
+    selected_portion_id: int = None
+    amount: float = None
+    ingredient: AnalysisIngredient = None
+
+class MealEditRequest(BaseModel):
+    edits: list[MealEdit]
+    # The session version the edits were made against; a stale one gets a 409
+    version: int = None
+
+def get_meal_session(session_id):
+    session = meal_sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Meal session not found or expired")
+    return session
+
+@app.post("/meal-sessions", status_code=201)
+async def create_meal_session(meal: AnalysisMeal):
+    """Start editing a meal (as /meal-updated returned it). Ingredients get ids in the order sent."""
+    try:
+        session = meal_sessions.create(meal)
+    except SessionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return session.state()
+
+@app.get("/meal-sessions/{session_id}")
+async def meal_session(session_id: str, fields: str = None):
+    return model_response(get_meal_session(session_id).to_meal(), fields)
+
+@app.patch("/meal-sessions/{session_id}")
+async def edit_meal_session(session_id: str, payload: MealEditRequest):
+    """Add, update (selected_portion_id, amount) or remove ingredients; returns only the totals that changed."""
+    session = get_meal_session(session_id)
+    try:
+        return session.apply([dict(edit) for edit in payload.edits], payload.version)
+    except VersionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except SessionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # --- 4. Portions ---
-    food_data["food_portions"] = get_portions(conn, fdc_id)
+@app.delete("/meal-sessions/{session_id}", status_code=204)
+async def delete_meal_session(session_id: str):
+    if not meal_sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Meal session not found or expired")
 
-    # Get nutrient data
-    nutrients = get_nutrients(conn, fdc_id)
-    mapped_nutrients = map_nutrients(nutrients, food_data)
+# --------------------------------------------------------------------------------
+# Get food details
+# --------------------------------------------------------------------------------
 
-    # Get portion data
-    portions = get_portions(conn, fdc_id)
-    mapped_portions = map_portions(portions)
+@app.get("/food/{fdc_id}")
+def food_details(fdc_id: int, fields: str = None):
+    from query import hydration_flight, load_food_details
+
+    details = hydration_flight.do(fdc_id, load_food_details, fdc_id)
+    if details is None:
+        return None
+    food_data, mapped_nutrients, mapped_portions = details
 
     # Get first portion
     selected_portion_id = 1
     if len(mapped_portions) > 0:
         selected_portion_id = mapped_portions[0].id
 
-    ingredient = AnalysisIngredient(
+    return model_response(AnalysisIngredient(
         fdc_id=food_data["fdc_id"],
         description=food_data["description"],
         amount=1.0,
         selected_portion_id=selected_portion_id,
         portions=mapped_portions,
         nutrients=mapped_nutrients
-    )
-
-    conn.close()
-    return ingredient
+    ), fields)
 
 # --------------------------------------------------------------------------------
 # Search for food
 # --------------------------------------------------------------------------------
 
 @app.post("/search-foods")
-async def search_foods(term: str):
-    DB_PATH = os.getenv("DB_PATH", "food.db")
-    
-    conn = sqlite3.connect(DB_PATH)
-    fts_results = fts_search(term, conn, limit=10)
-    fuzzy_results = fuzzy_search(term, conn, limit=10)
-
-    seen = set()
-    candidates = []
-    for fdc_id, data_type, description in fts_results + fuzzy_results:
-        key = (fdc_id, data_type)
-        if key not in seen:
-            candidates.append({"fdc_id": fdc_id, "data_type": data_type, "description": description})
-            seen.add(key)
+def search_foods(term: str):
+    from db.search_service import text_search
+
+    conn = sqlite3.connect(current_db_path())
+    try:
+        candidates = text_search(term, conn, limit=10)
+    finally:
+        conn.close()
     
     return {
         "foods": candidates
@@ -343,102 +722,93 @@ class Ingredient(BaseModel):
 class UpdateRequest(BaseModel):
     ingredients: list[Ingredient]
 
-# NEED TO KEEP - ADD NEW ENDPOINT FOR UPDATED MODEL
-# Analyze meal
-@app.post("/meal")
-async def analyze_meal(payload: AnalyzeRequest):
-    # Step 1: Call vision completion
-    try:
-        vision_completion = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a nutrition expert and computer vision assistant."
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": """
-                            Analyze this image and follow these stepes:
-                            1. Identify each visible food item.
-                            2. Give the meal a short name less than 5 words that describes it's contents (Ground beef bowl, chicken salad, etc). If it's a single food item, return ONLY the name of the food (apple, banana, etc.).
-                            2. Estimate the quantity of each item (ONLY respond with oz., g, mg, cup(s), tbsp., tsp., or ser. (number of servings)).
-                            3. ONLY respond with a JSON object that contains the name and an array of objects following this format exactly:
-                            {
-                                "name": "Chicken salad",
-                                "ingredients": [
-                                    {
-                                        "name": "Grilled chicken breast",
-                                        "quantity": "4",
-                                        "unit": "oz."
-                                    },
-                                    {
-                                        "name": "Sauerkraut",
-                                        "quantity": "1",
-                                        "unit": "ser."
-                                    },
-                                    ...
-                                ]
-                            }
-                            4. If there are no food items in the image, return this EXACT object:
-                            {
-                                "name": "Unknown",
-                                "ingredients": []
-                            }
-                            """
-                        },
-                        {
-                            "type": "image_url", 
-                            "image_url": {"url": payload.image_url}
-                        },
-                    ],
-                }
-            ]
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Vision API call failed: {str(e)}")
-
-    # Step 2: Parse JSON from vision completion
-    ingredients_response = vision_completion.choices[0].message.content.strip()
-    ingredients_string = extract_json_from_code_block(ingredients_response)
-
-    try:
-        ingredients = json.loads(ingredients_string)
-    except json.JSONDecodeError as e:
-        raise HTTPException(status_code=400, detail=f"Failed to parse vision response: {e}")
-
-    # print("INGREDIENTS:")
-    # print(ingredients)
-
-    # Step 3: Call chat completion for nutrient analysis
-    try:
-        chat_completion = client.beta.chat.completions.parse(
+# IngredientResponse field -> the helper that totals it from resolved ingredients
+LEGACY_NUTRIENTS = {
+    "protein_in_grams": calculate_protein,
+    "collagen_in_grams": calculate_collagen,
+    "leucine_in_grams": calculate_leucine,
+    "carbohydrates_in_grams": calculate_carbohydrates,
+    "omega3s_in_grams": calculate_omega3s,
+    "fat_in_grams": calculate_fat,
+    "zinc_in_milligrams": calculate_zinc,
+    "iron_in_milligrams": calculate_iron,
+    "fermented_food_servings": calculate_fermented_food_servings,
+    "fiber_in_grams": calculate_fiber,
+    "vitamin_c_in_milligrams": calculate_vitamin_c,
+    "vitamin_a_in_micrograms": calculate_vitamin_a,
+    "vitamin_e_in_milligrams": calculate_vitamin_e,
+    "selenium_in_micrograms": calculate_selenium,
+}
+
+async def legacy_nutrient_llm(ingredients: list[dict]) -> dict:
+    """The original nutrient analysis prompt, now only for ingredients the database couldn't resolve."""
+    with span("nutrient_llm"):
+        chat_completion = await run_in_threadpool(
+            call_openai, "chat", get_openai_client().beta.chat.completions.parse,
             model="gpt-4o",
             messages=[
                 {
                     "role": "user",
-                    "content": f"Based on these ingredients, give me a nutrient analysis:\n{ingredients}."
+                    "content": f"Based on these ingredients, give me a nutrient analysis:\n{ingredients}. 'ser.' is equal to serving(s)."
                 }
             ],
             response_format=IngredientResponse
         )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Nutrient analysis failed: {str(e)}")
 
-    # Step 4: Parse nutrient analysis response
     nutrients_response = chat_completion.choices[0].message.content.strip()
     nutrients_string = extract_json_from_code_block(nutrients_response)
+    return json.loads(nutrients_string)
+
+async def analyze_legacy_ingredients(ingredients: list[dict]) -> dict:
+    """
+    IngredientResponse totals for {"name", "quantity", "unit"} items. Each one
+    is matched with search_food and converted to grams with its own portions;
+    only the ones that don't resolve (or unparseable quantities) go to the LLM.
+    """
+    from query import search_food
+
+    # Estimate misses locally while the LLM is unreachable
+    estimate = breakers["chat"].is_open()
+
+    async def resolve(item):
+        quantity = parse_quantity(item.get("quantity"))
+        if quantity is None or not item.get("name"):
+            return None
+        result = await run_in_threadpool(search_food, item["name"], quantity, estimate, item.get("unit") or "ser.")
+        return result if isinstance(result, AnalysisIngredient) else None
+
+    results = await asyncio.gather(*(resolve(item) for item in ingredients))
+    resolved = [result for result in results if result is not None]
+    unresolved = [item for item, result in zip(ingredients, results) if result is None]
+
+    with span("aggregation"):
+        totals = {field: calculate(resolved) for field, calculate in LEGACY_NUTRIENTS.items()}
+
+    if unresolved and estimate:
+        log_event("custom_food_skipped", level=logging.WARNING, mode="legacy", ingredients=[item.get("name") for item in unresolved])
+    elif unresolved:
+        generated = await legacy_nutrient_llm(unresolved)
+        for field in totals:
+            totals[field] += float(generated.get(field) or 0)
+
+    return IngredientResponse(**{field: round(value) for field, value in totals.items()}).model_dump()
+
+# NEED TO KEEP - ADD NEW ENDPOINT FOR UPDATED MODEL
+# Analyze meal
+@app.post("/meal")
+async def analyze_meal(payload: AnalyzeRequest):
+    # Step 1 and 2: Call vision completion and parse JSON
+    ingredients = await analyze_image(payload.image_url, LEGACY_VISION_PROMPT)
 
+    # Step 3: Nutrient analysis from the database, the LLM only fills in what it can't find
     try:
-        nutrients = json.loads(nutrients_string)
+        nutrients = await analyze_legacy_ingredients(ingredients.get("ingredients", []))
+    except (CircuitOpenError, RateLimitedError) as e:
+        raise upstream_unavailable(e)
     except json.JSONDecodeError as e:
         raise HTTPException(status_code=400, detail=f"Failed to parse nutrient response: {e}")
-
-    # print("NUTRIENTS:")
-    # print(nutrients)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Nutrient analysis failed: {str(e)}")
 
     return {
         "meal_analysis": ingredients,
@@ -449,37 +819,20 @@ async def analyze_meal(payload: AnalyzeRequest):
 @app.post("/ingredients")
 async def analyze_edited_meal(payload: UpdateRequest):
     try:
-        chat_completion = client.beta.chat.completions.parse(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user", 
-                    "content": f"Based on these ingredients, give me a nutrient analysis:\n{payload.ingredients}. 'ser.' is equal to serving(s)."
-                }
-            ],
-            response_format=IngredientResponse
-        )
-
-        nutrients_response = chat_completion.choices[0].message.content.strip()
-        nutrients_string = extract_json_from_code_block(nutrients_response)
-
-        try:
-            nutrients = json.loads(nutrients_string)
-        except json.JSONDecodeError as e:
-            return {
-                "error": f"Failed to parse chat response as JSON: {e}",
-                "raw": nutrients_string
-            }
-
+        nutrients = await analyze_legacy_ingredients([ingredient.model_dump() for ingredient in payload.ingredients])
+    except json.JSONDecodeError as e:
         return {
-            "nutrients": nutrients
+            "error": f"Failed to parse chat response as JSON: {e}"
         }
-
     except Exception as e:
         return {
             "error": str(e)
         }
 
+    return {
+        "nutrients": nutrients
+    }
+
 # Helper function
 def extract_json_from_code_block(text: str) -> str:
     """
@@ -493,5 +846,6 @@ def extract_json_from_code_block(text: str) -> str:
     return text.strip()
     
 if __name__ == "__main__":
+    import uvicorn
     port = int(os.getenv("PORT", 10000))
     uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,119 @@
+import threading
+
+from tracing import BATCH_ITEMS, start_trace, end_trace, current_trace
+
+# Micro-batching for blocking upstream calls made from worker threads. Items
+# submitted within `window_ms` of each other (or until `max_size` are
+# waiting) go out as one call, and each caller gets its own result back.
+#
+# There's no dispatcher thread: the first caller of a batch is its leader. It
+# waits out the window (or until the batch fills), closes the batch and runs
+# the call on its own thread, then wakes the others. Batches that close while
+# another is still in flight run in parallel on their own leaders' threads.
+# The window is only waited out while another batch is in flight, so an idle
+# server sends right away and batches only form under load.
+#
+# The leader runs the call in its own context, so what the call depends on
+# from the caller's context has to be the same for the whole batch: `group`
+# gives the caller's key for it (the pinned food.db, say) and only items with
+# the same key share a batch. Spans recorded during the call are added to
+# every submitter's trace, not just the leader's.
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+        self.spans = []
+
+class MicroBatcher:
+    def __init__(self, name, fn, window_ms, max_size, group=None):
+        """
+        `fn` takes a list of items and returns a list of results in the same
+        order. `group`, if given, is called on the submitting thread and
+        returns the key of the batch its items may join.
+        """
+        self.name = name
+        self.fn = fn
+        self.window_ms = window_ms
+        self.max_size = max(1, max_size)
+        self.group = group
+        # Open batch per group key
+        self.open = {}
+        self.running = 0
+        self.lock = threading.Lock()
+
+    def submit(self, item):
+        """Result for `item`, computed as part of a batch. Blocks until that batch is done."""
+        return self.submit_many([item])[0]
+
+    def submit_many(self, items):
+        """
+        Results for `items`, which always go out together in one batch (so
+        one caller's items are never split across calls, even past max_size).
+        Blocks until that batch is done.
+        """
+        if not items:
+            return []
+        if self.window_ms <= 0 or self.max_size == 1:
+            BATCH_ITEMS.observe((self.name,), len(items))
+            return self.fn(list(items))
+
+        key = self.group() if self.group is not None else None
+        with self.lock:
+            batch = self.open.get(key)
+            if batch is not None and len(batch.items) + len(items) > self.max_size:
+                # No room: send the open batch now and start a new one
+                del self.open[key]
+                batch.full.set()
+                batch = None
+            leader = batch is None
+            if leader:
+                batch = self.open[key] = _Batch()
+            start = len(batch.items)
+            batch.items.extend(items)
+            if len(batch.items) >= self.max_size:
+                del self.open[key]
+                batch.full.set()
+            busy = self.running > 0
+
+        if leader:
+            if busy:
+                batch.full.wait(self.window_ms / 1000)
+            with self.lock:
+                if self.open.get(key) is batch:
+                    del self.open[key]
+                self.running += 1
+            try:
+                self.run(batch)
+            finally:
+                with self.lock:
+                    self.running -= 1
+        else:
+            batch.done.wait()
+
+        trace = current_trace()
+        if trace is not None:
+            for name, duration_ms in batch.spans:
+                trace.add(name, duration_ms)
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[start:start + len(items)]
+
+    def run(self, batch):
+        BATCH_ITEMS.observe((self.name,), len(batch.items))
+        # Collected apart from the leader's trace, submit_many hands them to every submitter
+        trace, token = start_trace()
+        try:
+            results = self.fn(batch.items)
+            if len(results) != len(batch.items):
+                raise RuntimeError(f"{self.name} batch returned {len(results)} results for {len(batch.items)} items")
+            batch.results = results
+        except BaseException as e:
+            batch.error = e
+        finally:
+            end_trace(token)
+            batch.spans = trace.spans
+            batch.done.set()
@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.fixtures import build_fixture_db, FIXTURE_DB_PATH
+from benchmarks.fake_openai import FakeOpenAIServer, FakeOpenAIConfig
+from benchmarks.common import summarize, save_results, load_results, print_comparison
+
+# /search-foods latency while a burst of /meal-updated vision pipelines comes
+# in, with and without admission control (see admission.py). "off" runs every
+# endpoint's blocking work on the shared default threadpool with nothing shed;
+# "on" gives vision its own pool, queue and thread limiter and sheds the
+# overflow with 429. Each mode runs in its own process against the fake
+# OpenAI server, open-loop like the load test.
+# python -m benchmarks.admission_bench
+# python -m benchmarks.admission_bench --vision-rps 40 --search-rps 20 --compare benchmarks/results/admission_<timestamp>.json
+
+MODES = {
+    "off": {"ADMISSION_ENABLED": "0", "ADMISSION_VISION_THREADS": "0", "ADMISSION_LLM_THREADS": "0"},
+    "on": {"ADMISSION_ENABLED": "1"},
+}
+
+SEARCH_TERMS = ["chicken breast", "white rice", "broccoli", "salmon", "greek yogurt", "oatmeal", "banana", "almonds"]
+
+async def drive(app, vision_rps, search_rps, duration, timeout):
+    transport = httpx.ASGITransport(app=app)
+    latencies = {"vision": [], "search": []}
+    statuses = {"vision": Counter(), "search": Counter()}
+
+    async def one(kind, request):
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(request, timeout)
+            statuses[kind][str(response.status_code)] += 1
+            if response.status_code == 200:
+                latencies[kind].append((time.perf_counter() - start) * 1000)
+        except asyncio.TimeoutError:
+            statuses[kind]["timeout"] += 1
+
+    async def fire(kind, rps, make_request):
+        tasks = []
+        started = time.perf_counter()
+        for i in range(max(1, int(rps * duration))):
+            delay = started + i / rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(kind, make_request(i))))
+        await asyncio.gather(*tasks)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=timeout) as client:
+        await asyncio.gather(
+            # Distinct photos, so the vision single-flight doesn't coalesce them
+            fire("vision", vision_rps, lambda i: client.post("/meal-updated", params={"mode": "fast"}, json={"image_url": f"https://example.com/meal-{i}.jpg"})),
+            fire("search", search_rps, lambda i: client.post("/search-foods", params={"term": SEARCH_TERMS[i % len(SEARCH_TERMS)]})),
+        )
+
+    return {kind: {"latency": summarize(latencies[kind]), "status_codes": dict(statuses[kind])} for kind in latencies}
+
+def run_mode(env, args, queue):
+    os.environ.update(env)
+    config = FakeOpenAIConfig(args.vision_latency_ms, args.parse_latency_ms, args.embedding_latency_ms)
+    fake = FakeOpenAIServer(config).start()
+    # The app and its OpenAI clients read these at import time
+    os.environ["DB_PATH"] = args.db or build_fixture_db(FIXTURE_DB_PATH)
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ["OPENAI_API_KEY"] = "sk-fake"
+    import app as app_module
+    from warmup import run_warmup
+    run_warmup(os.environ["DB_PATH"])
+    try:
+        queue.put(asyncio.run(drive(app_module.app, args.vision_rps, args.search_rps, args.duration, args.timeout)))
+    finally:
+        fake.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search latency under a vision spike, with and without admission control.")
+    parser.add_argument("--vision-rps", type=float, default=30.0)
+    parser.add_argument("--search-rps", type=float, default=20.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--vision-latency-ms", type=float, default=2500.0)
+    parser.add_argument("--parse-latency-ms", type=float, default=1500.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=150.0)
+    parser.add_argument("--db", help="Run against an existing food.db instead of the fixture.")
+    parser.add_argument("--output", help="Where to write the results JSON.")
+    parser.add_argument("--compare", help="Previous results JSON to compare against.")
+    args = parser.parse_args()
+
+    results = {"config": vars(args), "modes": {}}
+    context = multiprocessing.get_context("spawn")
+    print(f"{'mode':<5} {'search p50':>10} {'p95':>8} {'p99':>8} {'search codes':<24} {'vision p50':>10} {'p95':>8} {'vision codes':<30}")
+    for mode, env in MODES.items():
+        queue = context.Queue()
+        process = context.Process(target=run_mode, args=(env, args, queue))
+        process.start()
+        r = queue.get()
+        process.join()
+        results["modes"][mode] = r
+        search, vision = r["search"], r["vision"]
+        print(
+            f"{mode:<5} {search['latency']['p50_ms']:>10.1f} {search['latency']['p95_ms']:>8.1f} {search['latency']['p99_ms']:>8.1f} {str(search['status_codes']):<24} "
+            f"{vision['latency']['p50_ms']:>10.1f} {vision['latency']['p95_ms']:>8.1f} {str(vision['status_codes']):<30}"
+        )
+
+    output = save_results("admission", results, args.output)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        print()
+        keys = [f"modes.{mode}.{kind}.latency.{p}" for mode in MODES for kind in ("search", "vision") for p in ("p50_ms", "p99_ms")]
+        print_comparison(load_results(args.compare), results, keys)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import os
+import threading
+import time
+
+from benchmarks.fake_openai import FakeOpenAIServer, FakeOpenAIConfig
+from benchmarks.common import summarize, save_results, load_results, print_comparison
+
+# Embedding API calls and throughput with and without micro-batching
+# (EMBED_BATCH_WINDOW_MS / EMBED_BATCH_MAX, see batching.py). Worker threads,
+# like the threadpool search runs on, embed distinct search terms as fast as
+# they can against the fake OpenAI server for a fixed duration.
+# python -m benchmarks.batch_bench
+# python -m benchmarks.batch_bench --concurrency 4 16 64 --windows 0 2 5 10 --compare benchmarks/results/batch_<timestamp>.json
+
+TERMS = ["chicken breast", "white rice", "broccoli", "salmon fillet", "greek yogurt", "oatmeal", "banana", "almonds"]
+
+def run(search_service, config, concurrency, window_ms, max_size, duration):
+    search_service.embedding_batcher.window_ms = window_ms
+    search_service.embedding_batcher.max_size = max_size
+
+    timings = []
+    errors = 0
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+
+    def worker(n):
+        nonlocal errors
+        i = 0
+        while time.perf_counter() < stop:
+            # Distinct terms, so the single-flight in front of the batcher doesn't coalesce them
+            term = f"{TERMS[(n + i) % len(TERMS)]} {n}-{i}"
+            start = time.perf_counter()
+            try:
+                search_service.get_embedding(term)
+                with lock:
+                    timings.append((time.perf_counter() - start) * 1000)
+            except Exception:
+                with lock:
+                    errors += 1
+            i += 1
+
+    calls_before = config.counts["embeddings"]
+    wall_start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall_start
+    calls = config.counts["embeddings"] - calls_before
+
+    return {
+        "concurrency": concurrency,
+        "window_ms": window_ms,
+        "embeddings": len(timings),
+        "errors": errors,
+        "api_calls": calls,
+        "api_calls_per_s": round(calls / wall, 1),
+        "throughput_per_s": round(len(timings) / wall, 1),
+        "items_per_call": round(len(timings) / calls, 2) if calls else 0.0,
+        "latency": summarize(timings),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding micro-batching under concurrent load.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 5], help="EMBED_BATCH_WINDOW_MS values; 0 is unbatched.")
+    parser.add_argument("--max-size", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=150.0)
+    parser.add_argument("--output", help="Where to write the results JSON.")
+    parser.add_argument("--compare", help="Previous results JSON to compare against.")
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(embedding_latency_ms=args.embedding_latency_ms, jitter=0.2)
+    fake = FakeOpenAIServer(config).start()
+    # The OpenAI client reads these when it is first created
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ["OPENAI_API_KEY"] = "sk-fake"
+    import db.search_service as search_service
+
+    results = {"config": vars(args), "runs": {}}
+    print(f"{'threads':>7} {'window':>7} {'embeds/s':>9} {'calls/s':>8} {'per call':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>6}")
+    try:
+        for concurrency in args.concurrency:
+            for window_ms in args.windows:
+                r = run(search_service, config, concurrency, window_ms, args.max_size, args.duration)
+                results["runs"].setdefault(str(concurrency), {})[str(window_ms)] = r
+                print(
+                    f"{concurrency:>7} {window_ms:>7} {r['throughput_per_s']:>9} {r['api_calls_per_s']:>8} {r['items_per_call']:>8} "
+                    f"{r['latency']['p50_ms']:>8.1f} {r['latency']['p95_ms']:>8.1f} {r['errors']:>6}"
+                )
+    finally:
+        fake.stop()
+
+    output = save_results("batch", results, args.output)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        print()
+        keys = [
+            f"runs.{c}.{w}.{metric}" for c in args.concurrency for w in args.windows
+            for metric in ("throughput_per_s", "api_calls_per_s", "latency.p95_ms")
+        ]
+        print_comparison(load_results(args.compare), results, keys)
+
+if __name__ == "__main__":
+    main()
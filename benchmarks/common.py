@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess
+import time
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# --------------------------------------------------------------------------------
+# Stats and result files shared by the benchmarks
+# --------------------------------------------------------------------------------
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * (pct / 100.0)
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+def summarize(samples_ms):
+    """Summarize a list of millisecond timings."""
+    if not samples_ms:
+        return {"count": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    return {
+        "count": len(samples_ms),
+        "mean_ms": round(sum(samples_ms) / len(samples_ms), 3),
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p95_ms": round(percentile(samples_ms, 95), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+        "max_ms": round(max(samples_ms), 3),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+def save_results(name, results, output=None):
+    results = {
+        "benchmark": name,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        **results,
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=4)
+    return output
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+def print_comparison(previous, current, keys):
+    """Print `keys` (dotted paths) from two result files side by side."""
+    def lookup(results, dotted):
+        value = results
+        for part in dotted.split("."):
+            if not isinstance(value, dict) or part not in value:
+                return None
+            value = value[part]
+        return value
+
+    print(f"{'metric':<40} {'previous':>12} {'current':>12} {'delta':>10}")
+    for key in keys:
+        old, new = lookup(previous, key), lookup(current, key)
+        if old is None or new is None:
+            continue
+        delta = f"{((new - old) / old) * 100:+.1f}%" if old else "n/a"
+        print(f"{key:<40} {old:>12.3f} {new:>12.3f} {delta:>10}")
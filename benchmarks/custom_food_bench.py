@@ -0,0 +1,121 @@
+import argparse
+import os
+import threading
+import time
+
+from benchmarks.fake_openai import FakeOpenAIServer, FakeOpenAIConfig
+from benchmarks.fixtures import build_fixture_db, FIXTURE_DB_PATH
+from benchmarks.common import summarize, save_results, load_results, print_comparison
+
+# Custom food parse calls and latency with and without cross-request batching
+# (CUSTOM_FOOD_BATCH_WINDOW_MS / CUSTOM_FOOD_BATCH_MAX, see custom_foods.py).
+# Worker threads play /meal-updated requests that each leave a few foods
+# unresolved: one of their own and one sauce/dressing that concurrent requests
+# also ask for, and generate them as fast as they can for a fixed duration.
+# The fake server's parse latency grows per generated food, like output tokens.
+# python -m benchmarks.custom_food_bench
+# python -m benchmarks.custom_food_bench --concurrency 4 16 64 --windows 0 50 100 --compare benchmarks/results/custom_food_<timestamp>.json
+
+SHARED = ["Teriyaki glaze", "Sriracha mayo", "Ranch dressing", "Tahini sauce"]
+
+def run(custom_foods, config, concurrency, window_ms, max_size, duration):
+    custom_foods.custom_food_batcher.window_ms = window_ms
+    custom_foods.custom_food_batcher.max_size = max_size
+    custom_foods.custom_food_cache.foods.clear()
+
+    timings = []
+    foods = 0
+    errors = 0
+    lock = threading.Lock()
+    stop = time.perf_counter() + duration
+
+    def worker(n):
+        nonlocal foods, errors
+        i = 0
+        while time.perf_counter() < stop:
+            # The shared name changes every round, so the cache only helps concurrent requests
+            items = [
+                {"is_valid": False, "name": f"{SHARED[i % len(SHARED)]} {i}", "quantity_in_grams": 20.0},
+                {"is_valid": False, "name": f"House special {n}-{i}", "quantity_in_grams": 150.0},
+            ]
+            start = time.perf_counter()
+            try:
+                generated = custom_foods.generate_custom_foods(items)
+                with lock:
+                    timings.append((time.perf_counter() - start) * 1000)
+                    foods += len(generated)
+            except Exception:
+                with lock:
+                    errors += 1
+            i += 1
+
+    calls_before = config.counts["parse"]
+    wall_start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall_start
+    calls = config.counts["parse"] - calls_before
+
+    return {
+        "concurrency": concurrency,
+        "window_ms": window_ms,
+        "requests": len(timings),
+        "foods": foods,
+        "errors": errors,
+        "api_calls": calls,
+        "calls_per_request": round(calls / len(timings), 2) if timings else 0.0,
+        "throughput_per_s": round(len(timings) / wall, 1),
+        "latency": summarize(timings),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark custom food generation batching under concurrent load.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 50], help="CUSTOM_FOOD_BATCH_WINDOW_MS values; 0 is unbatched.")
+    parser.add_argument("--max-size", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--parse-latency-ms", type=float, default=1200.0)
+    parser.add_argument("--parse-item-latency-ms", type=float, default=40.0)
+    parser.add_argument("--output", help="Where to write the results JSON.")
+    parser.add_argument("--compare", help="Previous results JSON to compare against.")
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(parse_latency_ms=args.parse_latency_ms, parse_item_latency_ms=args.parse_item_latency_ms, jitter=0.2)
+    fake = FakeOpenAIServer(config).start()
+    # The OpenAI client reads these when it is first created
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ["OPENAI_API_KEY"] = "sk-fake"
+    # Generated foods are checked against their category in the food database
+    os.environ["DB_PATH"] = build_fixture_db(FIXTURE_DB_PATH)
+    import custom_foods
+
+    results = {"config": vars(args), "runs": {}}
+    print(f"{'threads':>7} {'window':>7} {'req/s':>7} {'calls':>6} {'calls/req':>9} {'p50 ms':>8} {'p95 ms':>8} {'errors':>6}")
+    try:
+        for concurrency in args.concurrency:
+            for window_ms in args.windows:
+                r = run(custom_foods, config, concurrency, window_ms, args.max_size, args.duration)
+                results["runs"].setdefault(str(concurrency), {})[str(window_ms)] = r
+                print(
+                    f"{concurrency:>7} {window_ms:>7} {r['throughput_per_s']:>7} {r['api_calls']:>6} {r['calls_per_request']:>9} "
+                    f"{r['latency']['p50_ms']:>8.1f} {r['latency']['p95_ms']:>8.1f} {r['errors']:>6}"
+                )
+    finally:
+        fake.stop()
+
+    output = save_results("custom_food", results, args.output)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        print()
+        keys = [
+            f"runs.{c}.{w}.{metric}" for c in args.concurrency for w in args.windows
+            for metric in ("throughput_per_s", "calls_per_request", "latency.p95_ms")
+        ]
+        print_comparison(load_results(args.compare), results, keys)
+
+if __name__ == "__main__":
+    main()
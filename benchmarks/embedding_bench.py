@@ -0,0 +1,110 @@
+import argparse
+import json
+import multiprocessing
+
+import numpy as np
+
+from benchmarks.fixtures import build_fixture_db, FIXTURE_DB_PATH
+from benchmarks.common import save_results, load_results, print_comparison
+
+# Embedding memory and rerank accuracy with compressed embeddings (int8 and/or
+# Matryoshka truncation, see db/embeddings.py) against the full float32 matrix.
+# Memory is what the catalog keeps on the heap; with CATALOG_STORE=1 the
+# arrays are mapped from the shared store and reported as mapped instead.
+# Each variant runs search_bench in its own process; "rescore" is how many
+# coarse candidates are rescored at full precision (0 = coarse scores only).
+# The fixture's stub embeddings hash features across all 1536 dims and aren't
+# Matryoshka-trained, so truncation loses more here than with real
+# text-embedding-3 vectors; run with --db against a real food.db for those.
+# python -m benchmarks.embedding_bench
+# python -m benchmarks.embedding_bench --db food.db --rescore 0 10 --compare benchmarks/results/embedding_<timestamp>.json
+
+VARIANTS = [
+    ("float32", 0),
+    ("float32", 512),
+    ("float32", 256),
+    ("int8", 0),
+    ("int8", 512),
+    ("int8", 256),
+]
+
+def measure(db_path, quantization, dims, rescore, iterations, queue):
+    import db.embeddings as embeddings
+    import db.search_service as search_service
+    from db.catalog import get_catalog
+    from benchmarks import search_bench
+
+    embeddings.EMBEDDING_QUANTIZATION = quantization
+    embeddings.EMBEDDING_DIMS = dims
+    search_service.EMBEDDING_RESCORE_TOP = rescore
+
+    with open(search_bench.LABELED_QUERIES_PATH) as f:
+        labeled = json.load(f)
+    search = search_bench.run(db_path, labeled, iterations, use_catalog=True)
+
+    # Embedding bytes held in the process heap; with CATALOG_STORE=1 they are
+    # mapped from the shared store instead (page cache, shared by workers)
+    catalog = get_catalog()
+    foods = max(len(catalog.embedding_rows), 1)
+    arrays = [a for a in (catalog.embedding_matrix, catalog.embedding_coarse, catalog.embedding_scales) if a is not None]
+    heap = sum(a.nbytes for a in arrays if not isinstance(a, np.memmap))
+    mapped = sum(a.nbytes for a in arrays if isinstance(a, np.memmap))
+    queue.put({
+        "bytes_per_food": round(heap / foods, 1),
+        "mb_per_100k": round(heap / foods * 100_000 / 1024 / 1024, 1),
+        "mapped_mb_per_100k": round(mapped / foods * 100_000 / 1024 / 1024, 1),
+        "rerank": search["stages"]["rerank"],
+        "accuracy": search["accuracy"],
+    })
+
+def run_variant(db_path, quantization, dims, rescore, iterations):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=measure, args=(db_path, quantization, dims, rescore, iterations, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compressed embedding memory and rerank accuracy.")
+    parser.add_argument("--db", help="Run against an existing food.db instead of the fixture.")
+    parser.add_argument("--rescore", type=int, nargs="+", default=[0, 10], help="Coarse candidates rescored at full precision.")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--output", help="Where to write the results JSON.")
+    parser.add_argument("--compare", help="Previous results JSON to compare against.")
+    args = parser.parse_args()
+
+    db_path = args.db or build_fixture_db(FIXTURE_DB_PATH)
+
+    baseline = run_variant(db_path, "float32", 0, 0, args.iterations)
+    results = {"config": {"db": db_path, "rescore": args.rescore, "iterations": args.iterations}, "baseline": baseline, "variants": {}}
+    base_at_1 = baseline["accuracy"]["at_1"]
+
+    print(f"{'variant':<14} {'rescore':>7} {'bytes/food':>10} {'MB/100k':>8} {'mapped':>7} {'rerank p50':>10} {'p95':>7} {'acc@1':>7} {'delta':>7}")
+    print(f"{'float32-full':<14} {'-':>7} {baseline['bytes_per_food']:>10} {baseline['mb_per_100k']:>8} {baseline['mapped_mb_per_100k']:>7} "
+          f"{baseline['rerank']['p50_ms']:>10.3f} {baseline['rerank']['p95_ms']:>7.3f} {base_at_1:>7.2%} {'':>7}")
+    for quantization, dims in VARIANTS:
+        if quantization == "float32" and not dims:
+            continue  # the baseline
+        name = f"{quantization}-{dims or 'full'}"
+        for rescore in args.rescore:
+            r = run_variant(db_path, quantization, dims, rescore, args.iterations)
+            r["accuracy_delta_at_1"] = round(r["accuracy"]["at_1"] - base_at_1, 4)
+            results["variants"].setdefault(name, {})[str(rescore)] = r
+            print(f"{name:<14} {rescore:>7} {r['bytes_per_food']:>10} {r['mb_per_100k']:>8} {r['mapped_mb_per_100k']:>7} "
+                  f"{r['rerank']['p50_ms']:>10.3f} {r['rerank']['p95_ms']:>7.3f} {r['accuracy']['at_1']:>7.2%} {r['accuracy_delta_at_1']:>+7.2%}")
+
+    output = save_results("embedding", results, args.output)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        print()
+        keys = [
+            f"variants.{name}.{rescore}.{metric}" for name in results["variants"] for rescore in args.rescore
+            for metric in ("mb_per_100k", "accuracy.at_1", "rerank.p95_ms")
+        ]
+        print_comparison(load_results(args.compare), results, keys)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import json
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+import uvicorn
+
+from benchmarks.stubs import stub_embedding
+
+# Local stand-in for the OpenAI API, used by the load test
+# python -m benchmarks.fake_openai --port 8100 --vision-latency-ms 2500
+# OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=sk-fake uvicorn app:app
+
+# --------------------------------------------------------------------------------
+# Canned responses
+# --------------------------------------------------------------------------------
+
+VISION_MEAL = {
+    "name": "Chicken and rice",
+    "ingredients": [
+        {"name": "Grilled chicken breast", "quantity_in_grams": 120.0},
+        {"name": "White rice", "quantity_in_grams": 150.0},
+        {"name": "Steamed broccoli", "quantity_in_grams": 80.0},
+        {"name": "Teriyaki glaze", "quantity_in_grams": 20.0}
+    ]
+}
+
+LEGACY_VISION_MEAL = {
+    "name": "Chicken and rice",
+    "ingredients": [
+        {"name": "Grilled chicken breast", "quantity": "4", "unit": "oz."},
+        {"name": "White rice", "quantity": "1", "unit": "cup(s)"},
+        {"name": "Steamed broccoli", "quantity": "1", "unit": "ser."}
+    ]
+}
+
+def canned_nutrients():
+    return {
+        "protein_in_grams": 2.5, "leucine_in_grams": 0.1, "carbohydrates_in_grams": 35.0,
+        "omega3s_in_grams": 0.0, "fat_in_grams": 0.2, "iron_in_milligrams": 0.5,
+        "zinc_in_milligrams": 0.1, "fermented_food_servings": 0.0, "fiber_in_grams": 0.3,
+        "collagen_in_grams": 0.0, "vitamin_c_in_milligrams": 0.0, "vitamin_a_in_micrograms": 0.0,
+        "vitamin_e_in_milligrams": 0.0, "selenium_in_micrograms": 0.5
+    }
+
+def canned_ingredient(name):
+    return {
+        "fdc_id": 1,
+        "description": name,
+        "amount": 1.0,
+        "selected_portion_id": 1,
+        "portions": [{"id": 1, "gram_weight": 18.0, "amount": 1.0, "modifier": "tbsp"}],
+        "nutrients": canned_nutrients()
+    }
+
+def prompt_names(prompt):
+    """Names in a custom food prompt's list of items, in order."""
+    return [m.group(2) for m in re.finditer(r"'name': (['\"])(.*?)\1", prompt)] or ["Teriyaki glaze"]
+
+# Each takes the prompt; custom foods get one ingredient per item asked for
+CANNED_STRUCTURED = {
+    "GeneratedFoods": lambda prompt: {"foods": [{"index": i, "food": canned_ingredient(name)} for i, name in enumerate(prompt_names(prompt))]},
+    "AnalysisIngredient": lambda prompt: canned_ingredient("Custom food"),
+    "IngredientResponse": lambda prompt: {
+        "protein_in_grams": 42, "collagen_in_grams": 0, "leucine_in_grams": 3,
+        "carbohydrates_in_grams": 55, "omega3s_in_grams": 0, "fat_in_grams": 12,
+        "zinc_in_milligrams": 3, "iron_in_milligrams": 2, "fermented_food_servings": 0,
+        "fiber_in_grams": 4, "vitamin_c_in_milligrams": 60, "vitamin_a_in_micrograms": 90,
+        "vitamin_e_in_milligrams": 2, "selenium_in_micrograms": 30
+    },
+}
+
+# --------------------------------------------------------------------------------
+# Server
+# --------------------------------------------------------------------------------
+
+class FakeOpenAIConfig:
+    def __init__(self, vision_latency_ms=2500.0, parse_latency_ms=1500.0, embedding_latency_ms=150.0, jitter=0.2, error_rate=0.0, parse_item_latency_ms=0.0):
+        self.vision_latency_ms = vision_latency_ms
+        self.parse_latency_ms = parse_latency_ms
+        # Extra latency per generated custom food; output tokens grow with the list
+        self.parse_item_latency_ms = parse_item_latency_ms
+        self.embedding_latency_ms = embedding_latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.vision_meal = VISION_MEAL
+        self.legacy_vision_meal = LEGACY_VISION_MEAL
+        self.counts = {"vision": 0, "parse": 0, "embeddings": 0}
+
+def create_app(config: FakeOpenAIConfig) -> FastAPI:
+    app = FastAPI()
+    app.state.config = config
+
+    async def simulate(latency_ms):
+        spread = latency_ms * config.jitter
+        await asyncio.sleep(max(0.0, latency_ms + random.uniform(-spread, spread)) / 1000)
+        return random.random() < config.error_rate
+
+    def chat_completion(model, content):
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content, "refusal": None},
+                "logprobs": None,
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 1000, "completion_tokens": 200, "total_tokens": 1200}
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        response_format = body.get("response_format") or {}
+
+        if response_format.get("type") == "json_schema":
+            config.counts["parse"] += 1
+            name = response_format["json_schema"]["name"]
+            parsed = CANNED_STRUCTURED[name](body["messages"][-1]["content"])
+            items = len(parsed["foods"]) if name == "GeneratedFoods" else 1
+            if await simulate(config.parse_latency_ms + config.parse_item_latency_ms * items):
+                return error_response()
+            content = json.dumps(parsed)
+        else:
+            config.counts["vision"] += 1
+            if await simulate(config.vision_latency_ms):
+                return error_response()
+            prompt = json.dumps(body["messages"])
+            meal = config.vision_meal if "quantity_in_grams" in prompt else config.legacy_vision_meal
+            content = "```json\n" + json.dumps(meal, indent=4) + "\n```"
+
+        return chat_completion(body.get("model", "gpt-4o"), content)
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        config.counts["embeddings"] += 1
+        if await simulate(config.embedding_latency_ms):
+            return error_response()
+        texts = [body["input"]] if isinstance(body["input"], str) else body["input"]
+        return {
+            "object": "list",
+            "model": body.get("model", "text-embedding-3-small"),
+            "data": [{"object": "embedding", "index": i, "embedding": stub_embedding(t)} for i, t in enumerate(texts)],
+            "usage": {"prompt_tokens": 8, "total_tokens": 8}
+        }
+
+    return app
+
+def error_response():
+    return JSONResponse(status_code=500, content={"error": {"message": "Injected failure", "type": "server_error"}})
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class FakeOpenAIServer:
+    """Runs the fake API on a background thread with its own event loop."""
+
+    def __init__(self, config=None, port=None):
+        self.config = config or FakeOpenAIConfig()
+        self.port = port or free_port()
+        self.server = uvicorn.Server(uvicorn.Config(create_app(self.config), host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def start(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI server with canned responses.")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--vision-latency-ms", type=float, default=2500.0)
+    parser.add_argument("--parse-latency-ms", type=float, default=1500.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=150.0)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--parse-item-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(args.vision_latency_ms, args.parse_latency_ms, args.embedding_latency_ms, args.jitter, args.error_rate, args.parse_item_latency_ms)
+    uvicorn.run(create_app(config), host="127.0.0.1", port=args.port)
@@ -0,0 +1,64 @@
+import os
+import sqlite3
+import tempfile
+from contextlib import redirect_stdout
+import io
+
+from db import database, embeddings
+from benchmarks.stubs import StubEmbeddingClient
+from openai_client import set_openai_client
+
+FIXTURE_DIR = os.path.join(tempfile.gettempdir(), "eatwell_benchmarks")
+FIXTURE_DB_PATH = os.path.join(FIXTURE_DIR, "food.db")
+
+# --------------------------------------------------------------------------------
+# Fixture food.db built from data/*.csv
+# --------------------------------------------------------------------------------
+
+def ensure_nutrient_table(db_path):
+    # sr_legacy_food_nutrient.csv is too large for the repo, so the fixture
+    # falls back to an empty table with the USDA columns. Hydration still runs
+    # the same queries, every nutrient just comes back as 0.0.
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sr_legacy_food_nutrient (
+            id INTEGER,
+            fdc_id INTEGER,
+            nutrient_id INTEGER,
+            amount REAL,
+            data_points REAL,
+            derivation_id REAL,
+            min REAL,
+            max REAL,
+            median REAL,
+            footnote TEXT,
+            min_year_acquired REAL
+        );
+    """)
+    conn.commit()
+    conn.close()
+
+def build_fixture_db(db_path=FIXTURE_DB_PATH, rebuild=False):
+    """
+    Build food.db from the CSVs in data/ with stubbed embeddings, reusing the
+    real build steps. The result is cached between runs unless rebuild=True.
+    """
+    if os.path.exists(db_path) and not rebuild:
+        return db_path
+
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+    set_openai_client(StubEmbeddingClient())
+    with redirect_stdout(io.StringIO()):
+        database.build_database(db_path, database.DATA_DIR)
+        ensure_nutrient_table(db_path)
+        conn = sqlite3.connect(db_path)
+        database.create_category_profiles(conn)
+        conn.commit()
+        conn.close()
+        embeddings.build_embeddings(db_path)
+
+    return db_path
+
+if __name__ == "__main__":
+    print(build_fixture_db(rebuild=True))
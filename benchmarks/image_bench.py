@@ -0,0 +1,164 @@
+import argparse
+import io
+import os
+import tempfile
+import time
+
+os.environ.setdefault("IMAGE_PREPROCESS", "1")
+
+from PIL import Image, ImageDraw, ImageFilter
+
+import image_pipeline
+from benchmarks.common import summarize, save_results, load_results, print_comparison
+
+# Size, latency and vision-token savings of image_pipeline.downscale on a local fixture set
+# python -m benchmarks.image_bench
+# python -m benchmarks.image_bench --images ~/meal_photos --max-dim 768 --quality 75 --uplink-mbps 5
+
+# Typical phone camera outputs plus a few already-small images
+FIXTURE_SIZES = [(4032, 3024), (3024, 4032), (4000, 3000), (1920, 1080), (1280, 960), (800, 600)]
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".heic")
+
+# --------------------------------------------------------------------------------
+# Fixture images
+# --------------------------------------------------------------------------------
+
+def make_fixture(width, height, seed):
+    """A plate-like scene with enough texture that JPEG doesn't compress it trivially."""
+    image = Image.effect_noise((width, height), 40 + seed * 5).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    cx, cy, r = width // 2, height // 2, min(width, height) // 3
+    draw.ellipse((cx - r, cy - r, cx + r, cy + r), fill=(235, 235, 230))
+    for i, color in enumerate([(180, 90, 40), (60, 140, 60), (240, 220, 180)]):
+        x = cx + int(r * 0.45 * ((i % 2) * 2 - 1)) * (1 if i < 2 else 0)
+        y = cy + int(r * 0.35 * (1 if i == 2 else -0.5))
+        draw.ellipse((x - r // 3, y - r // 4, x + r // 3, y + r // 4), fill=color)
+    image = image.filter(ImageFilter.GaussianBlur(1))
+    return Image.blend(image, Image.effect_noise((width, height), 25).convert("RGB"), 0.15)
+
+def build_fixtures(directory):
+    paths = []
+    for seed, (width, height) in enumerate(FIXTURE_SIZES):
+        path = os.path.join(directory, f"meal_{width}x{height}.jpg")
+        if not os.path.exists(path):
+            # Phone cameras save at high quality, so use q95 like they do
+            make_fixture(width, height, seed).save(path, format="JPEG", quality=95)
+        paths.append(path)
+    return paths
+
+def list_images(directory):
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+# --------------------------------------------------------------------------------
+# Benchmark
+# --------------------------------------------------------------------------------
+
+def upload_ms(num_bytes, uplink_mbps):
+    return num_bytes * 8 / (uplink_mbps * 1_000_000) * 1000
+
+def measure(path, max_dim, quality, detail, iterations, uplink_mbps):
+    with open(path, "rb") as f:
+        original = f.read()
+    width, height = Image.open(io.BytesIO(original)).size
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        processed = image_pipeline.downscale(original, max_dim, quality)
+        timings.append((time.perf_counter() - start) * 1000)
+    new_width, new_height = Image.open(io.BytesIO(processed)).size
+    data_url_bytes = len(image_pipeline.to_data_url(processed))
+
+    return {
+        "image": os.path.basename(path),
+        "original_size": [width, height],
+        "processed_size": [new_width, new_height],
+        "original_bytes": len(original),
+        "processed_bytes": len(processed),
+        "data_url_bytes": data_url_bytes,
+        "processing": summarize(timings),
+        "original_tokens": image_pipeline.estimate_vision_tokens(width, height, detail),
+        "processed_tokens": image_pipeline.estimate_vision_tokens(new_width, new_height, detail),
+        # The app uploads the original once to storage either way; what changes is
+        # what goes to OpenAI, either the original fetched by URL or the inline data URL
+        "original_upload_ms": round(upload_ms(len(original), uplink_mbps), 1),
+        "processed_upload_ms": round(upload_ms(data_url_bytes, uplink_mbps), 1),
+    }
+
+def run(paths, max_dim, quality, detail, iterations, uplink_mbps):
+    images = [measure(path, max_dim, quality, detail, iterations, uplink_mbps) for path in paths]
+    total = lambda key: sum(image[key] for image in images)
+    return {
+        "config": {
+            "max_dim": max_dim,
+            "quality": quality,
+            "detail": detail,
+            "iterations": iterations,
+            "uplink_mbps": uplink_mbps,
+        },
+        "totals": {
+            "original_bytes": total("original_bytes"),
+            "processed_bytes": total("processed_bytes"),
+            "data_url_bytes": total("data_url_bytes"),
+            "bytes_saved_pct": round(100 * (1 - total("data_url_bytes") / total("original_bytes")), 1),
+            "original_tokens": total("original_tokens"),
+            "processed_tokens": total("processed_tokens"),
+            "tokens_saved_pct": round(100 * (1 - total("processed_tokens") / total("original_tokens")), 1),
+            "mean_processing_ms": round(sum(image["processing"]["mean_ms"] for image in images) / len(images), 1),
+            "original_upload_ms": round(total("original_upload_ms"), 1),
+            "processed_upload_ms": round(total("processed_upload_ms"), 1),
+        },
+        "images": images,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image preprocessing for vision calls.")
+    parser.add_argument("--images", help="Directory of photos to use instead of the generated fixtures.")
+    parser.add_argument("--max-dim", type=int, default=image_pipeline.IMAGE_MAX_DIM)
+    parser.add_argument("--quality", type=int, default=image_pipeline.IMAGE_JPEG_QUALITY)
+    parser.add_argument("--detail", default="high", choices=["auto", "high", "low"])
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--uplink-mbps", type=float, default=10.0, help="Server uplink used to model upload time.")
+    parser.add_argument("--output", help="Where to write the results JSON.")
+    parser.add_argument("--compare", help="Previous results JSON to compare against.")
+    args = parser.parse_args()
+
+    if args.images:
+        paths = list_images(args.images)
+    else:
+        fixture_dir = os.path.join(tempfile.gettempdir(), "eatwell_benchmarks", "images")
+        os.makedirs(fixture_dir, exist_ok=True)
+        paths = build_fixtures(fixture_dir)
+    if not paths:
+        parser.error("no images found")
+
+    results = run(paths, args.max_dim, args.quality, args.detail, args.iterations, args.uplink_mbps)
+
+    print(f"{'image':<24} {'original':>14} {'processed':>12} {'KB':>14} {'tokens':>12} {'prep ms':>9}")
+    for image in results["images"]:
+        print(
+            f"{image['image']:<24} "
+            f"{'x'.join(map(str, image['original_size'])):>14} "
+            f"{'x'.join(map(str, image['processed_size'])):>12} "
+            f"{image['original_bytes'] // 1024:>6} -> {image['data_url_bytes'] // 1024:<5} "
+            f"{image['original_tokens']:>5} -> {image['processed_tokens']:<4} "
+            f"{image['processing']['mean_ms']:>9.1f}"
+        )
+    totals = results["totals"]
+    print(f"bytes sent: -{totals['bytes_saved_pct']}%, vision tokens: -{totals['tokens_saved_pct']}%")
+    print(f"modeled upload at {args.uplink_mbps} Mbps: {totals['original_upload_ms']}ms -> {totals['processed_upload_ms']}ms "
+          f"(+{totals['mean_processing_ms']}ms mean processing per image)")
+
+    output = save_results("image", results, args.output)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        print()
+        keys = [f"totals.{key}" for key in ("data_url_bytes", "processed_tokens", "mean_processing_ms", "processed_upload_ms")]
+        print_comparison(load_results(args.compare), results, keys)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from benchmarks.common import percentile, save_results, load_results, print_comparison
+
+# Cold-start import cost of the serving entry point, from `python -X importtime`
+# python -m benchmarks.import_time
+# python -m benchmarks.import_time --module app --runs 5 --compare benchmarks/results/import_<timestamp>.json
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+WATCHED_PACKAGES = ("numpy", "rapidfuzz", "openai", "httpx", "pandas", "fastapi", "pydantic", "starlette", "dotenv")
+
+def measure(module):
+    """One fresh interpreter importing `module`; returns {name: (self_us, cumulative_us)}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, capture_output=True, text=True,
+        env={**os.environ, "WARMUP_ENABLED": "0"},
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us))
+    return modules
+
+def run(module, runs, top):
+    totals = []
+    self_times = defaultdict(list)
+    for _ in range(runs):
+        modules = measure(module)
+        totals.append(modules[module][1] / 1000)
+        for name, (self_us, _) in modules.items():
+            self_times[name].append(self_us / 1000)
+
+    median_self = {name: percentile(times, 50) for name, times in self_times.items()}
+    packages = defaultdict(float)
+    for name, ms in median_self.items():
+        packages[name.split(".")[0]] += ms
+
+    return {
+        "module": module,
+        "runs": runs,
+        "total_ms": round(percentile(totals, 50), 1),
+        "min_total_ms": round(min(totals), 1),
+        "modules_imported": len(median_self),
+        "packages": {pkg: round(packages.get(pkg, 0.0), 1) for pkg in WATCHED_PACKAGES},
+        "top_modules": [
+            {"module": name, "self_ms": round(ms, 2)}
+            for name, ms in sorted(median_self.items(), key=lambda x: x[1], reverse=True)[:top]
+        ],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import-time cost of the serving entry point.")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", help="Where to write the results JSON.")
+    parser.add_argument("--compare", help="Previous results JSON to compare against.")
+    args = parser.parse_args()
+
+    results = run(args.module, args.runs, args.top)
+    print(f"import {results['module']}: {results['total_ms']}ms median over {results['runs']} runs ({results['modules_imported']} modules)")
+    print("by package (self time, ms):")
+    for pkg, ms in results["packages"].items():
+        print(f"  {pkg:<12} {ms:>8.1f}{'  (not imported)' if ms == 0 else ''}")
+    print("slowest modules (self time, ms):")
+    for m in results["top_modules"]:
+        print(f"  {m['module']:<50} {m['self_ms']:>8.2f}")
+
+    output = save_results("import", results, args.output)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        print()
+        keys = ["total_ms"] + [f"packages.{pkg}" for pkg in WATCHED_PACKAGES]
+        print_comparison(load_results(args.compare), results, keys)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import os
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks.fixtures import build_fixture_db, FIXTURE_DB_PATH
+from benchmarks.fake_openai import FakeOpenAIServer, FakeOpenAIConfig
+from benchmarks.common import summarize, save_results
+
+# End-to-end load test of the FastAPI app against the fake OpenAI server
+# python -m benchmarks.load_test --rps 5 --duration 20
+# python -m benchmarks.load_test --endpoints meal-updated --rps 20 --vision-latency-ms 800
+
+SCENARIOS = {
+    "meal-updated": lambda client: client.post("/meal-updated", json={"image_url": "https://example.com/meal.jpg"}),
+    "custom-food": lambda client: client.post("/custom-food", params={"name": "Teriyaki glaze", "amount": 1.0, "modifier": "tbsp"}),
+    "ingredients": lambda client: client.post("/ingredients", json={"ingredients": [
+        {"name": "Grilled chicken breast", "quantity": "4", "unit": "oz."},
+        {"name": "White rice", "quantity": "1", "unit": "cup(s)"},
+    ]}),
+    "search-foods": lambda client: client.post("/search-foods", params={"term": "chicken breast"}),
+    "food": lambda client: client.get("/food/171534"),
+}
+
+# --------------------------------------------------------------------------------
+# Event loop blocking monitor
+# --------------------------------------------------------------------------------
+
+class LoopMonitor:
+    """
+    Sleeps for a fixed interval and measures how late it wakes up. Anything
+    running synchronously on the event loop (blocking OpenAI calls, SQLite,
+    rapidfuzz) shows up as lag.
+    """
+
+    def __init__(self, interval=0.005, threshold=0.002):
+        self.interval = interval
+        self.threshold = threshold
+        self.blocked = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - start - self.interval
+            if lag > self.threshold:
+                self.blocked += lag
+                self.stalls += 1
+                self.max_lag = max(self.max_lag, lag)
+
+# --------------------------------------------------------------------------------
+# Load generator
+# --------------------------------------------------------------------------------
+
+async def drive(app, endpoint, rps, duration, timeout):
+    """Open-loop load: requests are fired on schedule regardless of how slow earlier ones are."""
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    statuses = Counter()
+    errors = Counter()
+
+    async def one(client):
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(SCENARIOS[endpoint](client), timeout)
+            statuses[response.status_code] += 1
+            # The legacy endpoints report failures as 200 {"error": ...}
+            if response.status_code >= 400 or '"error"' in response.text[:20]:
+                errors[f"http_{response.status_code}"] += 1
+        except asyncio.TimeoutError:
+            errors["timeout"] += 1
+        except Exception as e:
+            errors[type(e).__name__] += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    monitor = LoopMonitor()
+    async with httpx.AsyncClient(transport=transport, base_url="http://app") as client:
+        monitor_task = asyncio.create_task(monitor.run())
+        tasks = []
+        total = max(1, int(rps * duration))
+        started = time.perf_counter()
+        for i in range(total):
+            delay = started + i / rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(client)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        monitor_task.cancel()
+
+    return {
+        "target_rps": rps,
+        "achieved_rps": round(total / elapsed, 2),
+        "requests": total,
+        "latency": summarize(latencies),
+        "error_rate": round(sum(errors.values()) / total, 4),
+        "errors": dict(errors),
+        "status_codes": {str(k): v for k, v in statuses.items()},
+        "event_loop": {
+            "blocked_ms": round(monitor.blocked * 1000, 1),
+            "blocked_fraction": round(monitor.blocked / elapsed, 4),
+            "max_lag_ms": round(monitor.max_lag * 1000, 1),
+            "stalls": monitor.stalls,
+        },
+    }
+
+def print_report(endpoint, r):
+    lat = r["latency"]
+    loop = r["event_loop"]
+    print(f"/{endpoint}: {r['requests']} requests @ {r['achieved_rps']}/{r['target_rps']} rps")
+    print(f"  latency  p50 {lat['p50_ms']:.0f}ms  p95 {lat['p95_ms']:.0f}ms  p99 {lat['p99_ms']:.0f}ms  max {lat['max_ms']:.0f}ms")
+    print(f"  errors   {r['error_rate']:.2%} {r['errors'] or ''}")
+    print(f"  loop     blocked {loop['blocked_ms']:.0f}ms ({loop['blocked_fraction']:.1%}), max lag {loop['max_lag_ms']:.0f}ms over {loop['stalls']} stalls")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API against a fake OpenAI server.")
+    parser.add_argument("--endpoints", default="meal-updated,custom-food,ingredients", help=f"Comma separated, from: {', '.join(SCENARIOS)}")
+    parser.add_argument("--rps", type=float, default=5.0)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per endpoint.")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--vision-latency-ms", type=float, default=2500.0)
+    parser.add_argument("--parse-latency-ms", type=float, default=1500.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=150.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--db", help="Run against an existing food.db instead of the fixture.")
+    parser.add_argument("--cold", action="store_true", help="Skip the startup warmup (the ASGI transport doesn't run lifespan).")
+    parser.add_argument("--output", help="Where to write the results JSON.")
+    args = parser.parse_args()
+
+    config = FakeOpenAIConfig(args.vision_latency_ms, args.parse_latency_ms, args.embedding_latency_ms, error_rate=args.error_rate)
+    fake = FakeOpenAIServer(config).start()
+
+    # The app and its OpenAI clients read these at import time
+    os.environ["DB_PATH"] = args.db or build_fixture_db(FIXTURE_DB_PATH)
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ["OPENAI_API_KEY"] = "sk-fake"
+    import app as app_module
+    if not args.cold:
+        from warmup import run_warmup
+        run_warmup(os.environ["DB_PATH"])
+
+    results = {"config": vars(args), "endpoints": {}}
+    try:
+        for endpoint in args.endpoints.split(","):
+            endpoint = endpoint.strip()
+            before = dict(config.counts)
+            r = asyncio.run(drive(app_module.app, endpoint, args.rps, args.duration, args.timeout))
+            r["upstream_calls"] = {k: config.counts[k] - before[k] for k in config.counts}
+            results["endpoints"][endpoint] = r
+            print_report(endpoint, r)
+    finally:
+        fake.stop()
+
+    output = save_results("load", results, args.output)
+    print(f"Saved results to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import argparse
+import multiprocessing
+import sqlite3
+
+from benchmarks.fixtures import build_fixture_db, FIXTURE_DB_PATH
+from benchmarks.common import save_results, load_results, print_comparison
+
+# Per-worker memory of the food catalog with N worker processes, built in each
+# process (CATALOG_STORE=0) vs mapped from the shared store (CATALOG_STORE=1).
+# Workers are spawned fresh like uvicorn/gunicorn workers, load the catalog,
+# hydrate every food and pull every embedding row, then all report
+# /proc/self/smaps_rollup at the same moment. PSS splits shared pages between
+# the processes mapping them, so total PSS is what the workers really cost.
+# python -m benchmarks.memory_bench
+# python -m benchmarks.memory_bench --workers 1 2 4 8 --db food.db --compare benchmarks/results/memory_<timestamp>.json
+
+MODES = {"dict": False, "store": True}
+
+def smaps_mb():
+    """RSS, PSS and private (USS) memory of this process in MB (Linux)."""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": round(values["Rss"], 1),
+        "pss_mb": round(values["Pss"], 1),
+        "uss_mb": round(values["Private_Clean"] + values["Private_Dirty"], 1),
+    }
+
+def worker(db_path, shared, barrier, queue):
+    from db.catalog import FoodCatalog, set_catalog
+    from helper import get_food, get_nutrients, get_portions, get_portion_units
+    from db.search_service import fuzzy_search
+
+    before = smaps_mb()
+    catalog = FoodCatalog(db_path, shared=shared).load()
+    set_catalog(catalog)
+
+    # Touch everything a long-running worker eventually would
+    conn = sqlite3.connect(db_path)
+    for fdc_id in list(catalog.foods):
+        get_food(conn, fdc_id)
+        get_nutrients(conn, fdc_id)
+        get_portions(conn, fdc_id)
+        get_portion_units(conn, fdc_id)
+    if catalog.embedding_matrix is not None:
+        catalog.get_embeddings(list(catalog.embedding_rows))
+    for term in ("chicken breast", "white rice", "broccoli"):
+        fuzzy_search(term, conn)
+    conn.close()
+
+    barrier.wait()  # all workers alive and loaded
+    after = smaps_mb()
+    queue.put({
+        "before": before,
+        "after": after,
+        "catalog_rss_mb": round(after["rss_mb"] - before["rss_mb"], 1),
+        "catalog_uss_mb": round(after["uss_mb"] - before["uss_mb"], 1),
+        "load_ms": catalog.timings,
+    })
+    barrier.wait()  # keep the mappings until everyone has measured
+
+def run(db_path, shared, num_workers):
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(num_workers)
+    queue = context.Queue()
+    processes = [context.Process(target=worker, args=(db_path, shared, barrier, queue)) for _ in range(num_workers)]
+    for process in processes:
+        process.start()
+    workers = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    def mean(key, section="after"):
+        values = [w[section][key] if section else w[key] for w in workers]
+        return round(sum(values) / len(values), 1)
+
+    return {
+        "workers": num_workers,
+        "rss_mb": mean("rss_mb"),
+        "pss_mb": mean("pss_mb"),
+        "uss_mb": mean("uss_mb"),
+        "catalog_rss_mb": mean("catalog_rss_mb", None),
+        "catalog_uss_mb": mean("catalog_uss_mb", None),
+        "total_pss_mb": round(sum(w["after"]["pss_mb"] for w in workers), 1),
+        "load_ms": workers[0]["load_ms"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-worker catalog memory, per-process dicts vs the shared store.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--db", help="Run against an existing food.db instead of the fixture.")
+    parser.add_argument("--output", help="Where to write the results JSON.")
+    parser.add_argument("--compare", help="Previous results JSON to compare against.")
+    args = parser.parse_args()
+
+    db_path = args.db or build_fixture_db(FIXTURE_DB_PATH)
+    # Build the store up front so the workers measure attaching, not building
+    from db.catalog import CATALOG_DATASETS
+    from db.catalog_store import ensure_store
+    ensure_store(db_path, CATALOG_DATASETS)
+
+    results = {"config": {"db": db_path, "workers": args.workers}, "modes": {}}
+    print(f"{'mode':<6} {'workers':>7} {'rss':>8} {'pss':>8} {'uss':>8} {'catalog rss':>12} {'catalog uss':>12} {'total pss':>10}")
+    for mode, shared in MODES.items():
+        results["modes"][mode] = {}
+        for num_workers in args.workers:
+            r = run(db_path, shared, num_workers)
+            results["modes"][mode][str(num_workers)] = r
+            print(
+                f"{mode:<6} {num_workers:>7} {r['rss_mb']:>8} {r['pss_mb']:>8} {r['uss_mb']:>8} "
+                f"{r['catalog_rss_mb']:>12} {r['catalog_uss_mb']:>12} {r['total_pss_mb']:>10}"
+            )
+
+    print()
+    results["saved_mb"] = {}
+    for num_workers in args.workers:
+        saved = round(results["modes"]["dict"][str(num_workers)]["total_pss_mb"] - results["modes"]["store"][str(num_workers)]["total_pss_mb"], 1)
+        results["saved_mb"][str(num_workers)] = saved
+        print(f"{num_workers} workers: shared store saves {saved} MB PSS in total")
+
+    output = save_results("memory", results, args.output)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        print()
+        keys = [
+            f"modes.{mode}.{n}.{metric}" for mode in MODES for n in args.workers
+            for metric in ("uss_mb", "catalog_uss_mb", "total_pss_mb")
+        ]
+        print_comparison(load_results(args.compare), results, keys)
+
+if __name__ == "__main__":
+    main()
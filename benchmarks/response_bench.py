@@ -0,0 +1,153 @@
+import argparse
+import gzip
+import json
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from models.meal_analysis import AnalysisIngredient, AnalysisMeal, AllNutrients, FoodPortion
+from responses import parse_fields
+from benchmarks.common import summarize, save_results, load_results, print_comparison
+
+# Payload size and encode time of /meal-updated responses, by encoder and projection
+# python -m benchmarks.response_bench
+# python -m benchmarks.response_bench --ingredients 5 20 50 --iterations 200 --compare benchmarks/results/response_<timestamp>.json
+
+PROJECTIONS = {
+    "full": None,
+    "no_portions": "-ingredients_new.portions",
+    "totals": "totals",
+}
+
+# --------------------------------------------------------------------------------
+# Fixture meals
+# --------------------------------------------------------------------------------
+
+def make_ingredient(rng, fdc_id, num_portions):
+    nutrients = {name: rng.uniform(0, 50) for name in AllNutrients.model_fields}
+    portions = [
+        FoodPortion(id=fdc_id * 100 + i, gram_weight=rng.uniform(5, 250), amount=1.0, modifier=rng.choice(["cup", "oz", "slice", "tbsp, chopped", "serving (3 oz)"]))
+        for i in range(num_portions)
+    ]
+    return AnalysisIngredient(
+        fdc_id=fdc_id,
+        description=f"Food {fdc_id}, cooked, with a typical SR Legacy description",
+        amount=rng.uniform(0.2, 3),
+        selected_portion_id=portions[0].id,
+        portions=portions,
+        nutrients=AllNutrients(**nutrients),
+    )
+
+def make_meal(num_ingredients, num_portions, seed=0):
+    rng = random.Random(seed)
+    ingredients = [make_ingredient(rng, 100000 + i, num_portions) for i in range(num_ingredients)]
+    totals = {name: rng.uniform(0, 200) for name in AnalysisMeal.model_fields if name.endswith("_float")}
+    return AnalysisMeal(name="Benchmark meal", ingredients_new=ingredients, **totals)
+
+# --------------------------------------------------------------------------------
+# Encoders
+# --------------------------------------------------------------------------------
+
+def encode_default(meal, include, exclude):
+    # What FastAPI did for a returned model: jsonable_encoder then json.dumps (JSONResponse)
+    content = jsonable_encoder(meal, include=include, exclude=exclude)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode()
+
+def encode_orjson(meal, include, exclude):
+    import orjson
+    return orjson.dumps(meal.model_dump(include=include, exclude=exclude))
+
+def encode_pydantic(meal, include, exclude):
+    return meal.model_dump_json(include=include, exclude=exclude).encode()
+
+ENCODERS = {
+    "default": encode_default,
+    "orjson": encode_orjson,
+    "model_dump_json": encode_pydantic,
+}
+
+def compressors(level):
+    found = {"gzip": lambda body: gzip.compress(body, compresslevel=level)}
+    try:
+        import brotli
+        found["br"] = lambda body: brotli.compress(body, quality=4)
+    except ImportError:
+        pass
+    return found
+
+def time_ms(fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, timings
+
+def run(ingredient_counts, num_portions, iterations, level):
+    rows = []
+    for num_ingredients in ingredient_counts:
+        meal = make_meal(num_ingredients, num_portions)
+        for projection, fields in PROJECTIONS.items():
+            include, exclude = parse_fields(AnalysisMeal, fields)
+            for encoder, encode in ENCODERS.items():
+                body, timings = time_ms(lambda: encode(meal, include, exclude), iterations)
+                row = {
+                    "ingredients": num_ingredients,
+                    "projection": projection,
+                    "encoder": encoder,
+                    "bytes": len(body),
+                    "encode": summarize(timings),
+                }
+                for name, compress in compressors(level).items():
+                    compressed, timings = time_ms(lambda: compress(body), max(1, iterations // 10))
+                    row[f"{name}_bytes"] = len(compressed)
+                    row[f"{name}_ms"] = round(sum(timings) / len(timings), 3)
+                rows.append(row)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark meal response encoding, projection and compression.")
+    parser.add_argument("--ingredients", type=int, nargs="+", default=[5, 20, 50])
+    parser.add_argument("--portions", type=int, default=8, help="Portions per ingredient.")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--level", type=int, default=6, help="gzip compression level.")
+    parser.add_argument("--output", help="Where to write the results JSON.")
+    parser.add_argument("--compare", help="Previous results JSON to compare against.")
+    args = parser.parse_args()
+
+    rows = run(args.ingredients, args.portions, args.iterations, args.level)
+
+    print(f"{'ingredients':>11} {'projection':<12} {'encoder':<16} {'bytes':>8} {'gzip':>7} {'br':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for row in rows:
+        print(
+            f"{row['ingredients']:>11} {row['projection']:<12} {row['encoder']:<16} {row['bytes']:>8} "
+            f"{row.get('gzip_bytes', '-'):>7} {row.get('br_bytes', '-'):>7} "
+            f"{row['encode']['p50_ms']:>8.3f} {row['encode']['p95_ms']:>8.3f}"
+        )
+
+    results = {
+        "config": {"ingredients": args.ingredients, "portions": args.portions, "iterations": args.iterations, "level": args.level},
+        # Keyed for --compare, e.g. "50.full.model_dump_json.encode.p50_ms"
+        "encodings": {
+            str(n): {
+                projection: {row["encoder"]: row for row in rows if row["ingredients"] == n and row["projection"] == projection}
+                for projection in PROJECTIONS
+            }
+            for n in args.ingredients
+        },
+    }
+    output = save_results("response", results, args.output)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        print()
+        keys = [
+            f"encodings.{n}.{projection}.{encoder}.{metric}"
+            for n in args.ingredients for projection in PROJECTIONS for encoder in ENCODERS
+            for metric in ("encode.p50_ms", "bytes")
+        ]
+        print_comparison(load_results(args.compare), results, keys)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from benchmarks.fixtures import build_fixture_db
+from benchmarks.common import summarize, save_results, load_results, print_comparison
+
+# Search latency and memory as food.db grows past SR Legacy. Synthetic branded
+# foods (FDC CSV format) are ingested with db.datasets into a copy of the
+# fixture DB, then the labeled queries run against SR Legacy + branded_food.
+# Each size runs in its own process so memory numbers don't carry over.
+# python -m benchmarks.scale_bench
+# python -m benchmarks.scale_bench --sizes 10000 100000 500000 --iterations 3 --compare benchmarks/results/scale_<timestamp>.json
+
+BRANDS = ["Kirkland", "Great Value", "Trader Joe's", "365", "Kroger", "Market Pantry", "Signature Select", "Good & Gather", "Simple Truth", "Private Selection"]
+VARIANTS = ["original", "family size", "organic", "low sodium", "reduced fat", "value pack", "snack size", "lightly salted", "gluten free", "spicy"]
+SEARCH_STAGES = ["candidates", "exact_prefix", "fts", "trigram", "fuzzy", "rerank", "total"]
+
+# --------------------------------------------------------------------------------
+# Synthetic FDC download
+# --------------------------------------------------------------------------------
+
+def write_fdc_csvs(directory, size, nutrients_per_food, seed=0):
+    """food.csv, food_nutrient.csv and branded_food.csv with `size` branded foods named after SR Legacy foods."""
+    from db.catalog import TRACKED_NUTRIENT_NUMBERS
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(build_fixture_db())
+    base = [row[0] for row in conn.execute("SELECT description FROM sr_legacy_food WHERE data_type = 'sr_legacy_food'")]
+    nutrient_ids = [row[0] for row in conn.execute(
+        f"SELECT id FROM sr_legacy_nutrient WHERE CAST(nutrient_nbr AS INTEGER) IN ({','.join('?' * len(TRACKED_NUTRIENT_NUMBERS))})",
+        TRACKED_NUTRIENT_NUMBERS
+    )]
+    conn.close()
+
+    os.makedirs(directory, exist_ok=True)
+    first_id = 10_000_000
+    with open(os.path.join(directory, "food.csv"), "w", newline="") as foods, \
+         open(os.path.join(directory, "food_nutrient.csv"), "w", newline="") as nutrients, \
+         open(os.path.join(directory, "branded_food.csv"), "w", newline="") as branded:
+        foods, nutrients, branded = csv.writer(foods), csv.writer(nutrients), csv.writer(branded)
+        foods.writerow(["fdc_id", "data_type", "description", "food_category_id", "publication_date"])
+        nutrients.writerow(["id", "fdc_id", "nutrient_id", "amount"])
+        branded.writerow(["fdc_id", "serving_size", "serving_size_unit", "household_serving_fulltext"])
+        nutrient_row = 0
+        for i in range(size):
+            fdc_id = first_id + i
+            description = f"{rng.choice(BRANDS)} {rng.choice(base)}, {rng.choice(VARIANTS)}".upper()
+            foods.writerow([fdc_id, "branded_food", description, "", "2024-04-01"])
+            branded.writerow([fdc_id, rng.choice([28, 30, 85, 113, 240]), "g", "1 serving"])
+            for nutrient_id in rng.sample(nutrient_ids, min(nutrients_per_food, len(nutrient_ids))):
+                nutrient_row += 1
+                nutrients.writerow([nutrient_row, fdc_id, nutrient_id, round(rng.uniform(0, 30), 2)])
+
+# --------------------------------------------------------------------------------
+# Measurements (run in a child process per size)
+# --------------------------------------------------------------------------------
+
+def memory_mb():
+    """Current and peak RSS of this process, from /proc (Linux)."""
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("VmRSS:", "VmHWM:")):
+                name, kb = line.split()[:2]
+                values[name.rstrip(":")] = round(int(kb) / 1024, 1)
+    return {"rss_mb": values.get("VmRSS"), "peak_rss_mb": values.get("VmHWM")}
+
+def measure(size, nutrients_per_food, iterations, work_dir, queue):
+    from db import database
+    from db.datasets import ingest_datasets
+    import db.search_service as search_service
+    from db.catalog import FoodCatalog
+    from benchmarks import search_bench
+
+    search_service.SEARCH_DATASETS = ["sr_legacy_food", "branded_food"]
+    fdc_dir = os.path.join(work_dir, f"fdc_{size}")
+    db_path = os.path.join(work_dir, f"food_{size}.db")
+    write_fdc_csvs(fdc_dir, size, nutrients_per_food)
+    shutil.copy(build_fixture_db(), db_path)
+
+    result = {"size": size}
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    ingest_datasets(conn, fdc_dir, ["branded_food"])
+    database.create_lookup_indexes(conn)
+    conn.commit()
+    conn.close()
+    result["ingest_s"] = round(time.perf_counter() - start, 1)
+    result["ingest_memory"] = memory_mb()
+    result["db_mb"] = round(os.path.getsize(db_path) / 1024 / 1024, 1)
+    shutil.rmtree(fdc_dir)
+
+    before = memory_mb()["rss_mb"]
+    start = time.perf_counter()
+    FoodCatalog(db_path).load()
+    result["catalog_load_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    result["catalog_rss_mb"] = round(memory_mb()["rss_mb"] - before, 1)
+
+    with open(search_bench.LABELED_QUERIES_PATH) as f:
+        labeled = json.load(f)
+    search = search_bench.run(db_path, labeled, iterations, use_catalog=True)
+    result["stages"] = {stage: search["stages"][stage] for stage in SEARCH_STAGES}
+    result["accuracy"] = search["accuracy"]
+
+    # Candidate retrieval that always reaches the branded partition (no exact/prefix shortcut)
+    timings = []
+    conn = sqlite3.connect(db_path)
+    for _ in range(iterations):
+        for item in labeled:
+            start = time.perf_counter()
+            search_service.text_search(item["name"], conn, limit=20)
+            timings.append((time.perf_counter() - start) * 1000)
+    conn.close()
+    result["text_search"] = summarize(timings)
+    result["memory"] = memory_mb()
+
+    os.remove(db_path)
+    queue.put(result)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search latency and memory at increasing food counts.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 500_000], help="Branded foods added on top of SR Legacy.")
+    parser.add_argument("--nutrients-per-food", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--output", help="Where to write the results JSON.")
+    parser.add_argument("--compare", help="Previous results JSON to compare against.")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="eatwell_scale_")
+    sizes = []
+    try:
+        for size in args.sizes:
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=measure, args=(size, args.nutrients_per_food, args.iterations, work_dir, queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            sizes.append(result)
+
+            stages = result["stages"]
+            print(
+                f"{size:>8} foods: ingest {result['ingest_s']}s (peak {result['ingest_memory']['peak_rss_mb']} MB), "
+                f"db {result['db_mb']} MB, catalog {result['catalog_load_ms']}ms / {result['catalog_rss_mb']} MB"
+            )
+            print(
+                f"          search p50 {stages['total']['p50_ms']:.2f}ms p95 {stages['total']['p95_ms']:.2f}ms, "
+                f"candidates p95 {stages['candidates']['p95_ms']:.2f}ms, fts p95 {stages['fts']['p95_ms']:.2f}ms, "
+                f"text_search p95 {result['text_search']['p95_ms']:.2f}ms, accuracy@1 {result['accuracy']['at_1']:.2%}, "
+                f"rss {result['memory']['rss_mb']} MB"
+            )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        "config": {"nutrients_per_food": args.nutrients_per_food, "iterations": args.iterations},
+        "sizes": {str(result["size"]): result for result in sizes},
+    }
+    output = save_results("scale", results, args.output)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        print()
+        keys = [
+            f"sizes.{size}.{key}" for size in args.sizes
+            for key in ("stages.total.p95_ms", "stages.candidates.p95_ms", "text_search.p95_ms", "catalog_rss_mb", "memory.rss_mb")
+        ]
+        print_comparison(load_results(args.compare), results, keys)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import argparse
+import io
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import redirect_stdout
+
+from benchmarks.fixtures import build_fixture_db, FIXTURE_DB_PATH
+from benchmarks.stubs import StubEmbeddingClient
+from benchmarks.common import summarize, save_results, load_results, print_comparison
+import db.search_service as search_service
+import query
+from models.meal_analysis import AnalysisIngredient
+from db.catalog import FoodCatalog, set_catalog
+from db.snapshots import snapshots
+from openai_client import set_openai_client
+
+# Search quality + latency benchmark for query.search_food
+# python -m benchmarks.search_bench
+# python -m benchmarks.search_bench --catalog --iterations 5 --compare benchmarks/results/search_<timestamp>.json
+
+LABELED_QUERIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "labeled_queries.json")
+STAGES = ["candidates", "exact_prefix", "fts", "trigram", "fuzzy", "embedding", "rerank", "hydration", "total"]
+
+# --------------------------------------------------------------------------------
+# Stage timers
+# --------------------------------------------------------------------------------
+
+class StageTimer:
+    """Wraps the search pipeline functions and records how long each call takes."""
+
+    def __init__(self):
+        self.current = defaultdict(float)
+        self.last_ranked = []
+
+    def wrap(self, stage, fn, capture=False):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                self.current[stage] += (time.perf_counter() - start) * 1000
+            if capture:
+                self.last_ranked = result
+            return result
+        return timed
+
+    def reset(self):
+        self.current = defaultdict(float)
+        self.last_ranked = []
+
+def install_timers(timer, embedding_client):
+    set_openai_client(embedding_client)
+    embedding_client.embeddings.create = timer.wrap("embedding", embedding_client.embeddings.create)
+    search_service.fts_search = timer.wrap("fts", search_service.fts_search)
+    search_service.trigram_search = timer.wrap("trigram", search_service.trigram_search)
+    search_service.fuzzy_search = timer.wrap("fuzzy", search_service.fuzzy_search)
+    query.get_candidates = timer.wrap("candidates", query.get_candidates)
+    query.rerank_with_embeddings = timer.wrap("rerank", query.rerank_with_embeddings, capture=True)
+
+# --------------------------------------------------------------------------------
+# Benchmark
+# --------------------------------------------------------------------------------
+
+def run(db_path, labeled, iterations, use_catalog=False):
+    snapshots.db_path = db_path
+    set_catalog(FoodCatalog(db_path).load() if use_catalog else None)
+    timer = StageTimer()
+    install_timers(timer, StubEmbeddingClient())
+
+    stage_samples = defaultdict(list)
+    hits_at_1 = 0
+    hits_at_5 = 0
+    invalid = 0
+    misses = []
+
+    wall_start = time.perf_counter()
+    for iteration in range(iterations):
+        for item in labeled:
+            timer.reset()
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                result = query.search_food(item["name"], 100.0)
+            total = (time.perf_counter() - start) * 1000
+
+            stages = timer.current
+            stages["total"] = total
+            stages["exact_prefix"] = stages["candidates"] - stages["fts"] - stages["trigram"] - stages["fuzzy"]
+            stages["hydration"] = total - stages["candidates"] - stages["rerank"]
+            for stage in STAGES:
+                stage_samples[stage].append(stages[stage])
+
+            if iteration > 0:
+                continue
+
+            # Accuracy is deterministic, so it is only scored on the first pass
+            expected = set(item["expected"])
+            ranked_ids = [c["fdc_id"] for c in timer.last_ranked or []]
+            top_id = result.fdc_id if isinstance(result, AnalysisIngredient) else None
+
+            if top_id in expected:
+                hits_at_1 += 1
+            else:
+                misses.append({
+                    "name": item["name"],
+                    "expected": item["expected"],
+                    "got": top_id,
+                    "top_5": [{"fdc_id": c["fdc_id"], "description": c["description"], "similarity": round(float(c["similarity"]), 4)} for c in timer.last_ranked or []],
+                })
+            if expected.intersection(ranked_ids):
+                hits_at_5 += 1
+            if not isinstance(result, AnalysisIngredient):
+                invalid += 1
+    wall = time.perf_counter() - wall_start
+
+    n = len(labeled)
+    return {
+        "db_path": db_path,
+        "iterations": iterations,
+        "catalog": use_catalog,
+        "queries": n,
+        "stages": {stage: summarize(stage_samples[stage]) for stage in STAGES},
+        "throughput_qps": round((n * iterations) / wall, 2),
+        "accuracy": {
+            "at_1": round(hits_at_1 / n, 4),
+            "at_5": round(hits_at_5 / n, 4),
+            "below_threshold": round(invalid / n, 4),
+        },
+        "misses": misses,
+    }
+
+def print_report(results):
+    print(f"{results['queries']} queries x {results['iterations']} iterations against {results['db_path']}")
+    print(f"{'stage':<14} {'mean':>9} {'p50':>9} {'p95':>9} {'max':>9}  (ms)")
+    for stage, s in results["stages"].items():
+        print(f"{stage:<14} {s['mean_ms']:>9.3f} {s['p50_ms']:>9.3f} {s['p95_ms']:>9.3f} {s['max_ms']:>9.3f}")
+    print(f"throughput: {results['throughput_qps']} queries/s")
+    acc = results["accuracy"]
+    print(f"accuracy@1: {acc['at_1']:.2%}  accuracy@5: {acc['at_5']:.2%}  below threshold: {acc['below_threshold']:.2%}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark query.search_food latency and accuracy.")
+    parser.add_argument("--db", help="Run against an existing food.db instead of the fixture.")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the fixture food.db from data/*.csv.")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--catalog", action="store_true", help="Preload the in-memory catalog like the startup warmup does.")
+    parser.add_argument("--queries", default=LABELED_QUERIES_PATH, help="Labeled queries JSON file.")
+    parser.add_argument("--output", help="Where to write the results JSON.")
+    parser.add_argument("--compare", help="Previous results JSON to compare against.")
+    args = parser.parse_args()
+
+    db_path = args.db or build_fixture_db(FIXTURE_DB_PATH, rebuild=args.rebuild)
+    with open(args.queries) as f:
+        labeled = json.load(f)
+
+    results = run(db_path, labeled, args.iterations, args.catalog)
+    print_report(results)
+    output = save_results("search", results, args.output)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        print()
+        keys = [f"stages.{stage}.p50_ms" for stage in STAGES] + ["throughput_qps", "accuracy.at_1", "accuracy.at_5"]
+        print_comparison(load_results(args.compare), results, keys)
+
+if __name__ == "__main__":
+    main()
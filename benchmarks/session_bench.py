@@ -0,0 +1,106 @@
+import argparse
+import json
+import random
+import time
+
+from benchmarks.common import summarize, save_results, load_results, print_comparison
+
+# Cost of one ingredient edit: re-sending the whole meal and recomputing every
+# calculate_* total (what clients did before meal sessions) vs a delta applied
+# to a meal session (meal_sessions.py). Both sides include parsing the request
+# body, so the full path pays for validating every ingredient again.
+# python -m benchmarks.session_bench
+# python -m benchmarks.session_bench --sizes 5 50 500 --compare benchmarks/results/session_<timestamp>.json
+
+def make_ingredient(i):
+    from models.meal_analysis import AllNutrients
+    return {
+        "fdc_id": 100000 + i,
+        "description": f"Food {i}",
+        "amount": 1.0,
+        "selected_portion_id": 1,
+        "portions": [
+            {"id": 1, "gram_weight": 100.0, "amount": 1.0, "modifier": "serving"},
+            {"id": 2, "gram_weight": 28.35, "amount": 1.0, "modifier": "oz"},
+            {"id": 3, "gram_weight": 240.0, "amount": 1.0, "modifier": "cup"},
+        ],
+        "nutrients": {field: round(random.uniform(0, 20), 2) for field in AllNutrients.model_fields},
+    }
+
+def run(size, edits):
+    from models.meal_analysis import AnalysisMeal, AnalysisIngredient
+    from app import build_meal, MealEditRequest
+    from meal_sessions import meal_sessions
+
+    ingredients = [make_ingredient(i) for i in range(size)]
+    meal = build_meal("Benchmark meal", [AnalysisIngredient(**i) for i in ingredients])
+    session = meal_sessions.create(meal)
+
+    full_ms, delta_ms = [], []
+    full_bytes = delta_bytes = 0
+    for _ in range(edits):
+        index = random.randrange(size)
+        amount = round(random.uniform(0.25, 4), 2)
+        portion_id = random.choice((1, 2, 3))
+
+        # Full: the client edits its copy and posts the whole meal back
+        ingredients[index]["amount"] = amount
+        ingredients[index]["selected_portion_id"] = portion_id
+        body = json.dumps({"name": "Benchmark meal", "ingredients_new": ingredients})
+        start = time.perf_counter()
+        payload = json.loads(body)
+        parsed = [AnalysisIngredient(**i) for i in payload["ingredients_new"]]
+        full = build_meal(payload["name"], parsed)
+        full_ms.append((time.perf_counter() - start) * 1000)
+        full_bytes += len(body)
+
+        # Delta: one edit against the session
+        body = json.dumps({"edits": [{"op": "update", "id": str(index), "amount": amount, "selected_portion_id": portion_id}]})
+        start = time.perf_counter()
+        request = MealEditRequest.model_validate_json(body)
+        session.apply([dict(edit) for edit in request.edits], request.version)
+        delta_ms.append((time.perf_counter() - start) * 1000)
+        delta_bytes += len(body)
+
+    # Same totals either way
+    incremental = session.to_meal()
+    mismatched = [f for f in AnalysisMeal.model_fields if f.endswith("_float") and abs(getattr(full, f) - getattr(incremental, f)) > 0.011]
+
+    return {
+        "ingredients": size,
+        "edits": edits,
+        "full": summarize(full_ms),
+        "delta": summarize(delta_ms),
+        "full_bytes_per_edit": round(full_bytes / edits),
+        "delta_bytes_per_edit": round(delta_bytes / edits),
+        "mismatched_totals": mismatched,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark meal edits: whole-meal recompute vs meal session deltas.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 20, 100, 500], help="Ingredients per meal.")
+    parser.add_argument("--edits", type=int, default=500)
+    parser.add_argument("--output", help="Where to write the results JSON.")
+    parser.add_argument("--compare", help="Previous results JSON to compare against.")
+    args = parser.parse_args()
+
+    results = {"config": vars(args), "sizes": {}}
+    print(f"{'ingredients':>11} {'full p50':>9} {'p95':>8} {'delta p50':>10} {'p95':>8} {'full bytes':>10} {'delta bytes':>11} {'mismatch':>8}")
+    for size in args.sizes:
+        r = run(size, args.edits)
+        results["sizes"][str(size)] = r
+        print(
+            f"{size:>11} {r['full']['p50_ms']:>9.3f} {r['full']['p95_ms']:>8.3f} {r['delta']['p50_ms']:>10.3f} {r['delta']['p95_ms']:>8.3f} "
+            f"{r['full_bytes_per_edit']:>10} {r['delta_bytes_per_edit']:>11} {len(r['mismatched_totals']):>8}"
+        )
+
+    output = save_results("session", results, args.output)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        print()
+        keys = [f"sizes.{size}.{side}.{p}" for size in args.sizes for side in ("full", "delta") for p in ("p50_ms", "p95_ms")]
+        print_comparison(load_results(args.compare), results, keys)
+
+if __name__ == "__main__":
+    main()
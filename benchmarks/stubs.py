@@ -0,0 +1,52 @@
+import hashlib
+import re
+from types import SimpleNamespace
+import numpy as np
+
+EMBEDDING_DIMS = 1536
+
+# --------------------------------------------------------------------------------
+# Stubbed embedding client
+# --------------------------------------------------------------------------------
+
+def stub_embedding(text, dims=EMBEDDING_DIMS):
+    """
+    Deterministic, offline stand-in for text-embedding-3-small. Words and
+    character trigrams are hashed into a fixed number of buckets, so similar
+    strings (including typos) land close to each other.
+    """
+    vec = np.zeros(dims, dtype=np.float32)
+    text = re.sub(r"\s+", " ", text.lower()).strip()
+
+    features = [("w", word, 1.0) for word in text.split(" ") if word]
+    padded = f" {text} "
+    features += [("t", padded[i:i + 3], 0.5) for i in range(len(padded) - 2)]
+
+    for kind, feature, weight in features:
+        digest = hashlib.blake2b(f"{kind}:{feature}".encode(), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dims
+        sign = 1.0 if digest[4] & 1 else -1.0
+        vec[bucket] += sign * weight
+
+    norm = np.linalg.norm(vec)
+    if norm > 0:
+        vec /= norm
+    return vec.tolist()
+
+class StubEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, model, input, **kwargs):
+        self.calls += 1
+        texts = [input] if isinstance(input, str) else list(input)
+        return SimpleNamespace(
+            model=model,
+            data=[SimpleNamespace(index=i, embedding=stub_embedding(t)) for i, t in enumerate(texts)]
+        )
+
+class StubEmbeddingClient:
+    """Mimics the `client.embeddings.create` surface of the OpenAI client."""
+
+    def __init__(self):
+        self.embeddings = StubEmbeddings()
@@ -0,0 +1,98 @@
+import argparse
+import os
+import time
+
+from benchmarks.fixtures import build_fixture_db, FIXTURE_DB_PATH
+from benchmarks.common import summarize, save_results, load_results, print_comparison
+
+# Latency of typed meals through /text-meal's local path (meal_text.py parser,
+# lexical search_food, local estimates), split into parsing and resolving.
+# No OpenAI server is started: any network call would fail the run.
+# python -m benchmarks.text_meal_bench
+# python -m benchmarks.text_meal_bench --db food.db --compare benchmarks/results/text_meal_<timestamp>.json
+
+MEALS = [
+    "2 eggs, 1 cup white rice, 4 oz chicken breast",
+    "a slice of bread and 2 tbsp peanut butter\n1 banana",
+    "1 1/2 cups oats with 1 cup milk, 1 tbsp honey",
+    "200g salmon, 1 cup broccoli, half a cup brown rice",
+    "greek yogurt - 1 cup, 1/4 cup almonds, 1 apple",
+    "3 large eggs; 2 slices bacon; 1 cup orange juice",
+    "coffee, 1 croissant",
+    "chicken thigh (150 g), 1 cup quinoa, 2 tbsp olive oil, 1 medium avocado",
+]
+
+def run(iterations):
+    from meal_text import parse_meal_text
+    from app import resolve_text_item, build_meal
+    from models.meal_analysis import TextMealAnalysis
+
+    parse_ms, resolve_ms, total_ms = [], [], []
+    items = resolved = 0
+    for i in range(iterations):
+        for text in MEALS:
+            start = time.perf_counter()
+            parsed = parse_meal_text(text)
+            parsed_at = time.perf_counter()
+            results = [resolve_text_item(item) for item in parsed]
+            resolved_at = time.perf_counter()
+            build_meal(text, [r for r in results if r is not None], model=TextMealAnalysis)
+            end = time.perf_counter()
+            if i > 0:  # the first pass warms the caches
+                parse_ms.append((parsed_at - start) * 1000)
+                resolve_ms.append((resolved_at - parsed_at) * 1000)
+                total_ms.append((end - start) * 1000)
+            else:
+                items += len(parsed)
+                resolved += sum(r is not None for r in results)
+
+    return {
+        "meals": len(MEALS),
+        "items": items,
+        "resolved": resolved,
+        "parse": summarize(parse_ms),
+        "resolve": summarize(resolve_ms),
+        "total": summarize(total_ms),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local typed-meal analysis.")
+    parser.add_argument("--db", help="Run against an existing food.db instead of the fixture.")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--output", help="Where to write the results JSON.")
+    parser.add_argument("--compare", help="Previous results JSON to compare against.")
+    args = parser.parse_args()
+
+    os.environ["DB_PATH"] = args.db or build_fixture_db(FIXTURE_DB_PATH)
+    # Nothing should reach OpenAI; point the client nowhere so a call would show up as an error
+    os.environ["OPENAI_BASE_URL"] = "http://127.0.0.1:9/v1"
+    os.environ["OPENAI_API_KEY"] = "sk-none"
+    from warmup import run_warmup
+    run_warmup(os.environ["DB_PATH"])
+
+    # Only count calls made by the run
+    from tracing import OPENAI_CALLS
+    before = dict(OPENAI_CALLS.series)
+    results = {"config": vars(args), **run(args.iterations)}
+    results["openai_calls"] = {
+        f"{kind}:{outcome}": n - before.get((kind, outcome), 0)
+        for (kind, outcome), n in OPENAI_CALLS.series.items() if n > before.get((kind, outcome), 0)
+    }
+    print(f"{results['resolved']}/{results['items']} items resolved across {results['meals']} meals")
+    print(f"{'stage':<8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for stage in ("parse", "resolve", "total"):
+        r = results[stage]
+        print(f"{stage:<8} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['max_ms']:>8.2f}")
+
+    print(f"OpenAI calls: {results['openai_calls'] or 'none'}")
+
+    output = save_results("text_meal", results, args.output)
+    print(f"Saved results to {output}")
+
+    if args.compare:
+        print()
+        keys = [f"{stage}.{p}" for stage in ("parse", "resolve", "total") for p in ("p50_ms", "p95_ms")]
+        print_comparison(load_results(args.compare), results, keys)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from admission import run_in_threadpool
+
+from models.meal_analysis import AnalysisIngredient, GeneratedFoods
+from helper import get_category_profile, clamp_to_category
+from openai_client import get_openai_client, call_openai
+from batching import MicroBatcher
+from tracing import span, log_event
+from db.snapshots import current_db_path
+
+# Foods the LLM generated for ingredients that aren't in the database, keyed by
+# ingredient name, so each one only has to be invented once. In background mode
+# /meal-updated answers with local estimates right away and generates the
+# missing foods here afterwards, so the next meal with them gets the LLM version.
+
+CUSTOM_FOOD_CACHE_SIZE = int(os.getenv("CUSTOM_FOOD_CACHE_SIZE", "2000"))
+
+# Generated nutrient values above this multiple of their food category's max are clamped
+CATEGORY_BOUND_FACTOR = float(os.getenv("CATEGORY_BOUND_FACTOR", "1.5"))
+CATEGORY_BOUND_MIN_FOODS = 5
+
+# Unresolved foods from concurrent requests are generated together: one parse
+# call per CUSTOM_FOOD_BATCH_WINDOW_MS (or CUSTOM_FOOD_BATCH_MAX foods) while
+# another generation is in flight, each name asked for once. Output tokens
+# grow with every food in the call, so batches stay small.
+# CUSTOM_FOOD_BATCH_WINDOW_MS=0 generates each request's foods on their own.
+CUSTOM_FOOD_BATCH_WINDOW_MS = float(os.getenv("CUSTOM_FOOD_BATCH_WINDOW_MS", "50"))
+CUSTOM_FOOD_BATCH_MAX = int(os.getenv("CUSTOM_FOOD_BATCH_MAX", "16"))
+
+def cache_key(name):
+    return " ".join(name.lower().split())
+
+class CustomFoodCache:
+    """LRU of generated foods. Stored per portion, the amount is set on lookup."""
+
+    def __init__(self, max_entries=CUSTOM_FOOD_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.foods = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        key = cache_key(name)
+        with self.lock:
+            food = self.foods.get(key)
+            if food is not None:
+                self.foods.move_to_end(key)
+            return food
+
+    def put(self, name, food: AnalysisIngredient):
+        key = cache_key(name)
+        with self.lock:
+            self.foods[key] = food
+            self.foods.move_to_end(key)
+            while len(self.foods) > self.max_entries:
+                self.foods.popitem(last=False)
+
+    def __len__(self):
+        return len(self.foods)
+
+custom_food_cache = CustomFoodCache()
+
+def with_quantity(food: AnalysisIngredient, quantity: float) -> AnalysisIngredient:
+    gram_weight = next((p.gram_weight for p in food.portions if p.id == food.selected_portion_id), None)
+    if not gram_weight:
+        return food.model_copy()
+    return food.model_copy(update={"amount": round(quantity / gram_weight, 2)})
+
+def lookup(name, quantity):
+    food = custom_food_cache.get(name)
+    return with_quantity(food, quantity) if food is not None else None
+
+# --------------------------------------------------------------------------------
+# Generation
+# --------------------------------------------------------------------------------
+
+def check_against_category(conn, item, food: AnalysisIngredient) -> AnalysisIngredient:
+    """Clamp implausible values to CATEGORY_BOUND_FACTOR x the max seen in the item's food category."""
+    category_id = item.get("food_category_id")
+    if category_id is None:
+        return food
+    upper = get_category_profile(conn, category_id, "max")
+    if upper is None or upper["food_count"] < CATEGORY_BOUND_MIN_FOODS:
+        return food
+
+    nutrients, clamped = clamp_to_category(food.nutrients, upper["nutrients"], CATEGORY_BOUND_FACTOR)
+    if not clamped:
+        return food
+    log_event("custom_food_clamped", level=logging.WARNING, name=item["name"], food_category_id=category_id, fields=clamped)
+    return food.model_copy(update={"nutrients": nutrients})
+
+def generation_key(item):
+    """Items asking for the same food (and portion, when one is named) are generated once."""
+    return (cache_key(item["name"]), item.get("portion"))
+
+class CustomFoodError(Exception):
+    """The model didn't generate a food for some of the items asked for."""
+
+    def __init__(self, names):
+        super().__init__(f"No custom food generated for: {', '.join(names)}")
+        self.names = names
+
+def request_foods(items: list[dict]) -> dict[int, AnalysisIngredient]:
+    """One parse call for items; the foods it returned, by the item's position."""
+    prompt_items = [
+        {"index": i, **{key: item[key] for key in ("name", "quantity_in_grams", "portion") if key in item}}
+        for i, item in enumerate(items)
+    ]
+    chat_completion = call_openai(
+        "chat", get_openai_client().beta.chat.completions.parse,
+        model="gpt-4o",
+        messages=[
+            {
+                "role": "user",
+                "content": f"Given this list: {prompt_items}, give me a food object like the USDA Food Central database for each item, with the item's 'index'. For each food, set 'fdc_id' to 1 and the 'amount' field to 1.0. Create one portion for each food with the appropriate gram_weight for that portion size (the item's 'portion' when it has one). Provide nutrient values per 100 grams of that food."
+            }
+        ],
+        response_format=GeneratedFoods
+    )
+    generated = chat_completion.choices[0].message.parsed.foods
+    return {g.index: g.food for g in generated if 0 <= g.index < len(items)}
+
+def generate_batch(items: list[dict]) -> list[AnalysisIngredient | None]:
+    """
+    One parse call for a batch of {"name", "quantity_in_grams"} or {"name",
+    "portion"} items, possibly from different requests. Items the model left
+    out are asked for again one at a time. Returns a food (or None when there
+    still isn't one) per item, in order.
+    """
+    unique = {}
+    for item in items:
+        key = generation_key(item)
+        if key not in unique and (item.get("portion") or custom_food_cache.get(item["name"]) is None):
+            unique[key] = item
+    wanted = list(unique.values())
+
+    foods = {}
+    if wanted:
+        generated = request_foods(wanted)
+        missing = [item for i, item in enumerate(wanted) if i not in generated]
+        if missing:
+            log_event("custom_food_mismatch", level=logging.WARNING, asked=len(wanted), generated=len(generated), retried=[item["name"] for item in missing])
+        matched = [(item, generated[i]) for i, item in enumerate(wanted) if i in generated]
+        for item in missing:
+            retry = request_foods([item])
+            if 0 in retry:
+                matched.append((item, retry[0]))
+
+        conn = sqlite3.connect(current_db_path())
+        try:
+            for item, food in matched:
+                food = check_against_category(conn, item, food)
+                custom_food_cache.put(item["name"], food)
+                foods[generation_key(item)] = food
+        finally:
+            conn.close()
+
+    results = []
+    for item in items:
+        food = foods.get(generation_key(item)) or custom_food_cache.get(item["name"])
+        if food is None:
+            results.append(None)
+        elif unique.get(generation_key(item)) is not item and "quantity_in_grams" in item:
+            # Generated for another item's quantity (or cached), scale to this one's
+            results.append(with_quantity(food, item["quantity_in_grams"]))
+        else:
+            # Every item gets its own copy, the same food can go back to several requests
+            results.append(food.model_copy(deep=True))
+    return results
+
+# generate_batch reads the caller's pinned food.db, so requests pinned to different snapshots don't share a batch
+custom_food_batcher = MicroBatcher("custom_food", generate_batch, CUSTOM_FOOD_BATCH_WINDOW_MS, CUSTOM_FOOD_BATCH_MAX, group=current_db_path)
+
+def generate_custom_foods(invalid_results: list[dict]) -> list[AnalysisIngredient]:
+    """
+    LLM-generated foods for {"name", "quantity_in_grams"} items, batched with
+    other requests'; blocking. Raises CustomFoodError if any item got no food.
+    """
+    foods = custom_food_batcher.submit_many(invalid_results)
+    missing = [item["name"] for item, food in zip(invalid_results, foods) if food is None]
+    if missing:
+        raise CustomFoodError(missing)
+    return foods
+
+def generate_custom_food(name: str, portion: str) -> AnalysisIngredient | None:
+    """An LLM-generated food for `name` with one portion of `portion` (e.g. "1 cup"), batched; blocking."""
+    return custom_food_batcher.submit({"name": name, "portion": portion})
+
+_pending = set()
+_tasks = set()
+
+def schedule_generation(invalid_results: list[dict]):
+    """Generate foods for the items that aren't cached or already being generated, without waiting."""
+    items = [
+        item for item in invalid_results
+        if custom_food_cache.get(item["name"]) is None and cache_key(item["name"]) not in _pending
+    ]
+    if not items:
+        return
+    keys = {cache_key(item["name"]) for item in items}
+    _pending.update(keys)
+
+    async def generate():
+        try:
+            with span("custom_food_background"):
+                await run_in_threadpool(generate_custom_foods, items)
+            log_event("custom_food_generated", ingredients=[item["name"] for item in items])
+        except Exception as e:
+            log_event("custom_food_failed", level=logging.WARNING, background=True, error=str(e))
+        finally:
+            _pending.difference_update(keys)
+
+    task = asyncio.create_task(generate())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
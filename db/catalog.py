@@ -0,0 +1,239 @@
+import contextvars
+import json
+import os
+import sqlite3
+import time
+import weakref
+
+# In-memory copy of the read-only parts of food.db, loaded at startup and on
+# every snapshot reload (db/snapshots.py).
+# Search and hydration use it when it is loaded and fall back to SQLite
+# queries otherwise, so nothing breaks while the server is still warming up.
+
+TRACKED_NUTRIENT_NUMBERS = (203, 204, 205, 291, 303, 309, 401, 320, 323, 317, 504, 851, 629, 621)
+
+# Data types held in memory. Foods of other datasets (hundreds of thousands of
+# branded foods) are hydrated from SQLite by fdc_id instead.
+CATALOG_DATASETS = tuple(d.strip() for d in os.getenv("CATALOG_DATASETS", "sr_legacy_food").split(",") if d.strip())
+
+# Map the catalog from a shared on-disk store instead of building it per process (db/catalog_store.py)
+CATALOG_STORE = os.getenv("CATALOG_STORE", "0") == "1"
+
+_catalog = None
+# Catalog a request started on, so a snapshot reload mid-request doesn't mix versions (db.snapshots)
+_pinned = contextvars.ContextVar("pinned_catalog", default=None)
+# Replaced catalogs that requests or background tasks still hold, dropped once they're done
+_retired = weakref.WeakSet()
+
+def get_catalog():
+    """The catalog this request is pinned to, else the live one."""
+    pinned = _pinned.get()
+    return pinned if pinned is not None else _catalog
+
+def live_catalog():
+    return _catalog
+
+def set_catalog(catalog):
+    global _catalog
+    if _catalog is not None and _catalog is not catalog:
+        _retired.add(_catalog)
+    _catalog = catalog
+
+def retired_catalogs():
+    return list(_retired)
+
+def pin_catalog():
+    """Pin the live catalog for the rest of this context; pass the result to unpin_catalog()."""
+    catalog = _catalog
+    if catalog is not None:
+        catalog.active += 1
+    return catalog, _pinned.set(catalog)
+
+def unpin_catalog(pin):
+    catalog, token = pin
+    if catalog is not None:
+        catalog.active -= 1
+    _pinned.reset(token)
+
+class FoodCatalog:
+    def __init__(self, db_path, datasets=CATALOG_DATASETS, shared=CATALOG_STORE):
+        self.db_path = db_path
+        self.shared = shared
+        self.store = None
+        self.version = None
+        self.active = 0
+        self.datasets = tuple(datasets)
+        self.foods = {}
+        self.nutrients = {}
+        self.portions = {}
+        self.portion_units = {}
+        self.fuzzy_ids = []
+        self.fuzzy_choices = []
+        self.embedding_rows = {}
+        self.embedding_matrix = None
+        # Compressed copy for the coarse pass (db.embeddings.compress_embeddings)
+        self.embedding_coarse = None
+        self.embedding_scales = None
+        # Building the shared store needs the full matrix even when compressing
+        self.keep_full_embeddings = False
+        self.category_profiles = {}
+        self.timings = {}
+
+    def load(self, conn=None):
+        """Load every component, recording how long each one takes."""
+        if self.shared:
+            from db.catalog_store import attach
+            return attach(self)
+        own_conn = conn is None
+        if own_conn:
+            conn = sqlite3.connect(self.db_path)
+        try:
+            for name, loader in (
+                ("foods", self.load_foods),
+                ("nutrients", self.load_nutrients),
+                ("portions", self.load_portions),
+                ("portion_index", self.load_portion_index),
+                ("category_profiles", self.load_category_profiles),
+                ("fuzzy_index", self.load_fuzzy_index),
+                ("embeddings", self.load_embeddings),
+            ):
+                start = time.perf_counter()
+                loader(conn)
+                self.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+        finally:
+            if own_conn:
+                conn.close()
+        return self
+
+    # --------------------------------------------------------------------------------
+    # Loaders
+    # --------------------------------------------------------------------------------
+
+    def dataset_filter(self, column):
+        return f"{column} IN ({','.join('?' * len(self.datasets))})"
+
+    def load_foods(self, conn):
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT fdc_id, data_type, description, fermented_food_serving_size, CAST(collagen AS REAL) AS collagen,
+                   food_category_id, normalized_description
+            FROM sr_legacy_food
+            WHERE {self.dataset_filter("data_type")}
+        """, self.datasets)
+        colnames = [desc[0] for desc in cursor.description]
+        for row in cursor.fetchall():
+            food = dict(zip(colnames, row))
+            self.foods[food["fdc_id"]] = food
+
+    def load_nutrients(self, conn):
+        # Same shape as helper.get_nutrients, for every food at once
+        cursor = conn.cursor()
+        placeholders = ",".join("?" * len(TRACKED_NUTRIENT_NUMBERS))
+        cursor.execute(f"""
+            SELECT fn.fdc_id, fn.id, fn.amount,
+                   n.id, CAST(n.nutrient_nbr AS INTEGER), n.name, n.unit_name
+            FROM sr_legacy_food_nutrient fn
+            JOIN sr_legacy_nutrient n ON fn.nutrient_id = n.id
+            WHERE CAST(n.nutrient_nbr AS INTEGER) IN ({placeholders})
+                AND fn.fdc_id IN (SELECT fdc_id FROM sr_legacy_food WHERE {self.dataset_filter("data_type")})
+        """, TRACKED_NUTRIENT_NUMBERS + self.datasets)
+        for row in cursor.fetchall():
+            self.nutrients.setdefault(row[0], []).append({
+                "id": row[1],
+                "amount": row[2],
+                "nutrient": {
+                    "id": row[3],
+                    "number": row[4],
+                    "name": row[5],
+                    "unit_name": row[6],
+                }
+            })
+
+    def load_portions(self, conn):
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT fp.fdc_id, fp.id, fp.gram_weight, fp.amount, fp.modifier
+            FROM sr_legacy_food_portion fp
+            WHERE fp.fdc_id IN (SELECT fdc_id FROM sr_legacy_food WHERE {self.dataset_filter("data_type")})
+        """, self.datasets)
+        for row in cursor.fetchall():
+            self.portions.setdefault(row[0], []).append({
+                "id": row[1],
+                "gram_weight": row[2],
+                "amount": row[3],
+                "modifier": row[4]
+            })
+
+    def load_portion_index(self, conn):
+        from portions import build_portion_index
+        self.portion_units = build_portion_index(self.portions)
+
+    def load_category_profiles(self, conn):
+        from helper import category_profile_from_row
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT * FROM food_category_nutrients")
+        except sqlite3.OperationalError:
+            return  # food.db built before category profiles existed
+        colnames = [desc[0] for desc in cursor.description]
+        for row in cursor.fetchall():
+            row = dict(zip(colnames, row))
+            self.category_profiles.setdefault(row["food_category_id"], {})[row["stat"]] = category_profile_from_row(row)
+
+    def load_fuzzy_index(self, conn):
+        # SR Legacy only, like the SQL fallback in db.search_service.fuzzy_search
+        for fdc_id, food in self.foods.items():
+            if food["normalized_description"] and food["data_type"] == "sr_legacy_food":
+                self.fuzzy_ids.append(fdc_id)
+                self.fuzzy_choices.append(food["normalized_description"])
+
+    def load_embeddings(self, conn):
+        import numpy as np
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT fdc_id, data_type, embedding FROM food_embeddings WHERE {self.dataset_filter('data_type')}", self.datasets)
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        self.embedding_matrix = np.empty((len(rows), len(json.loads(rows[0][2]))), dtype=np.float32)
+        for i, (fdc_id, data_type, emb_json) in enumerate(rows):
+            self.embedding_rows[(fdc_id, data_type)] = i
+            self.embedding_matrix[i] = json.loads(emb_json)
+
+        from db.embeddings import compression_enabled, compress_embeddings
+        if compression_enabled():
+            self.embedding_coarse, self.embedding_scales = compress_embeddings(self.embedding_matrix)
+            if not self.keep_full_embeddings:
+                # Top candidates are rescored from SQLite instead
+                self.embedding_matrix = None
+
+    # --------------------------------------------------------------------------------
+    # Lookups
+    # --------------------------------------------------------------------------------
+
+    def get_food(self, fdc_id):
+        food = self.foods.get(fdc_id)
+        if food is None:
+            return None
+        return {
+            "fdc_id": food["fdc_id"],
+            "data_type": food["data_type"],
+            "description": food["description"],
+            "fermented_food_serving_size": food["fermented_food_serving_size"],
+            "collagen": food["collagen"],
+        }
+
+    def get_embeddings(self, keys):
+        """Embedding rows for (fdc_id, data_type) keys, plus which keys were found."""
+        found = [key for key in keys if key in self.embedding_rows]
+        if self.embedding_matrix is None or not found:
+            return found, None
+        return found, self.embedding_matrix[[self.embedding_rows[key] for key in found]]
+
+    def get_coarse_embeddings(self, keys):
+        """(found keys, coarse rows, their scales or None), like get_embeddings."""
+        found = [key for key in keys if key in self.embedding_rows]
+        if self.embedding_coarse is None or not found:
+            return found, None, None
+        rows = [self.embedding_rows[key] for key in found]
+        scales = self.embedding_scales[rows] if self.embedding_scales is not None else None
+        return found, self.embedding_coarse[rows], scales
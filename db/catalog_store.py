@@ -0,0 +1,401 @@
+import argparse
+import fcntl
+import json
+import os
+import shutil
+import sqlite3
+import time
+from collections.abc import Mapping
+
+import numpy as np
+
+from db.embeddings import compression_config
+
+# Shared, memory-mapped copy of the catalog for multi-worker deployments.
+#
+# With CATALOG_STORE=1 the catalog's read-only structures (foods, nutrient and
+# portion tables, descriptions, the embedding matrix and its compressed copy
+# when EMBEDDING_DIMS/EMBEDDING_QUANTIZATION are set) are written once per
+# food.db into <db_path>.catalog/ as flat .npy arrays. Every worker maps them
+# read-only instead of building its own dicts, so the pages live once in the
+# OS page cache and each extra worker only adds its own small index objects.
+# The first worker to start builds the store under a file lock, the others
+# wait for it and attach. A store whose food.db changed (size/mtime) is rebuilt.
+#
+# The views below behave like the dicts FoodCatalog builds in memory, so
+# helper.py and db/search_service.py don't care which one they get. The fuzzy
+# choice list (SR Legacy descriptions, what rapidfuzz scans) and the category
+# profiles are small and still built per worker.
+#
+# Build ahead of time (e.g. right after publishing a snapshot):
+# python -m db.catalog_store /var/data/food.db
+# python -m benchmarks.memory_bench --workers 1 2 4
+
+STORE_FORMAT = 1
+
+def store_dir(db_path):
+    return f"{db_path}.catalog"
+
+def db_signature(db_path):
+    stat = os.stat(db_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+# --------------------------------------------------------------------------------
+# Writing
+# --------------------------------------------------------------------------------
+
+def pack_strings(values):
+    """UTF-8 blob, offsets (len+1) and a null mask for a list of str/None."""
+    encoded = [value.encode() if isinstance(value, str) else b"" for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    nulls = np.array([not isinstance(value, str) for value in values], dtype=bool)
+    return blob, offsets, nulls
+
+def optional_floats(values):
+    return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+
+def csr_offsets(counts):
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    return offsets
+
+def catalog_arrays(catalog) -> tuple[dict, dict]:
+    """(arrays, meta) for a FoodCatalog loaded into memory."""
+    foods = sorted(catalog.foods.values(), key=lambda food: food["fdc_id"])
+    row_of = {food["fdc_id"]: i for i, food in enumerate(foods)}
+    data_types = sorted({food["data_type"] for food in foods} | {key[1] for key in catalog.embedding_rows})
+    type_code = {data_type: i for i, data_type in enumerate(data_types)}
+
+    arrays = {
+        "fdc_id": np.array([food["fdc_id"] for food in foods], dtype=np.int64),
+        "data_type": np.array([type_code[food["data_type"]] for food in foods], dtype=np.int16),
+        # SR Legacy has integer categories, ingested datasets may have NaN
+        "food_category_id": optional_floats([food["food_category_id"] for food in foods]),
+        "fermented_food_serving_size": optional_floats([food["fermented_food_serving_size"] for food in foods]),
+        "collagen": optional_floats([food["collagen"] for food in foods]),
+    }
+    for column in ("description", "normalized_description"):
+        arrays[column], arrays[f"{column}_offsets"], arrays[f"{column}_nulls"] = pack_strings([food[column] for food in foods])
+
+    # Nutrients: one run of rows per food, nutrient definitions in meta
+    definitions, definition_index = [], {}
+    nutrient_rows = [catalog.nutrients.get(food["fdc_id"], []) for food in foods]
+    for rows in nutrient_rows:
+        for row in rows:
+            key = tuple(row["nutrient"].values())
+            if key not in definition_index:
+                definition_index[key] = len(definitions)
+                definitions.append(row["nutrient"])
+    flat = [row for rows in nutrient_rows for row in rows]
+    arrays["nutrient_offsets"] = csr_offsets([len(rows) for rows in nutrient_rows])
+    arrays["nutrient_id"] = np.array([row["id"] for row in flat], dtype=np.int64)
+    arrays["nutrient_amount"] = optional_floats([row["amount"] for row in flat])
+    arrays["nutrient_definition"] = np.array([definition_index[tuple(row["nutrient"].values())] for row in flat], dtype=np.int32)
+
+    portion_rows = [catalog.portions.get(food["fdc_id"], []) for food in foods]
+    flat = [row for rows in portion_rows for row in rows]
+    arrays["portion_offsets"] = csr_offsets([len(rows) for rows in portion_rows])
+    arrays["portion_id"] = np.array([row["id"] for row in flat], dtype=np.int64)
+    arrays["portion_gram_weight"] = optional_floats([row["gram_weight"] for row in flat])
+    arrays["portion_amount"] = optional_floats([row["amount"] for row in flat])
+    arrays["portion_modifier"], arrays["portion_modifier_offsets"], arrays["portion_modifier_nulls"] = pack_strings([row["modifier"] for row in flat])
+
+    # Same order as the in-memory fuzzy index, rapidfuzz breaks ties by position
+    arrays["fuzzy_rows"] = np.array([row_of[fdc_id] for fdc_id in catalog.fuzzy_ids], dtype=np.int64)
+
+    # Embedding rows sorted by (fdc_id, data_type) so the row is a binary search away
+    if catalog.embedding_matrix is not None:
+        keys = np.array([fdc_id * len(data_types) + type_code[data_type] for fdc_id, data_type in catalog.embedding_rows], dtype=np.int64)
+        rows = np.array(list(catalog.embedding_rows.values()), dtype=np.int64)
+        order = np.argsort(keys, kind="stable")
+        arrays["embedding_keys"] = keys[order]
+        arrays["embedding_matrix"] = np.ascontiguousarray(catalog.embedding_matrix[rows[order]])
+        if catalog.embedding_coarse is not None:
+            arrays["embedding_coarse"] = np.ascontiguousarray(catalog.embedding_coarse[rows[order]])
+        if catalog.embedding_scales is not None:
+            arrays["embedding_scales"] = catalog.embedding_scales[rows[order]]
+
+    meta = {
+        "format": STORE_FORMAT,
+        "datasets": list(catalog.datasets),
+        "data_types": data_types,
+        "nutrient_definitions": definitions,
+        "embedding_compression": compression_config(),
+    }
+    return arrays, meta
+
+def write_store(catalog, directory):
+    """Write the store to a temp dir next to `directory`, then move it into place."""
+    arrays, meta = catalog_arrays(catalog)
+    meta["db_signature"] = db_signature(catalog.db_path)
+    tmp = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), array)
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp, directory)
+
+def read_meta(directory):
+    try:
+        with open(os.path.join(directory, "meta.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def is_current(meta, db_path, datasets):
+    return (
+        meta is not None
+        and meta.get("format") == STORE_FORMAT
+        and meta.get("datasets") == list(datasets)
+        and meta.get("db_signature") == db_signature(db_path)
+        and meta.get("embedding_compression") == compression_config()
+    )
+
+def ensure_store(db_path, datasets) -> bool:
+    """Build <db_path>.catalog unless it's current. Returns whether this process built it."""
+    from db.catalog import FoodCatalog
+
+    directory = store_dir(db_path)
+    if is_current(read_meta(directory), db_path, datasets):
+        return False
+    # One builder per machine; the others block here and find it current afterwards
+    with open(f"{directory}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if is_current(read_meta(directory), db_path, datasets):
+            return False
+        catalog = FoodCatalog(db_path, datasets, shared=False)
+        catalog.keep_full_embeddings = True
+        write_store(catalog.load(), directory)
+        return True
+
+# --------------------------------------------------------------------------------
+# Views
+# --------------------------------------------------------------------------------
+
+def load_array(directory, name):
+    path = os.path.join(directory, f"{name}.npy")
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        return np.load(path)  # empty arrays can't be mapped
+
+class Strings:
+    def __init__(self, directory, name):
+        self.blob = load_array(directory, name)
+        self.offsets = load_array(directory, f"{name}_offsets")
+        self.nulls = load_array(directory, f"{name}_nulls")
+
+    def __getitem__(self, i):
+        if self.nulls[i]:
+            return None
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode()
+
+def optional(value):
+    return None if np.isnan(value) else float(value)
+
+class StoreMapping(Mapping):
+    """Read-only mapping keyed by fdc_id over the store's sorted fdc_id array."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def row(self, fdc_id):
+        return self.store.row(fdc_id)
+
+    def __contains__(self, fdc_id):
+        return self.row(fdc_id) is not None
+
+    def __getitem__(self, fdc_id):
+        row = self.row(fdc_id)
+        if row is None:
+            raise KeyError(fdc_id)
+        return self.value(row)
+
+    def __iter__(self):
+        return (int(fdc_id) for fdc_id in self.store.fdc_ids if fdc_id in self)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+class FoodTable(StoreMapping):
+    def __iter__(self):
+        return (int(fdc_id) for fdc_id in self.store.fdc_ids)
+
+    def __len__(self):
+        return len(self.store.fdc_ids)
+
+    def value(self, row):
+        s = self.store
+        category = s.food_category_id[row]
+        return {
+            "fdc_id": int(s.fdc_ids[row]),
+            "data_type": s.data_types[s.data_type[row]],
+            "description": s.description[row],
+            "fermented_food_serving_size": optional(s.fermented_food_serving_size[row]),
+            "collagen": optional(s.collagen[row]),
+            "food_category_id": None if np.isnan(category) else int(category),
+            "normalized_description": s.normalized_description[row],
+        }
+
+class CsrTable(StoreMapping):
+    """fdc_id -> its run of rows; foods without rows are absent, like the in-memory dicts."""
+
+    def __init__(self, store, offsets):
+        super().__init__(store)
+        self.offsets = offsets
+
+    def row(self, fdc_id):
+        row = self.store.row(fdc_id)
+        if row is None or self.offsets[row] == self.offsets[row + 1]:
+            return None
+        return row
+
+    def value(self, row):
+        return [self.item(i) for i in range(self.offsets[row], self.offsets[row + 1])]
+
+class NutrientTable(CsrTable):
+    def __init__(self, store):
+        super().__init__(store, store.nutrient_offsets)
+
+    def item(self, i):
+        s = self.store
+        return {
+            "id": int(s.nutrient_id[i]),
+            "amount": optional(s.nutrient_amount[i]),
+            "nutrient": dict(s.nutrient_definitions[s.nutrient_definition[i]]),
+        }
+
+class PortionTable(CsrTable):
+    def __init__(self, store):
+        super().__init__(store, store.portion_offsets)
+
+    def item(self, i):
+        s = self.store
+        return {
+            "id": int(s.portion_id[i]),
+            "gram_weight": optional(s.portion_gram_weight[i]),
+            "amount": optional(s.portion_amount[i]),
+            "modifier": s.portion_modifier[i],
+        }
+
+class PortionUnitsTable(CsrTable):
+    """portions.portion_units() of a food, worked out on lookup instead of held for every food."""
+
+    def __init__(self, store, portions):
+        super().__init__(store, store.portion_offsets)
+        self.portions = portions
+
+    def value(self, row):
+        from portions import portion_units
+        return portion_units(self.portions.value(row))
+
+class EmbeddingIndex(Mapping):
+    """(fdc_id, data_type) -> row of the embedding matrix."""
+
+    def __init__(self, store):
+        self.store = store
+        self.keys = store.embedding_keys
+
+    def row(self, key):
+        fdc_id, data_type = key
+        code = self.store.type_codes.get(data_type)
+        if code is None or not isinstance(fdc_id, (int, np.integer)):
+            return None
+        packed = fdc_id * len(self.store.data_types) + code
+        i = int(np.searchsorted(self.keys, packed))
+        return i if i < len(self.keys) and self.keys[i] == packed else None
+
+    def __contains__(self, key):
+        return self.row(key) is not None
+
+    def __getitem__(self, key):
+        row = self.row(key)
+        if row is None:
+            raise KeyError(key)
+        return row
+
+    def __iter__(self):
+        types = len(self.store.data_types)
+        return ((int(key // types), self.store.data_types[key % types]) for key in self.keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+class CatalogStore:
+    def __init__(self, directory):
+        meta = read_meta(directory)
+        self.data_types = meta["data_types"]
+        self.type_codes = {data_type: i for i, data_type in enumerate(self.data_types)}
+        self.nutrient_definitions = meta["nutrient_definitions"]
+        for name in (
+            "fdc_id", "data_type", "food_category_id", "fermented_food_serving_size", "collagen",
+            "nutrient_offsets", "nutrient_id", "nutrient_amount", "nutrient_definition",
+            "portion_offsets", "portion_id", "portion_gram_weight", "portion_amount", "fuzzy_rows",
+        ):
+            setattr(self, name, load_array(directory, name))
+        self.fdc_ids = self.fdc_id
+        self.description = Strings(directory, "description")
+        self.normalized_description = Strings(directory, "normalized_description")
+        self.portion_modifier = Strings(directory, "portion_modifier")
+        has_embeddings = os.path.exists(os.path.join(directory, "embedding_matrix.npy"))
+        self.embedding_keys = load_array(directory, "embedding_keys") if has_embeddings else None
+        self.embedding_matrix = load_array(directory, "embedding_matrix") if has_embeddings else None
+        self.embedding_coarse = self.embedding_scales = None
+        for name in ("embedding_coarse", "embedding_scales"):
+            if os.path.exists(os.path.join(directory, f"{name}.npy")):
+                setattr(self, name, load_array(directory, name))
+
+    def row(self, fdc_id):
+        if not isinstance(fdc_id, (int, np.integer)) or isinstance(fdc_id, bool):
+            return None
+        i = int(np.searchsorted(self.fdc_ids, fdc_id))
+        return i if i < len(self.fdc_ids) and self.fdc_ids[i] == fdc_id else None
+
+def attach(catalog):
+    """Point a FoodCatalog at the mapped store for its db_path, building the store first if needed."""
+    start = time.perf_counter()
+    built = ensure_store(catalog.db_path, catalog.datasets)
+    catalog.timings["store_build" if built else "store_check"] = round((time.perf_counter() - start) * 1000, 1)
+
+    start = time.perf_counter()
+    store = CatalogStore(store_dir(catalog.db_path))
+    catalog.store = store
+    catalog.foods = FoodTable(store)
+    catalog.nutrients = NutrientTable(store)
+    catalog.portions = PortionTable(store)
+    catalog.portion_units = PortionUnitsTable(store, catalog.portions)
+    catalog.fuzzy_ids = [int(store.fdc_ids[row]) for row in store.fuzzy_rows]
+    catalog.fuzzy_choices = [store.normalized_description[row] for row in store.fuzzy_rows]
+    if store.embedding_matrix is not None:
+        catalog.embedding_matrix = store.embedding_matrix
+        catalog.embedding_coarse = store.embedding_coarse
+        catalog.embedding_scales = store.embedding_scales
+        catalog.embedding_rows = EmbeddingIndex(store)
+    catalog.timings["store_attach"] = round((time.perf_counter() - start) * 1000, 1)
+
+    start = time.perf_counter()
+    conn = sqlite3.connect(catalog.db_path)
+    try:
+        catalog.load_category_profiles(conn)
+    finally:
+        conn.close()
+    catalog.timings["category_profiles"] = round((time.perf_counter() - start) * 1000, 1)
+    return catalog
+
+if __name__ == "__main__":
+    from db.catalog import CATALOG_DATASETS
+
+    parser = argparse.ArgumentParser(description="Build the memory-mapped catalog store for a food.db.")
+    parser.add_argument("db_path")
+    parser.add_argument("--datasets", default=",".join(CATALOG_DATASETS))
+    args = parser.parse_args()
+
+    datasets = tuple(d.strip() for d in args.datasets.split(",") if d.strip())
+    start = time.perf_counter()
+    built = ensure_store(args.db_path, datasets)
+    print(f"{'Built' if built else 'Already current:'} {store_dir(args.db_path)} ({time.perf_counter() - start:.1f}s)")
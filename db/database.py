@@ -4,11 +4,27 @@ import glob
 import os
 import re
 
-DB_PATH = "../food.db"
+from db.datasets import PRIMARY_DATASET, EXTRA_DATASETS, ingest_datasets
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(ROOT_DIR, "food.db")
+DATA_DIR = os.path.join(ROOT_DIR, "data")
+
+# Build food.db (from the repo root)
+# python -m db.database
+
+# Add just the trigram and lookup indexes to an existing food.db
+# python -m db.database trigram
+
+# With Foundation and Branded foods too (see db/datasets.py)
+# python -m db.database --fdc-dir ~/FoodData_Central_csv --datasets foundation_food,branded_food
 
 # Upload food.db to Render
 # cd /var/data
 # curl -L -o food.db "https://dropboxlink.com"
+# With DB_SNAPSHOT_DIR set, download to another name and publish it instead, the
+# running server swaps it in without a restart (see db/snapshots.py)
+# curl -L -o food.new.db "https://dropboxlink.com" && python -m db.snapshots publish food.new.db
 
 # --- Normalization helper ---
 def normalize(text: str) -> str:
@@ -19,79 +35,197 @@ def normalize(text: str) -> str:
     text = re.sub(r'\s+', ' ', text)
     return text.strip()
 
-# Remove old DB if you want a fresh build
-if os.path.exists(DB_PATH):
-    os.remove(DB_PATH)
-
-# Connect (or create) SQLite database
-conn = sqlite3.connect(DB_PATH)
-cursor = conn.cursor()
-
-# List of CSV files (adjust path)
-csv_files = glob.glob("../data/*.csv")
-
-for csv_file in csv_files:
-    # Use the filename (without extension) as table name
-    table_name = os.path.splitext(os.path.basename(csv_file))[0]
-    print(f"Importing {csv_file} into table {table_name}...")
-    
-    # Load CSV into DataFrame
-    df = pd.read_csv(csv_file)
-    
-    # Write to SQLite
-    df.to_sql(table_name, conn, if_exists="replace", index=False)
-
-# --- Create FTS5 virtual table for Food descriptions ---
-print("Creating FTS5 index...")
-
-# Add normalized_description column
-cursor.execute("ALTER TABLE sr_legacy_food ADD COLUMN normalized_description TEXT;")
-
 def normalize_text(text):
     text = text.lower()
     text = re.sub(r"[^a-z0-9\s-]", "", text)
     text = re.sub(r"\s+", " ", text).strip()
     return text
 
-cursor.execute("SELECT fdc_id, description FROM sr_legacy_food WHERE description IS NOT NULL;")
-rows = cursor.fetchall()
-
-for fdc_id, desc in rows:
-    norm = normalize_text(desc)
-    cursor.execute(
-        "UPDATE sr_legacy_food SET normalized_description = ? WHERE fdc_id = ?",
-        (norm, fdc_id)
-    )
-
-# Drop if exists (for rebuilds)
-cursor.execute("DROP TABLE IF EXISTS food_search;")
-
-# Create virtual FTS table linked to Food
-cursor.execute("""
-    CREATE VIRTUAL TABLE food_search
-    USING fts5(description, data_type, content='');
-""")
-
-# cursor.execute("""
-#     INSERT INTO food_search(rowid, description, data_type)
-#     SELECT fdc_id, description, 'sr_legacy_food'
-#     FROM sr_legacy_food
-#     WHERE description IS NOT NULL;
-# """)
-
-cursor.execute("""
-    INSERT INTO food_search(rowid, description, data_type)
-    SELECT fdc_id, normalized_description, 'sr_legacy_food'
-    FROM sr_legacy_food
-    WHERE normalized_description IS NOT NULL;
-""")
-
-# print("First 5 rows of sr_legacy_food:")
-# cursor.execute("SELECT * FROM sr_legacy_food LIMIT 5;")
-# rows = cursor.fetchall()
-# for row in rows:
-#     print(row)
-
-conn.commit()
-conn.close()
-print("Database with FTS5 created successfully!")
+def import_csv_files(conn, csv_files):
+    for csv_file in csv_files:
+        # Use the filename (without extension) as table name
+        table_name = os.path.splitext(os.path.basename(csv_file))[0]
+        print(f"Importing {csv_file} into table {table_name}...")
+
+        # Load CSV into DataFrame
+        df = pd.read_csv(csv_file)
+
+        # Write to SQLite
+        df.to_sql(table_name, conn, if_exists="replace", index=False)
+
+def create_fts_index(conn):
+    # --- Create FTS5 virtual table for Food descriptions ---
+    print("Creating FTS5 index...")
+    cursor = conn.cursor()
+
+    # Add normalized_description column
+    cursor.execute("ALTER TABLE sr_legacy_food ADD COLUMN normalized_description TEXT;")
+
+    cursor.execute("SELECT fdc_id, description FROM sr_legacy_food WHERE description IS NOT NULL;")
+    rows = cursor.fetchall()
+
+    for fdc_id, desc in rows:
+        norm = normalize_text(desc)
+        cursor.execute(
+            "UPDATE sr_legacy_food SET normalized_description = ? WHERE fdc_id = ?",
+            (norm, fdc_id)
+        )
+
+    # Drop if exists (for rebuilds)
+    cursor.execute("DROP TABLE IF EXISTS food_search;")
+
+    # Create virtual FTS table linked to Food
+    cursor.execute("""
+        CREATE VIRTUAL TABLE food_search
+        USING fts5(description, data_type, content='');
+    """)
+
+    # cursor.execute("""
+    #     INSERT INTO food_search(rowid, description, data_type)
+    #     SELECT fdc_id, description, 'sr_legacy_food'
+    #     FROM sr_legacy_food
+    #     WHERE description IS NOT NULL;
+    # """)
+
+    cursor.execute("""
+        INSERT INTO food_search(rowid, description, data_type)
+        SELECT fdc_id, normalized_description, data_type
+        FROM sr_legacy_food
+        WHERE normalized_description IS NOT NULL AND data_type = ?;
+    """, (PRIMARY_DATASET,))
+
+def create_trigram_index(conn):
+    """
+    Trigram-tokenized FTS5 table over the normalized descriptions. Matching a
+    term's trigrams (db.search_service.trigram_query) finds descriptions that
+    share most of them, so misspellings are caught by an index lookup instead
+    of a fuzzy scan over every food. Safe to re-run on an existing food.db.
+    """
+    print("Creating trigram FTS5 index...")
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS food_search_trigram;")
+    cursor.execute("""
+        CREATE VIRTUAL TABLE food_search_trigram
+        USING fts5(description, tokenize='trigram', content='');
+    """)
+    # SR Legacy only, trigram OR queries over every branded food would be too broad to rank quickly
+    cursor.execute("""
+        INSERT INTO food_search_trigram(rowid, description)
+        SELECT fdc_id, normalized_description
+        FROM sr_legacy_food
+        WHERE normalized_description IS NOT NULL AND data_type = ?;
+    """, (PRIMARY_DATASET,))
+
+def create_lookup_indexes(conn):
+    """B-tree indexes for hydration by fdc_id and the exact/prefix match, which otherwise scan whole tables."""
+    print("Creating lookup indexes...")
+    cursor = conn.cursor()
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_food_fdc ON sr_legacy_food(fdc_id);")
+    # NOCASE so the case-insensitive LIKE prefix match in get_candidates can range scan it
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_food_description ON sr_legacy_food(data_type, description COLLATE NOCASE);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_food_portion_fdc ON sr_legacy_food_portion(fdc_id);")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sr_legacy_food_nutrient';")
+    if cursor.fetchone() is not None:
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_food_nutrient_fdc ON sr_legacy_food_nutrient(fdc_id);")
+
+CATEGORY_STATS = ("mean", "median", "p95", "max")
+
+def create_category_profiles(conn):
+    """
+    Per food_category_id summary of the 14 tracked nutrients (per 100 g, as
+    the app maps them) and of the default portion weight: mean, median, p95
+    and max over the category's foods, one row per category and stat.
+    """
+    from db.catalog import FoodCatalog
+    from helper import map_nutrients
+    from models.meal_analysis import AllNutrients
+
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS food_category_nutrients;")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'sr_legacy_food_nutrient';")
+    if cursor.fetchone() is None:
+        print("No sr_legacy_food_nutrient table, skipping category profiles")
+        return
+
+    print("Computing food category profiles...")
+    catalog = FoodCatalog(None)
+    catalog.load_foods(conn)
+    catalog.load_nutrients(conn)
+    catalog.load_portions(conn)
+
+    rows = []
+    for fdc_id, food in catalog.foods.items():
+        # Foods without nutrient rows would drag the averages towards zero
+        if pd.isna(food["food_category_id"]) or not catalog.nutrients.get(fdc_id):
+            continue
+        portions = catalog.portions.get(fdc_id)
+        rows.append({
+            "food_category_id": int(food["food_category_id"]),
+            "portion_grams": portions[0]["gram_weight"] if portions else None,
+            **map_nutrients(catalog.nutrients[fdc_id], food).model_dump(),
+        })
+
+    df = pd.DataFrame(rows, columns=["food_category_id", "portion_grams", *AllNutrients.model_fields])
+    df = df.astype({column: float for column in df.columns if column != "food_category_id"})
+    grouped = df.groupby("food_category_id")
+    frames = {
+        "mean": grouped.mean(),
+        "median": grouped.median(),
+        "p95": grouped.quantile(0.95),
+        "max": grouped.max(),
+    }
+    profiles = pd.concat([frames[stat].assign(stat=stat) for stat in CATEGORY_STATS]).reset_index()
+    profiles["food_count"] = profiles["food_category_id"].map(grouped.size())
+    profiles = profiles[["food_category_id", "stat", "food_count", "portion_grams", *AllNutrients.model_fields]].round(4)
+
+    profiles.to_sql("food_category_nutrients", conn, if_exists="replace", index=False)
+    cursor.execute("CREATE UNIQUE INDEX idx_food_category_nutrients ON food_category_nutrients(food_category_id, stat);")
+    print(f"Stored profiles for {profiles['food_category_id'].nunique()} food categories")
+
+def build_database(db_path=DB_PATH, data_dir=DATA_DIR, fdc_dir=None, datasets=()):
+    # Remove old DB if you want a fresh build
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    # Connect (or create) SQLite database
+    conn = sqlite3.connect(db_path)
+
+    # List of CSV files (adjust path)
+    csv_files = glob.glob(os.path.join(data_dir, "*.csv"))
+    import_csv_files(conn, csv_files)
+    create_fts_index(conn)
+    if fdc_dir and datasets:
+        ingest_datasets(conn, fdc_dir, datasets)
+    create_trigram_index(conn)
+    create_lookup_indexes(conn)
+    create_category_profiles(conn)
+
+    # print("First 5 rows of sr_legacy_food:")
+    # cursor.execute("SELECT * FROM sr_legacy_food LIMIT 5;")
+    # rows = cursor.fetchall()
+    # for row in rows:
+    #     print(row)
+
+    conn.commit()
+    conn.close()
+    print("Database with FTS5 created successfully!")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build food.db")
+    parser.add_argument("step", nargs="?", choices=["trigram"], help="Only add this index to an existing food.db.")
+    parser.add_argument("--fdc-dir", help="Unzipped FoodData Central full download, for --datasets.")
+    parser.add_argument("--datasets", default="", help=f"Comma separated extra data types: {', '.join(EXTRA_DATASETS)}.")
+    args = parser.parse_args()
+
+    if args.step == "trigram":
+        conn = sqlite3.connect(DB_PATH)
+        create_trigram_index(conn)
+        create_lookup_indexes(conn)
+        conn.commit()
+        conn.close()
+    else:
+        datasets = [d.strip() for d in args.datasets.split(",") if d.strip()]
+        if datasets and not args.fdc_dir:
+            parser.error("--datasets needs --fdc-dir")
+        build_database(fdc_dir=args.fdc_dir, datasets=datasets)
@@ -0,0 +1,123 @@
+import os
+
+# Extra FoodData Central datasets on top of SR Legacy. Download the "Full
+# Download of All Data Types" CSVs, unzip them and list the data types to add:
+# python -m db.database --fdc-dir ~/FoodData_Central_csv --datasets foundation_food,branded_food
+#
+# The extra foods go into the same tables as SR Legacy (sr_legacy_food and its
+# _portion/_nutrient tables), tagged with their data_type, so hydration works
+# the same for every food. The CSVs are streamed in chunks, so memory stays
+# flat however many foods there are. Only portions and tracked nutrients of
+# the selected foods are kept. Each extra dataset gets its own FTS table
+# (food_search_<data_type>); see db.search_service for how they are searched.
+# pandas is imported in the build functions only, search imports this module.
+
+PRIMARY_DATASET = "sr_legacy_food"
+EXTRA_DATASETS = ("foundation_food", "branded_food")
+CHUNK_SIZE = int(os.getenv("FDC_CHUNK_SIZE", "100000"))
+
+FOOD_COLUMNS = ["fdc_id", "data_type", "description", "food_category_id", "publication_date"]
+PORTION_COLUMNS = ["id", "fdc_id", "seq_num", "amount", "measure_unit_id", "portion_description", "modifier", "gram_weight"]
+NUTRIENT_COLUMNS = ["id", "fdc_id", "nutrient_id", "amount"]
+BRANDED_COLUMNS = ["fdc_id", "serving_size", "serving_size_unit", "household_serving_fulltext"]
+
+# Branded serving sizes come in grams or millilitres, the latter taken as grams
+GRAM_UNITS = {"g", "grm", "ml", "mlt"}
+
+def fts_table(data_type):
+    return "food_search" if data_type == PRIMARY_DATASET else f"food_search_{data_type}"
+
+def read_chunks(path, columns):
+    import pandas as pd
+    return pd.read_csv(path, usecols=lambda column: column in columns, chunksize=CHUNK_SIZE, low_memory=False)
+
+def append(conn, table, frame):
+    if len(frame):
+        frame.to_sql(table, conn, if_exists="append", index=False, chunksize=10_000)
+
+# --------------------------------------------------------------------------------
+# Ingestion
+# --------------------------------------------------------------------------------
+
+def ingest_foods(conn, fdc_dir, datasets) -> set:
+    """Append the datasets' rows of food.csv to sr_legacy_food; returns their fdc_ids."""
+    from db.database import normalize_text
+
+    fdc_ids = set()
+    for chunk in read_chunks(os.path.join(fdc_dir, "food.csv"), FOOD_COLUMNS):
+        chunk = chunk[chunk["data_type"].isin(datasets) & chunk["description"].notna()].copy()
+        chunk["normalized_description"] = chunk["description"].map(normalize_text)
+        append(conn, "sr_legacy_food", chunk)
+        fdc_ids.update(chunk["fdc_id"].tolist())
+        print(f"  foods: {len(fdc_ids)}")
+    return fdc_ids
+
+def ingest_portions(conn, fdc_dir, fdc_ids):
+    import pandas as pd
+    path = os.path.join(fdc_dir, "food_portion.csv")
+    if os.path.exists(path):
+        for chunk in read_chunks(path, PORTION_COLUMNS):
+            chunk = chunk[chunk["fdc_id"].isin(fdc_ids) & (chunk["gram_weight"] > 0)].copy()
+            # Foundation portions often only have a portion_description ("1 cup")
+            chunk["modifier"] = chunk["modifier"].fillna(chunk["portion_description"])
+            chunk["portion_description"] = None
+            append(conn, "sr_legacy_food_portion", chunk)
+
+    # Branded foods have no portion rows, their label serving becomes one
+    path = os.path.join(fdc_dir, "branded_food.csv")
+    if os.path.exists(path):
+        for chunk in read_chunks(path, BRANDED_COLUMNS):
+            chunk = chunk[
+                chunk["fdc_id"].isin(fdc_ids)
+                & chunk["serving_size_unit"].str.lower().isin(GRAM_UNITS)
+                & (chunk["serving_size"] > 0)
+            ]
+            append(conn, "sr_legacy_food_portion", pd.DataFrame({
+                # Negative ids can't collide with FDC's own portion ids
+                "id": -chunk["fdc_id"],
+                "fdc_id": chunk["fdc_id"],
+                "seq_num": 1,
+                "amount": 1.0,
+                "modifier": chunk["household_serving_fulltext"].fillna("serving"),
+                "gram_weight": chunk["serving_size"],
+            }))
+
+def ingest_nutrients(conn, fdc_dir, fdc_ids):
+    """Only the tracked nutrients are kept; food_nutrient.csv is tens of millions of rows."""
+    from db.catalog import TRACKED_NUTRIENT_NUMBERS
+
+    placeholders = ",".join("?" * len(TRACKED_NUTRIENT_NUMBERS))
+    nutrient_ids = {row[0] for row in conn.execute(
+        f"SELECT id FROM sr_legacy_nutrient WHERE CAST(nutrient_nbr AS INTEGER) IN ({placeholders})",
+        TRACKED_NUTRIENT_NUMBERS
+    )}
+    for chunk in read_chunks(os.path.join(fdc_dir, "food_nutrient.csv"), NUTRIENT_COLUMNS):
+        append(conn, "sr_legacy_food_nutrient", chunk[chunk["fdc_id"].isin(fdc_ids) & chunk["nutrient_id"].isin(nutrient_ids)])
+
+def create_dataset_fts(conn, data_type):
+    table = fts_table(data_type)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {table};")
+    cursor.execute(f"CREATE VIRTUAL TABLE {table} USING fts5(description, data_type, content='');")
+    cursor.execute(f"""
+        INSERT INTO {table}(rowid, description, data_type)
+        SELECT fdc_id, normalized_description, data_type
+        FROM sr_legacy_food
+        WHERE data_type = ? AND normalized_description IS NOT NULL;
+    """, (data_type,))
+
+def ingest_datasets(conn, fdc_dir, datasets):
+    datasets = [d for d in datasets if d != PRIMARY_DATASET]
+    unknown = set(datasets) - set(EXTRA_DATASETS)
+    if unknown:
+        raise ValueError(f"Unknown datasets {sorted(unknown)}, expected some of {EXTRA_DATASETS}")
+    if not datasets:
+        return
+
+    print(f"Ingesting {', '.join(datasets)} from {fdc_dir}...")
+    fdc_ids = ingest_foods(conn, fdc_dir, datasets)
+    ingest_portions(conn, fdc_dir, fdc_ids)
+    ingest_nutrients(conn, fdc_dir, fdc_ids)
+    for data_type in datasets:
+        create_dataset_fts(conn, data_type)
+    conn.commit()
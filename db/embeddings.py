@@ -1,20 +1,28 @@
 import sqlite3
 import json
-from openai import OpenAI
 from itertools import islice
 import os
-from dotenv import load_dotenv
 import numpy as np
 import re
 import time
 from openai import RateLimitError, APIError
+from openai_client import get_openai_client
 
-DB_PATH = "../food.db"
+DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "food.db")
 BATCH_SIZE = 100
 MODEL = "text-embedding-3-small"
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Compressed copies of the embeddings the catalog keeps in memory for a coarse
+# scoring pass (see db/search_service.candidate_similarities). The top
+# candidates are rescored at full precision. text-embedding-3 models are
+# trained Matryoshka-style, so the first 256 or 512 dims, renormalized, are an
+# embedding in their own right. int8 stores every dim as a signed byte plus one
+# float scale per food. Both are off by default.
+EMBEDDING_DIMS = int(os.getenv("EMBEDDING_DIMS", "0"))  # 0 keeps every dim
+EMBEDDING_QUANTIZATION = os.getenv("EMBEDDING_QUANTIZATION", "float32")  # float32 or int8
+
+# Build embeddings for food.db (from the repo root)
+# python -m db.embeddings
 
 def normalize_text(text):
     text = text.lower()
@@ -25,7 +33,7 @@ def normalize_text(text):
 def embed_with_retry(model, input_texts, retries=3, delay=5):
     for i in range(retries):
         try:
-            return client.embeddings.create(model=model, input=input_texts)
+            return get_openai_client().embeddings.create(model=model, input=input_texts)
         except (RateLimitError, APIError) as e:
             print(f"Retrying batch after error: {e}")
             time.sleep(delay * (i + 1))
@@ -36,6 +44,48 @@ def normalize_embedding(emb):
     norm = np.linalg.norm(arr)
     return (arr / norm).tolist()
 
+# --------------------------------------------------------------------------------
+# Compression
+# --------------------------------------------------------------------------------
+
+def compression_enabled():
+    return EMBEDDING_DIMS > 0 or EMBEDDING_QUANTIZATION == "int8"
+
+def compression_config():
+    return [EMBEDDING_DIMS, EMBEDDING_QUANTIZATION]
+
+def truncate_embeddings(matrix, dims):
+    """First `dims` columns of each row, renormalized to unit length."""
+    if not dims or dims >= matrix.shape[1]:
+        return matrix
+    truncated = np.array(matrix[:, :dims], dtype=np.float32)
+    norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return truncated / norms
+
+def quantize_int8(matrix):
+    """Symmetric per-row int8 quantization: matrix ~= codes * scales[:, None]."""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def compress_embeddings(matrix):
+    """(coarse vectors, per-row scales or None) for EMBEDDING_DIMS / EMBEDDING_QUANTIZATION."""
+    coarse = truncate_embeddings(matrix, EMBEDDING_DIMS)
+    if EMBEDDING_QUANTIZATION == "int8":
+        return quantize_int8(coarse)
+    return np.array(coarse, dtype=np.float32), None
+
+def coarse_scores(query_emb, coarse, scales):
+    """Approximate cosine similarity of the query to each coarse row (rows were unit length before compressing)."""
+    query = truncate_embeddings(np.asarray(query_emb, dtype=np.float32)[None, :], coarse.shape[1])[0]
+    query = query / (np.linalg.norm(query) or 1.0)
+    scores = coarse.astype(np.float32) @ query
+    if scales is not None:
+        scores *= scales
+    return scores
+
 def get_batches(iterable, batch_size):
     """Yield successive batch_size chunks from iterable"""
     it = iter(iterable)
@@ -45,8 +95,8 @@ def get_batches(iterable, batch_size):
             break
         yield batch
 
-def build_embeddings():
-    conn = sqlite3.connect(DB_PATH)
+def build_embeddings(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
     # Drop old table if exists
@@ -68,8 +118,9 @@ def build_embeddings():
     #     FROM sr_legacy_food
     #     WHERE description IS NOT NULL;
     # """)
+    # Every loaded dataset (see db/datasets.py), keyed by its real data_type
     cursor.execute("""
-        SELECT fdc_id, normalized_description, 'sr_legacy_food' AS data_type
+        SELECT fdc_id, normalized_description, data_type
         FROM sr_legacy_food
         WHERE normalized_description IS NOT NULL;
     """)
@@ -1,26 +1,66 @@
 from rapidfuzz import process, fuzz
 import os
-from dotenv import load_dotenv
-from openai import OpenAI
 import numpy as np
 import json
 import re
+import logging
+import sqlite3
+from tracing import span, timed, log_event
+from singleflight import SingleFlight
+from batching import MicroBatcher
+from db.catalog import get_catalog
+from db.datasets import PRIMARY_DATASET, fts_table
+from db.embeddings import coarse_scores
+from openai_client import get_openai_client, call_openai
 
 DB_PATH = os.getenv("DB_PATH", "../food.db")
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Datasets searched, see db/datasets.py. SR Legacy gets the exact/prefix,
+# trigram and fuzzy searches; each extra dataset adds up to EXTRA_DATASET_LIMIT
+# word FTS matches from its own partition, so a few hundred thousand branded
+# foods don't crowd out or slow down the SR Legacy candidates.
+SEARCH_DATASETS = [d.strip() for d in os.getenv("SEARCH_DATASETS", PRIMARY_DATASET).split(",") if d.strip()]
+EXTRA_DATASET_LIMIT = int(os.getenv("EXTRA_DATASET_LIMIT", "10"))
+
+# The rapidfuzz scan over every food only runs when the FTS and trigram
+# searches together come back with fewer candidates than this
+FUZZY_FALLBACK_MIN = int(os.getenv("FUZZY_FALLBACK_MIN", "5"))
+TRIGRAM_MAX_TERMS = 32
+
+# With compressed embeddings (db/embeddings.py) this many candidates of the
+# coarse pass are rescored at full precision; 0 ranks on the coarse scores alone
+EMBEDDING_RESCORE_TOP = int(os.getenv("EMBEDDING_RESCORE_TOP", "10"))
+
+# Search terms from concurrent requests are embedded together: one API call per
+# EMBED_BATCH_WINDOW_MS (or EMBED_BATCH_MAX terms) while another call is in
+# flight. EMBED_BATCH_WINDOW_MS=0 sends every term on its own.
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_BATCH_MAX = int(os.getenv("EMBED_BATCH_MAX", "64"))
+
+# Lexical rerank: a term word counts as found in a description when a word
+# there starts with it (or it with that word), or they're this fuzz.ratio
+# alike ("brocoli", "broccoli"). Words like "and" don't count either way.
+LEXICAL_WORD_MATCH = 80
+LEXICAL_STOPWORDS = {"a", "an", "and", "the", "of", "with", "in", "on"}
 
 # --------------------------------------------------------------------------------
 # Rank based on embeddings
 # --------------------------------------------------------------------------------
 
-def get_embedding(text):
-    resp = client.embeddings.create(
+embedding_flight = SingleFlight("embedding")
+
+def embed_texts(texts):
+    resp = call_openai(
+        "embedding", get_openai_client().embeddings.create,
         model="text-embedding-3-small",
-        input=text
+        input=texts
     )
-    return np.array(resp.data[0].embedding)
+    return [np.array(d.embedding, dtype=np.float32) for d in sorted(resp.data, key=lambda d: d.index)]
+
+embedding_batcher = MicroBatcher("embedding", embed_texts, EMBED_BATCH_WINDOW_MS, EMBED_BATCH_MAX)
+
+def get_embedding(text):
+    return embedding_batcher.submit(text)
 
 def load_embedding(emb_json):
     """Convert JSON string to NumPy array."""
@@ -29,25 +69,72 @@ def load_embedding(emb_json):
 def cosine_similarity(a, b):
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
-def rerank_with_embeddings(term, candidates, conn, top_k=5):
-    model = "text-embedding-3-small"
+def candidate_similarities(query_emb, candidates, conn):
+    """Cosine similarity per (fdc_id, data_type) for candidates that have a stored embedding."""
+    keys = [(c["fdc_id"], c["data_type"]) for c in candidates]
 
-    # Embed the search term
-    query_emb = np.array(client.embeddings.create(model=model, input=term).data[0].embedding, dtype=np.float32)
+    sims = {}
+    catalog = get_catalog()
+    if catalog is not None and catalog.embedding_coarse is not None:
+        found, coarse, scales = catalog.get_coarse_embeddings(keys)
+        if found:
+            scores = coarse_scores(query_emb, coarse, scales)
+            if EMBEDDING_RESCORE_TOP <= 0:
+                sims = dict(zip(found, scores.tolist()))
+            else:
+                top = [found[i] for i in np.argsort(-scores, kind="stable")[:EMBEDDING_RESCORE_TOP]]
+                sims = full_similarities(query_emb, top, catalog, conn)
+        keys = [key for key in keys if key not in found and key[1] not in catalog.datasets]
+    elif catalog is not None and catalog.embedding_matrix is not None:
+        sims = full_similarities(query_emb, keys, catalog, conn)
+        # Foods of datasets the catalog doesn't hold are looked up below
+        keys = [key for key in keys if key not in sims and key[1] not in catalog.datasets]
 
-    cursor = conn.cursor()
-    scored = []
+    sims.update(stored_similarities(query_emb, keys, conn))
+    return sims
 
-    for c in candidates:
+def full_similarities(query_emb, keys, catalog, conn):
+    """Full-precision similarities from the catalog's matrix, or from SQLite when it only holds compressed rows."""
+    if catalog.embedding_matrix is None:
+        return stored_similarities(query_emb, keys, conn)
+    found, matrix = catalog.get_embeddings(keys)
+    if matrix is None:
+        return {}
+    scores = (matrix @ query_emb) / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_emb))
+    return dict(zip(found, scores.tolist()))
+
+def stored_similarities(query_emb, keys, conn):
+    sims = {}
+    cursor = conn.cursor()
+    for key in keys:
         cursor.execute("""
             SELECT embedding FROM food_embeddings
             WHERE fdc_id = ? AND data_type = ?
-        """, (c["fdc_id"], c["data_type"]))
+        """, key)
         row = cursor.fetchone()
         if row:
-            emb = load_embedding(row[0])
-            sim = cosine_similarity(query_emb, emb)
+            sims[key] = cosine_similarity(query_emb, load_embedding(row[0]))
+    return sims
+
+@timed("rerank")
+def rerank_with_embeddings(term, candidates, conn, top_k=5):
+    # Embed the search term
+    try:
+        with span("embedding"):
+            query_emb = embedding_flight.do(term, get_embedding, term)
+    except Exception as e:
+        # Upstream down or circuit open, rank on the text alone. Lexical scores
+        # aren't calibrated like cosine similarity, so matches are flagged as
+        # degraded and search_food returns them as estimates.
+        log_event("embedding_failed", level=logging.WARNING, term=term, error=str(e))
+        return [{**c, "degraded": True} for c in rerank_lexical(term, candidates, top_k)]
+
+    sims = candidate_similarities(query_emb, candidates, conn)
+    scored = []
 
+    for c in candidates:
+        sim = sims.get((c["fdc_id"], c["data_type"]))
+        if sim is not None:
             desc = c["description"].lower()
 
             # 🔻 Penalize "raw" foods if user didn't ask for "raw"
@@ -67,33 +154,95 @@ def rerank_with_embeddings(term, candidates, conn, top_k=5):
     ranked = sorted(scored, key=lambda x: x["similarity"], reverse=True)
     return ranked[:top_k]
 
+def words(text):
+    return [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in LEXICAL_STOPWORDS]
+
+def word_found(word, desc_words):
+    for d in desc_words:
+        if d.startswith(word) or (len(d) >= 3 and word.startswith(d)) or fuzz.ratio(word, d) >= LEXICAL_WORD_MATCH:
+            return True
+    return False
+
+def term_coverage(term_words, desc):
+    """Share of the term's words found in desc, 0 when none are."""
+    if not term_words:
+        return 0.0
+    desc_words = words(desc)
+    return sum(word_found(w, desc_words) for w in term_words) / len(term_words)
+
+def rerank_lexical(term, candidates, top_k=5):
+    """
+    Rank candidates by string similarity, scaled by how much of the term the
+    description covers. WRatio alone gives a partial match of unrelated words
+    0.5-0.65 ("zzzz": "Sauce, pizza"), which would clear the thresholds tuned
+    for embedding similarity; with no word of the term in the description the
+    score is 0, and each word missing takes off up to half of it (modifiers
+    like "steamed" or "sliced" often aren't in the description).
+    """
+    term_words = words(term)
+    scored = []
+    for c in candidates:
+        desc = c["description"].lower()
+        raw_penalty = -0.15 if "raw" in desc and "raw" not in term else 0.0
+        coverage = term_coverage(term_words, desc)
+        similarity = fuzz.WRatio(term, desc) / 100 * (0.5 + 0.5 * coverage) + raw_penalty if coverage else 0.0
+        # WRatio scores every description that contains the term alike ("egg": "Egg noodles",
+        # "Eggs, boiled"), so ties go to the one whose leading name is closest to the term
+        head = fuzz.ratio(term, desc.split(",", 1)[0])
+        scored.append(((round(similarity, 4), head), {
+            "fdc_id": c["fdc_id"],
+            "data_type": c["data_type"],
+            "description": c["description"],
+            "similarity": similarity
+        }))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [c for _, c in scored[:top_k]]
+
 # --------------------------------------------------------------------------------
 # Combine results from full textsearach and fuzzy search
 # --------------------------------------------------------------------------------
 
+@timed("candidates")
 def get_candidates(term, conn):
     cursor = conn.cursor()
     term_norm = term.lower().strip()
 
-    # Step 1: exact or prefix matches (highest priority)
-    exact_prefix_matches = cursor.execute("""
-        SELECT fdc_id, 'sr_legacy_food' AS data_type, description
-        FROM sr_legacy_food
-        WHERE LOWER(description) = ?
-           OR LOWER(description) LIKE ? || '%'
-        LIMIT 10
-    """, (term_norm, term_norm)).fetchall()
+    # Step 1: exact or prefix matches (highest priority). LIKE is case-insensitive
+    # and, with a literal prefix, a range scan on idx_food_description.
+    with span("exact_prefix"):
+        prefix = term_norm.replace("%", "").replace("_", "") + "%"
+        exact_prefix_matches = cursor.execute("""
+            SELECT fdc_id, data_type, description
+            FROM sr_legacy_food
+            WHERE data_type = ? AND description LIKE ?
+            LIMIT 10
+        """, (PRIMARY_DATASET, prefix)).fetchall()
 
     if exact_prefix_matches:
         return [{"fdc_id": r[0], "data_type": r[1], "description": r[2]} for r in exact_prefix_matches]
 
-    # Step 2: fallback to FTS + fuzzy
-    fts_results = fts_search(term, conn, limit=20)
-    fuzzy_results = fuzzy_search(term, conn, limit=20)
+    # Step 2: fallback to FTS + trigram (+ fuzzy)
+    return text_search(term, conn, limit=20)
+
+def text_search(term, conn, limit=20):
+    """
+    Word FTS plus trigram FTS matches, deduplicated. The full fuzzy scan is
+    only added when those find fewer than FUZZY_FALLBACK_MIN foods (or the
+    database has no trigram index yet).
+    """
+    results = fts_search(term, conn, limit=limit)
+    trigram_results = trigram_search(term, conn, limit=limit)
+    results += trigram_results or []
+
+    candidates = dedupe(results)
+    if trigram_results is None or len(candidates) < FUZZY_FALLBACK_MIN:
+        candidates = dedupe(results + fuzzy_search(term, conn, limit=limit))
+    return candidates
 
+def dedupe(results):
     seen = set()
     candidates = []
-    for fdc_id, data_type, description in fts_results + fuzzy_results:
+    for fdc_id, data_type, description in results:
         key = (fdc_id, data_type)
         if key not in seen:
             candidates.append({"fdc_id": fdc_id, "data_type": data_type, "description": description})
@@ -104,10 +253,20 @@ def get_candidates(term, conn):
 # Fuzzy search
 # --------------------------------------------------------------------------------
 
+@timed("fuzzy")
 def fuzzy_search(term, conn, limit=20):
+    catalog = get_catalog()
+    if catalog is not None:
+        results = process.extract(term, catalog.fuzzy_choices, scorer=fuzz.token_sort_ratio, limit=limit)
+        output = []
+        for desc, score, index in results:
+            food = catalog.foods[catalog.fuzzy_ids[index]]
+            output.append((food["fdc_id"], food["data_type"], food["description"]))
+        return output
+
     cursor = conn.cursor()
     # cursor.execute("SELECT fdc_id, description, 'sr_legacy_food' AS data_type FROM sr_legacy_food WHERE description IS NOT NULL")
-    cursor.execute("SELECT fdc_id, normalized_description, 'sr_legacy_food' AS data_type FROM sr_legacy_food WHERE normalized_description IS NOT NULL")
+    cursor.execute("SELECT fdc_id, normalized_description, data_type FROM sr_legacy_food WHERE normalized_description IS NOT NULL AND data_type = ?", (PRIMARY_DATASET,))
     sr_legacy_rows = cursor.fetchall()
 
     all_rows = sr_legacy_rows
@@ -118,7 +277,7 @@ def fuzzy_search(term, conn, limit=20):
     output = []
     for desc, score, rowid in results:
         cursor.execute("""
-            SELECT fdc_id, 'sr_legacy_food' AS data_type, description FROM sr_legacy_food WHERE fdc_id = ?
+            SELECT fdc_id, data_type, description FROM sr_legacy_food WHERE fdc_id = ?
         """, (rowid,))
         row = cursor.fetchone()
         if row:
@@ -129,20 +288,96 @@ def fuzzy_search(term, conn, limit=20):
 # Full text search
 # ----------------------------------------
 
-def fts_search(term, conn, limit=20):
-    cursor = conn.cursor()
-    cursor.execute("""
-        WITH fts_results AS (
-            SELECT rowid AS fdc_id, bm25(food_search) AS score
-            FROM food_search
-            WHERE food_search MATCH ?
+def query_words(term):
+    return re.findall(r"[a-z0-9]+", term.lower())
+
+def fts_query(term):
+    """
+    MATCH expression for food_search: every word as a quoted prefix, so user
+    input can't inject FTS syntax ("AND", "-", ":", unbalanced quotes).
+    None if the term has no searchable words.
+    """
+    words = query_words(term)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+def trigram_query(term):
+    """
+    MATCH expression for food_search_trigram: the term's distinct trigrams
+    OR'ed together, so descriptions sharing most of them rank first even when
+    a few are misspelled. None if the term has no word of 3+ characters.
+    """
+    trigrams = []
+    for word in query_words(term):
+        for i in range(len(word) - 2):
+            trigram = word[i:i + 3]
+            if trigram not in trigrams:
+                trigrams.append(trigram)
+    if not trigrams:
+        return None
+    return " OR ".join(f'"{trigram}"' for trigram in trigrams[:TRIGRAM_MAX_TERMS])
+
+@timed("trigram")
+def trigram_search(term, conn, limit=20):
+    """
+    Typo tolerant search on the trigram index. bm25 picks a shortlist and
+    rapidfuzz orders just that. None if the database has no trigram index.
+    """
+    query = trigram_query(term)
+    if query is None:
+        return []
+    try:
+        fdc_ids = [row[0] for row in conn.execute("""
+            SELECT rowid, bm25(food_search_trigram) AS score
+            FROM food_search_trigram
+            WHERE food_search_trigram MATCH ?
+            ORDER BY score
             LIMIT ?
-        )
-        SELECT fts_results.fdc_id, f.data_type, f.description
-        FROM fts_results
-        JOIN (
-            SELECT fdc_id, 'sr_legacy_food' AS data_type, description FROM sr_legacy_food
-        ) AS f ON f.fdc_id = fts_results.fdc_id
-        ORDER BY fts_results.score;
-    """, (term, limit))
-    return cursor.fetchall()
+        """, (query, limit * 3))]
+    except sqlite3.OperationalError:
+        return None
+
+    rows = describe(conn, fdc_ids)
+    scored = sorted(rows, key=lambda row: fuzz.token_sort_ratio(term, row[3] or ""), reverse=True)
+    return [row[:3] for row in scored[:limit]]
+
+@timed("fts")
+def fts_search(term, conn, limit=20):
+    """Word FTS over SR Legacy plus the partitions of the other SEARCH_DATASETS, best bm25 first within each."""
+    query = fts_query(term)
+    if query is None:
+        return []
+    rows = []
+    for data_type in SEARCH_DATASETS:
+        table = fts_table(data_type)
+        try:
+            fdc_ids = [row[0] for row in conn.execute(f"""
+                SELECT rowid, bm25({table}) AS score
+                FROM {table}
+                WHERE {table} MATCH ?
+                ORDER BY score
+                LIMIT ?
+            """, (query, limit if data_type == PRIMARY_DATASET else EXTRA_DATASET_LIMIT))]
+        except sqlite3.OperationalError:
+            continue  # dataset not loaded into this food.db
+        rows += [row[:3] for row in describe(conn, fdc_ids)]
+    return rows
+
+def describe(conn, fdc_ids):
+    """(fdc_id, data_type, description, normalized_description) for fdc_ids, in the same order."""
+    catalog = get_catalog()
+    found = {}
+    if catalog is not None:
+        for fdc_id in fdc_ids:
+            food = catalog.foods.get(fdc_id)
+            if food is not None:
+                found[fdc_id] = (fdc_id, food["data_type"], food["description"], food["normalized_description"])
+    missing = [fdc_id for fdc_id in fdc_ids if fdc_id not in found]
+    if missing:
+        for row in conn.execute(f"""
+            SELECT fdc_id, data_type, description, normalized_description
+            FROM sr_legacy_food WHERE fdc_id IN ({",".join("?" * len(missing))})
+        """, missing):
+            found[row[0]] = row
+    return [found[fdc_id] for fdc_id in fdc_ids if fdc_id in found]
@@ -0,0 +1,334 @@
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+from db.catalog import FoodCatalog, get_catalog, set_catalog, live_catalog, retired_catalogs
+from tracing import log_event
+
+# Versioned food.db snapshots with hot reload.
+#
+# With DB_SNAPSHOT_DIR set, the server never serves DB_PATH itself. Each
+# published database is copied to DB_SNAPSHOT_DIR/food-<version>.db, checked,
+# and named live by the CURRENT file (replaced atomically). On startup DB_PATH
+# is published as the first snapshot if there is none yet.
+#
+# A reload loads the new snapshot and everything derived from it (catalog,
+# fuzzy index, embeddings, category profiles), warms SQLite, and only then
+# swaps the live catalog in one assignment. Each request is pinned to the
+# catalog that was live when it started (db.catalog.pin_catalog), so in-flight
+# requests finish on the old version. Old snapshot files are deleted once
+# they're past DB_SNAPSHOT_KEEP and no request is pinned to them.
+#
+# Publish a new food.db (on the Render shell), the watcher picks it up:
+# curl -L -o /var/data/food.new.db "https://dropboxlink.com"
+# python -m db.snapshots publish /var/data/food.new.db
+#
+# Or reload right away: POST /admin/snapshots/reload (X-Admin-Token)
+# python -m db.snapshots list
+#
+# Without DB_SNAPSHOT_DIR a reload rebuilds the in-memory indexes from DB_PATH
+# in place; the file itself is not versioned, so overwrite it with care.
+
+DB_PATH = os.getenv("DB_PATH", "food.db")
+DB_SNAPSHOT_DIR = os.getenv("DB_SNAPSHOT_DIR")
+DB_SNAPSHOT_KEEP = max(2, int(os.getenv("DB_SNAPSHOT_KEEP", "3")))
+# Seconds between checks for a new CURRENT (or a changed DB_PATH); 0 turns the watcher off
+DB_WATCH_INTERVAL_S = float(os.getenv("DB_WATCH_INTERVAL_S", "30"))
+
+REQUIRED_TABLES = ("sr_legacy_food", "sr_legacy_food_nutrient", "sr_legacy_food_portion", "food_search")
+
+class SnapshotError(Exception):
+    pass
+
+# --------------------------------------------------------------------------------
+# Snapshot files
+# --------------------------------------------------------------------------------
+
+def snapshot_path(snapshot_dir, version):
+    return os.path.join(snapshot_dir, f"food-{version}.db")
+
+def list_versions(snapshot_dir):
+    if not snapshot_dir or not os.path.isdir(snapshot_dir):
+        return []
+    return sorted(
+        name[len("food-"):-len(".db")] for name in os.listdir(snapshot_dir)
+        if name.startswith("food-") and name.endswith(".db")
+    )
+
+def read_current(snapshot_dir):
+    try:
+        with open(os.path.join(snapshot_dir, "CURRENT")) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def write_current(snapshot_dir, version):
+    tmp = os.path.join(snapshot_dir, "CURRENT.tmp")
+    with open(tmp, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(snapshot_dir, "CURRENT"))
+
+def file_signature(path):
+    """(mtime, size) of a file, None if it doesn't exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def validate(db_path, full=False):
+    """Raise SnapshotError if db_path isn't a usable food.db. full=True also runs PRAGMA quick_check."""
+    if not os.path.exists(db_path):
+        raise SnapshotError(f"{db_path} does not exist")
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        missing = [table for table in REQUIRED_TABLES if table not in tables]
+        if missing:
+            raise SnapshotError(f"{db_path} is missing tables {missing}")
+        if conn.execute("SELECT 1 FROM sr_legacy_food LIMIT 1").fetchone() is None:
+            raise SnapshotError(f"{db_path} has no foods")
+        if full:
+            result = conn.execute("PRAGMA quick_check").fetchone()[0]
+            if result != "ok":
+                raise SnapshotError(f"{db_path} failed quick_check: {result}")
+    except sqlite3.DatabaseError as e:
+        raise SnapshotError(f"{db_path} is not a valid database: {e}")
+    finally:
+        conn.close()
+
+def publish(src, snapshot_dir, make_current=True) -> str:
+    """Copy src into snapshot_dir as a new version, check it and (by default) make it CURRENT. Returns the version."""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    version = time.strftime("%Y%m%dT%H%M%S")
+    existing = set(list_versions(snapshot_dir))
+    suffix = 1
+    while version in existing:
+        version = f"{time.strftime('%Y%m%dT%H%M%S')}-{suffix}"
+        suffix += 1
+
+    tmp = os.path.join(snapshot_dir, f".food-{version}.db.tmp")
+    try:
+        shutil.copyfile(src, tmp)
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        # A half-finished upload fails here rather than after the swap
+        validate(tmp, full=True)
+        os.replace(tmp, snapshot_path(snapshot_dir, version))
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    if make_current:
+        write_current(snapshot_dir, version)
+    log_event("snapshot_published", version=version, source=src, current=make_current)
+    return version
+
+# --------------------------------------------------------------------------------
+# Live snapshot
+# --------------------------------------------------------------------------------
+
+class SnapshotManager:
+    def __init__(self, db_path=DB_PATH, snapshot_dir=DB_SNAPSHOT_DIR, keep=DB_SNAPSHOT_KEEP):
+        self.source_path = db_path
+        self.snapshot_dir = snapshot_dir
+        self.keep = keep
+        # Path served when no catalog is loaded (warmup off or still running)
+        self.db_path = db_path
+        self.version = None
+        self.source_signature = None
+        self.settling_signature = None
+        self.reload_lock = threading.Lock()
+        self.loading = None
+        self.last_reload = None
+        self.last_error = None
+        self.watch_task = None
+
+    @property
+    def enabled(self):
+        return bool(self.snapshot_dir)
+
+    def resolve(self, version=None):
+        """(db_path, version) to load: the given or CURRENT snapshot, or DB_PATH when snapshots are off."""
+        if not self.enabled:
+            signature = file_signature(self.source_path)
+            return self.source_path, f"{signature[0]}" if signature else None
+        version = version or read_current(self.snapshot_dir)
+        if version is None:
+            raise SnapshotError(f"No CURRENT snapshot in {self.snapshot_dir}")
+        if version not in list_versions(self.snapshot_dir):
+            raise SnapshotError(f"Unknown snapshot version {version}")
+        return snapshot_path(self.snapshot_dir, version), version
+
+    def startup(self):
+        """(db_path, version) to serve at startup, publishing DB_PATH first if there are no snapshots yet."""
+        self.source_signature = file_signature(self.source_path)
+        if self.enabled and read_current(self.snapshot_dir) is None:
+            publish(self.source_path, self.snapshot_dir)
+        self.db_path, self.version = self.resolve()
+        return self.db_path, self.version
+
+    def reload(self, version=None, source="admin"):
+        """
+        Load a snapshot and its derived indexes, then make it live. Blocking,
+        run it off the event loop. Raises SnapshotError if another reload is
+        running or the snapshot is unusable; the live catalog is untouched then.
+        """
+        from warmup import warm_page_cache, warm_sqlite, catalog_loaded
+
+        if not self.reload_lock.acquire(blocking=False):
+            raise SnapshotError(f"Already loading snapshot {self.loading}")
+        start = time.perf_counter()
+        try:
+            db_path, version = self.resolve(version)
+            self.loading = version
+            validate(db_path)
+            warm_page_cache(db_path)
+            catalog = FoodCatalog(db_path).load()
+            catalog.version = version
+            warm_sqlite(db_path)
+
+            previous = live_catalog()
+            set_catalog(catalog)
+            self.db_path, self.version = db_path, version
+            self.last_error = None
+            self.last_reload = {
+                "version": version,
+                "previous": getattr(previous, "version", None),
+                "source": source,
+                "finished_at": time.time(),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                "catalog": catalog.timings,
+            }
+            log_event("snapshot_swapped", **self.last_reload)
+            catalog_loaded(version)
+            self.prune()
+            return self.last_reload
+        except Exception as e:
+            self.last_error = {"version": version, "error": str(e), "at": time.time()}
+            log_event("snapshot_reload_failed", level=logging.WARNING, version=version, source=source, error=str(e))
+            raise
+        finally:
+            self.loading = None
+            self.reload_lock.release()
+
+    def prune(self):
+        """Delete old snapshot files past `keep` that no request is pinned to."""
+        if not self.enabled:
+            return
+        versions = list_versions(self.snapshot_dir)
+        pinned = {catalog.version for catalog in retired_catalogs()}
+        for version in versions[:-self.keep]:
+            if version == self.version or version in pinned:
+                continue
+            try:
+                path = snapshot_path(self.snapshot_dir, version)
+                os.remove(path)
+                # Its mapped catalog store, if CATALOG_STORE built one
+                shutil.rmtree(f"{path}.catalog", ignore_errors=True)
+                if os.path.exists(f"{path}.catalog.lock"):
+                    os.remove(f"{path}.catalog.lock")
+                log_event("snapshot_pruned", version=version)
+            except OSError as e:
+                log_event("snapshot_prune_failed", level=logging.WARNING, version=version, error=str(e))
+
+    # --------------------------------------------------------------------------------
+    # Watcher
+    # --------------------------------------------------------------------------------
+
+    def pending_change(self):
+        """
+        What the watcher should do: "reload" when CURRENT names another version,
+        "publish" when DB_PATH was overwritten and has stopped changing, else None.
+        """
+        if self.enabled and read_current(self.snapshot_dir) not in (None, self.version):
+            return "reload"
+        signature = file_signature(self.source_path)
+        if signature is None or signature == self.source_signature:
+            return None
+        # Still being written (curl -o food.db): wait for it to settle across two checks
+        if signature != self.settling_signature:
+            self.settling_signature = signature
+            return None
+        return "publish"
+
+    def apply_change(self, change):
+        if change == "publish":
+            self.source_signature = self.settling_signature
+            if self.enabled:
+                publish(self.source_path, self.snapshot_dir)
+        self.reload(source="watcher")
+
+    async def watch(self, interval=DB_WATCH_INTERVAL_S):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                change = self.pending_change()
+                if change is not None and self.loading is None:
+                    await asyncio.to_thread(self.apply_change, change)
+            except Exception as e:
+                log_event("snapshot_watch_failed", level=logging.WARNING, error=str(e))
+
+    def start_watcher(self):
+        if DB_WATCH_INTERVAL_S > 0 and self.watch_task is None:
+            self.watch_task = asyncio.create_task(self.watch())
+
+    def status(self):
+        catalog = live_catalog()
+        return {
+            "enabled": self.enabled,
+            "snapshot_dir": self.snapshot_dir,
+            "version": self.version,
+            "db_path": self.db_path,
+            "catalog_loaded": catalog is not None,
+            "loading": self.loading,
+            "last_reload": self.last_reload,
+            "last_error": self.last_error,
+            "available": list_versions(self.snapshot_dir),
+            # Replaced versions still held by requests (active) or background tasks
+            "retired": [{"version": c.version, "active": c.active} for c in retired_catalogs()],
+            "watch_interval_s": DB_WATCH_INTERVAL_S if self.watch_task is not None else 0,
+        }
+
+snapshots = SnapshotManager()
+
+def current_db_path():
+    """food.db path for this request: its pinned snapshot, else the live one."""
+    catalog = get_catalog()
+    return catalog.db_path if catalog is not None else snapshots.db_path
+
+# --------------------------------------------------------------------------------
+# CLI
+# --------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage versioned food.db snapshots.")
+    parser.add_argument("command", choices=["publish", "list", "use"])
+    parser.add_argument("path_or_version", nargs="?", help="Database to publish, or version to make CURRENT.")
+    parser.add_argument("--snapshot-dir", default=DB_SNAPSHOT_DIR)
+    parser.add_argument("--no-current", action="store_true", help="Publish without making it CURRENT.")
+    args = parser.parse_args()
+
+    if not args.snapshot_dir:
+        parser.error("Set DB_SNAPSHOT_DIR or pass --snapshot-dir")
+
+    if args.command == "publish":
+        if not args.path_or_version:
+            parser.error("publish needs the path of the new food.db")
+        print(publish(args.path_or_version, args.snapshot_dir, make_current=not args.no_current))
+    elif args.command == "use":
+        if args.path_or_version not in list_versions(args.snapshot_dir):
+            parser.error(f"Unknown version {args.path_or_version}")
+        write_current(args.snapshot_dir, args.path_or_version)
+        print(args.path_or_version)
+    else:
+        current = read_current(args.snapshot_dir)
+        for version in list_versions(args.snapshot_dir):
+            print(f"{'*' if version == current else ' '} {version}")
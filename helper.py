@@ -1,4 +1,8 @@
 from models.meal_analysis import AllNutrients, FoodPortion, AnalysisIngredient
+from tracing import timed
+from db.catalog import get_catalog
+from portions import portion_units
+import sqlite3
 
 # Calculate nutrients
 def calculate_protein(ingredients: list[AnalysisIngredient]) -> float:
@@ -161,32 +165,48 @@ def map_portions(portion_list: list[dict]) -> list[FoodPortion]:
 
     return portions
 
+# For foods without portions of their own
+DEFAULT_PORTIONS = [{
+    "id": 1,
+    "gram_weight": 100.0,
+    "amount": 100.0,
+    "modifier": "grams"
+}]
+
+@timed("db_portions")
 def get_portions(conn, fdc_id: str):
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT fp.id, fp.gram_weight, fp.amount, fp.modifier
-        FROM sr_legacy_food_portion fp
-        WHERE fp.fdc_id = ?
-    """, (fdc_id,))
-    portions = []
-    for row in cursor.fetchall():
-        portions.append({
-            "id": row[0],
-            "gram_weight": row[1],
-            "amount": row[2],
-            "modifier": row[3]
-        })
+    catalog = get_catalog()
+    if catalog is not None and fdc_id in catalog.foods:
+        portions = list(catalog.portions.get(fdc_id, []))
+    else:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT fp.id, fp.gram_weight, fp.amount, fp.modifier
+            FROM sr_legacy_food_portion fp
+            WHERE fp.fdc_id = ?
+        """, (fdc_id,))
+        portions = []
+        for row in cursor.fetchall():
+            portions.append({
+                "id": row[0],
+                "gram_weight": row[1],
+                "amount": row[2],
+                "modifier": row[3]
+            })
 
     if len(portions) < 1:
-        portions = [{
-            "id": 1,
-            "gram_weight": 100.0,
-            "amount": 100.0,
-            "modifier": "grams"
-        }]
+        portions = list(DEFAULT_PORTIONS)
 
     return portions
 
+@timed("db_portion_units")
+def get_portion_units(conn, fdc_id: int) -> dict:
+    """Grams per unit for each unit the food's portions answer to (see portions.portion_units)."""
+    catalog = get_catalog()
+    if catalog is not None and fdc_id in catalog.portion_units:
+        return catalog.portion_units[fdc_id]
+    return portion_units(get_portions(conn, fdc_id))
+
 def map_nutrients(nutrient_list: list[dict], food: dict) -> AllNutrients:
     # Start with all zeros
     nutrient_values = AllNutrients(
@@ -232,7 +252,30 @@ def map_nutrients(nutrient_list: list[dict], food: dict) -> AllNutrients:
 
     return nutrient_values
 
+@timed("db_food")
+def get_food(conn, fdc_id: int):
+    catalog = get_catalog()
+    if catalog is not None and fdc_id in catalog.foods:
+        return catalog.get_food(fdc_id)
+
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT fdc_id, data_type, description, fermented_food_serving_size, CAST(collagen AS REAL) AS collagen
+        FROM sr_legacy_food
+        WHERE fdc_id = ?
+    """, (fdc_id,))
+    food_row = cursor.fetchone()
+    if not food_row:
+        return None
+    colnames = [desc[0] for desc in cursor.description]
+    return dict(zip(colnames, food_row))
+
+@timed("db_nutrients")
 def get_nutrients(conn, fdc_id: str):
+    catalog = get_catalog()
+    if catalog is not None and fdc_id in catalog.foods:
+        return catalog.nutrients.get(fdc_id, [])
+
     cursor = conn.cursor()
     cursor.execute("""
         SELECT fn.id, fn.amount,
@@ -261,6 +304,71 @@ def get_nutrients(conn, fdc_id: str):
 
     return nutrients
 
+# --------------------------------------------------------------------------------
+# Food categories
+# --------------------------------------------------------------------------------
+
+def category_profile_from_row(row: dict) -> dict:
+    return {
+        "food_count": row["food_count"],
+        "portion_grams": row["portion_grams"],
+        "nutrients": AllNutrients(**{field: row[field] for field in AllNutrients.model_fields}),
+    }
+
+@timed("db_categories")
+def get_food_categories(conn, fdc_ids: list[int]) -> dict:
+    catalog = get_catalog()
+    categories = {}
+    if catalog is not None:
+        categories = {fdc_id: catalog.foods[fdc_id]["food_category_id"] for fdc_id in fdc_ids if fdc_id in catalog.foods}
+        fdc_ids = [fdc_id for fdc_id in fdc_ids if fdc_id not in catalog.foods]
+        if not fdc_ids:
+            return categories
+
+    placeholders = ",".join("?" * len(fdc_ids))
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT fdc_id, food_category_id FROM sr_legacy_food WHERE fdc_id IN ({placeholders})", fdc_ids)
+    return {**categories, **dict(cursor.fetchall())}
+
+@timed("db_category_profile")
+def get_category_profile(conn, category_id: int, stat: str = "mean") -> dict | None:
+    """
+    One precomputed stat (mean, median, p95, max) of a food category:
+    {"food_count", "portion_grams", "nutrients": AllNutrients}. None if the
+    category has no profile or food.db predates food_category_nutrients.
+    """
+    catalog = get_catalog()
+    if catalog is not None:
+        return catalog.category_profiles.get(category_id, {}).get(stat)
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT * FROM food_category_nutrients WHERE food_category_id = ? AND stat = ?", (category_id, stat))
+    except sqlite3.OperationalError:
+        return None
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return category_profile_from_row(dict(zip([desc[0] for desc in cursor.description], row)))
+
+def clamp_to_category(nutrients: AllNutrients, upper: AllNutrients, factor: float) -> tuple[AllNutrients, list[str]]:
+    """
+    Clamp each nutrient to [0, factor * upper]. Nutrients the category has no
+    data for (upper of 0) are left alone. Returns the clamped profile and the
+    names of the fields that changed.
+    """
+    values = nutrients.model_dump()
+    clamped = []
+    for field, value in values.items():
+        bound = getattr(upper, field) * factor
+        if value < 0:
+            values[field] = 0.0
+            clamped.append(field)
+        elif bound > 0 and value > bound:
+            values[field] = round(bound, 4)
+            clamped.append(field)
+    return AllNutrients(**values), clamped
+
 if __name__ == "__main__":
     ingredient = AnalysisIngredient(
         fdc_id=170392,
@@ -0,0 +1,163 @@
+import asyncio
+import base64
+import io
+import ipaddress
+import logging
+import math
+import os
+import socket
+from urllib.parse import urlsplit
+
+from admission import run_in_threadpool
+
+from tracing import span, log_event
+
+# Optional preprocessing for vision calls: fetch the photo, downscale it to
+# IMAGE_MAX_DIM, recompress as JPEG and send it inline as a data URL. Full
+# resolution phone photos cost more upload time and more vision tokens than
+# GPT-4o can use. Requires Pillow; without it (or if anything fails) the
+# original URL is sent unchanged.
+
+IMAGE_PREPROCESS = os.getenv("IMAGE_PREPROCESS", "0") == "1"
+IMAGE_MAX_DIM = int(os.getenv("IMAGE_MAX_DIM", "1024"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+IMAGE_DETAIL = os.getenv("IMAGE_DETAIL", "auto")
+IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "10"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(20 * 1024 * 1024)))
+IMAGE_MAX_REDIRECTS = int(os.getenv("IMAGE_MAX_REDIRECTS", "3"))
+# Photo URLs come from clients, so only public hosts are fetched unless this is set (local development)
+IMAGE_ALLOW_PRIVATE_HOSTS = os.getenv("IMAGE_ALLOW_PRIVATE_HOSTS", "0") == "1"
+
+Image = None
+if IMAGE_PREPROCESS:
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        log_event("image_prep_disabled", level=logging.WARNING, error="Pillow is not installed")
+
+def image_part(url, detail=IMAGE_DETAIL):
+    """The `image_url` payload for a chat message."""
+    part = {"url": url}
+    if detail != "auto":
+        part["detail"] = detail
+    return part
+
+# --------------------------------------------------------------------------------
+# Fetch and downscale
+# --------------------------------------------------------------------------------
+
+class ImageFetchError(Exception):
+    """A photo URL we won't fetch, or an image over IMAGE_MAX_BYTES."""
+
+async def check_url(url):
+    """Raise ImageFetchError unless url is http(s) on a public host."""
+    parsed = urlsplit(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ImageFetchError(f"Only http(s) image URLs are fetched: {url[:100]}")
+    if IMAGE_ALLOW_PRIVATE_HOSTS:
+        return
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    try:
+        addresses = await asyncio.get_running_loop().getaddrinfo(parsed.hostname, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise ImageFetchError(f"Can't resolve {parsed.hostname}: {e}")
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%", 1)[0])
+        address = getattr(address, "ipv4_mapped", None) or address
+        if not address.is_global:
+            raise ImageFetchError(f"{parsed.hostname} isn't a public address")
+
+async def fetch_image(url) -> bytes:
+    """
+    The image at url (or in a data: URL), at most IMAGE_MAX_BYTES. Redirects
+    are followed by hand, up to IMAGE_MAX_REDIRECTS, so each hop is checked.
+    """
+    import httpx
+    if url.startswith("data:"):
+        encoded = url.split(",", 1)[1]
+        if len(encoded) * 3 // 4 > IMAGE_MAX_BYTES:
+            raise ImageFetchError(f"Image is over {IMAGE_MAX_BYTES} bytes")
+        return base64.b64decode(encoded)
+
+    async with httpx.AsyncClient(timeout=IMAGE_FETCH_TIMEOUT) as http:
+        for _ in range(IMAGE_MAX_REDIRECTS + 1):
+            await check_url(url)
+            async with http.stream("GET", url) as response:
+                if response.is_redirect:
+                    url = str(response.url.join(response.headers["location"]))
+                    continue
+                response.raise_for_status()
+                length = response.headers.get("content-length", "")
+                if length.isdigit() and int(length) > IMAGE_MAX_BYTES:
+                    raise ImageFetchError(f"Image is over {IMAGE_MAX_BYTES} bytes")
+                chunks, size = [], 0
+                async for chunk in response.aiter_bytes():
+                    size += len(chunk)
+                    if size > IMAGE_MAX_BYTES:
+                        raise ImageFetchError(f"Image is over {IMAGE_MAX_BYTES} bytes")
+                    chunks.append(chunk)
+                return b"".join(chunks)
+    raise ImageFetchError(f"More than {IMAGE_MAX_REDIRECTS} redirects")
+
+async def load_image(url):
+    """fetch_image, returning None (and logging) instead of raising."""
+    try:
+        with span("image_fetch"):
+            return await fetch_image(url)
+    except Exception as e:
+        log_event("image_fetch_failed", level=logging.WARNING, url=url[:200], error=str(e))
+        return None
+
+def downscale(image_bytes, max_dim=IMAGE_MAX_DIM, quality=IMAGE_JPEG_QUALITY) -> bytes:
+    """Fit the image inside max_dim x max_dim and re-encode as JPEG."""
+    image = Image.open(io.BytesIO(image_bytes))
+    # Let the JPEG decoder scale by 1/2, 1/4 or 1/8 while decoding, much cheaper than a full decode
+    image.draft("RGB", (max_dim, max_dim))
+    # Phone photos are often stored sideways with an EXIF rotation flag
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image.thumbnail((max_dim, max_dim), Image.LANCZOS)
+
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=quality, optimize=True)
+    processed = out.getvalue()
+    # Small, already-compressed images can come out larger, keep whichever is smaller
+    return processed if len(processed) < len(image_bytes) else image_bytes
+
+def to_data_url(image_bytes) -> str:
+    mime = "image/png" if image_bytes[:8] == b"\x89PNG\r\n\x1a\n" else "image/jpeg"
+    return f"data:{mime};base64,{base64.b64encode(image_bytes).decode()}"
+
+async def prepare_image(url, image_bytes=None):
+    """
+    Returns the `image_url` payload for a vision call. When preprocessing is on
+    the image is fetched (unless image_bytes is given), downscaled and inlined.
+    """
+    if not IMAGE_PREPROCESS or Image is None:
+        return image_part(url)
+
+    try:
+        with span("image_prep"):
+            if image_bytes is None:
+                image_bytes = await fetch_image(url)
+            processed = await run_in_threadpool(downscale, image_bytes)
+    except Exception as e:
+        log_event("image_prep_failed", level=logging.WARNING, url=url[:200], error=str(e))
+        return image_part(url)
+
+    return image_part(to_data_url(processed))
+
+# --------------------------------------------------------------------------------
+# Vision token estimate
+# --------------------------------------------------------------------------------
+
+def estimate_vision_tokens(width, height, detail=IMAGE_DETAIL):
+    """GPT-4o image token cost: 85 base plus 170 per 512px tile after OpenAI's own resizing."""
+    if detail == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
@@ -0,0 +1,221 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from models.meal_analysis import AnalysisIngredient, AnalysisMeal, AllNutrients
+from helper import get_selected_portion
+
+# Server-side meal sessions, so editing one ingredient doesn't mean re-sending
+# the whole meal and recomputing every calculate_* total. A session keeps each
+# ingredient's contribution vector (its nutrients scaled by portion and
+# amount) and the running totals; an edit swaps one contribution in the
+# totals, O(1) whatever the meal's size. The totals are re-added from the
+# contributions every MEAL_SESSION_REBUILD_EVERY edits so float drift from
+# the running sums stays bounded.
+#
+# Sessions live in this process (LRU of MEAL_SESSION_MAX_ENTRIES, idle ones
+# expire after MEAL_SESSION_TTL_S); with several workers a session's requests
+# need to reach the worker that created it.
+
+MEAL_SESSION_TTL_S = float(os.getenv("MEAL_SESSION_TTL_S", "3600"))
+MEAL_SESSION_MAX_ENTRIES = int(os.getenv("MEAL_SESSION_MAX_ENTRIES", "10000"))
+MEAL_SESSION_REBUILD_EVERY = int(os.getenv("MEAL_SESSION_REBUILD_EVERY", "256"))
+
+# AllNutrients field -> the AnalysisMeal total it adds up to (protein_in_grams -> protein_float)
+NUTRIENT_FIELDS = list(AllNutrients.model_fields)
+TOTAL_FIELDS = [field.split("_in_")[0] + "_float" for field in NUTRIENT_FIELDS]
+assert all(field in AnalysisMeal.model_fields for field in TOTAL_FIELDS)
+
+class SessionError(Exception):
+    """An edit that can't be applied; nothing in its batch was."""
+
+class VersionConflict(Exception):
+    def __init__(self, version):
+        super().__init__(f"Session is at version {version}")
+        self.version = version
+
+def contribution(ingredient: AnalysisIngredient) -> list[float]:
+    """What the ingredient adds to each total, the same sum the calculate_* helpers make."""
+    portion = get_selected_portion(ingredient)
+    if portion is None:
+        raise SessionError(f"selected_portion_id {ingredient.selected_portion_id} isn't one of {ingredient.description}'s portions")
+    scale = portion.gram_weight / 100.0 * ingredient.amount
+    nutrients = ingredient.nutrients
+    return [scale * getattr(nutrients, field) for field in NUTRIENT_FIELDS]
+
+def rounded(totals):
+    # The calculators round their sums to 2 places
+    return [round(value, 2) for value in totals]
+
+class MealSession:
+    def __init__(self, meal: AnalysisMeal):
+        self.id = uuid.uuid4().hex
+        self.meal = meal.model_copy(update={"ingredients_new": []})
+        self.version = 0
+        self.next_id = 0
+        self.ingredients = {}
+        self.contributions = {}
+        self.totals = [0.0] * len(NUTRIENT_FIELDS)
+        self.edits_since_rebuild = 0
+        self.touched = time.monotonic()
+        self.lock = threading.Lock()
+        for ingredient in meal.ingredients_new:
+            self.add(ingredient)
+        self.rebuild()
+
+    # Each of these is O(1): one contribution out of the totals, one in
+
+    def add(self, ingredient: AnalysisIngredient) -> str:
+        key = str(self.next_id)
+        self.next_id += 1
+        self.ingredients[key] = ingredient
+        self.contributions[key] = new = contribution(ingredient)
+        self.totals = [total + n for total, n in zip(self.totals, new)]
+        return key
+
+    def remove(self, key):
+        del self.ingredients[key]
+        old = self.contributions.pop(key)
+        self.totals = [total - o for total, o in zip(self.totals, old)]
+
+    def update(self, key, changes: dict):
+        self.ingredients[key] = ingredient = self.ingredients[key].model_copy(update=changes)
+        old = self.contributions[key]
+        self.contributions[key] = new = contribution(ingredient)
+        self.totals = [total - o + n for total, o, n in zip(self.totals, old, new)]
+
+    def rebuild(self):
+        """Totals re-added from the contributions, dropping the running sums' drift."""
+        totals = [0.0] * len(NUTRIENT_FIELDS)
+        for values in self.contributions.values():
+            totals = [total + v for total, v in zip(totals, values)]
+        self.totals = totals
+        self.edits_since_rebuild = 0
+
+    def check(self, edits: list[dict]):
+        """Raise SessionError if any edit in the batch can't be applied."""
+        removed = set()
+        for i, edit in enumerate(edits):
+            op = edit.get("op")
+            if op == "add":
+                if edit.get("ingredient") is None:
+                    raise SessionError(f"edit {i}: add needs an ingredient")
+                ingredient = edit["ingredient"]
+                if get_selected_portion(ingredient) is None:
+                    raise SessionError(f"edit {i}: selected_portion_id {ingredient.selected_portion_id} isn't one of {ingredient.description}'s portions")
+                continue
+            if op not in ("update", "remove"):
+                raise SessionError(f"edit {i}: op must be add, update or remove")
+            key = edit.get("id")
+            if key not in self.ingredients or key in removed:
+                raise SessionError(f"edit {i}: no ingredient {key}")
+            if op == "remove":
+                removed.add(key)
+                continue
+            portion_id = edit.get("selected_portion_id")
+            if portion_id is not None and not any(p.id == portion_id for p in self.ingredients[key].portions):
+                raise SessionError(f"edit {i}: ingredient {key} has no portion {portion_id}")
+            amount = edit.get("amount")
+            if amount is not None and amount < 0:
+                raise SessionError(f"edit {i}: amount can't be negative")
+            if portion_id is None and amount is None:
+                raise SessionError(f"edit {i}: update needs selected_portion_id or amount")
+
+    def apply(self, edits: list[dict], version: int = None) -> dict:
+        """
+        Apply a batch of edits, all or none. Returns the new version, the
+        ingredient ids added/updated/removed and only the totals that changed.
+        """
+        with self.lock:
+            return self.apply_locked(edits, version)
+
+    def apply_locked(self, edits, version):
+        if version is not None and version != self.version:
+            raise VersionConflict(self.version)
+        self.check(edits)
+
+        before = rounded(self.totals)
+        added, updated, removed = [], [], []
+        for edit in edits:
+            op = edit["op"]
+            if op == "add":
+                added.append(self.add(edit["ingredient"]))
+            elif op == "remove":
+                self.remove(edit["id"])
+                removed.append(edit["id"])
+            else:
+                changes = {field: edit[field] for field in ("selected_portion_id", "amount") if edit.get(field) is not None}
+                self.update(edit["id"], changes)
+                updated.append(edit["id"])
+
+        self.edits_since_rebuild += len(edits)
+        if self.edits_since_rebuild >= MEAL_SESSION_REBUILD_EVERY or not self.ingredients:
+            self.rebuild()
+        self.version += 1
+
+        after = rounded(self.totals)
+        return {
+            "session_id": self.id,
+            "version": self.version,
+            "added": added,
+            "updated": updated,
+            "removed": removed,
+            "totals": {field: value for field, old, value in zip(TOTAL_FIELDS, before, after) if value != old},
+        }
+
+    def to_meal(self) -> AnalysisMeal:
+        with self.lock:
+            return self.meal.model_copy(update={
+                "ingredients_new": list(self.ingredients.values()),
+                **dict(zip(TOTAL_FIELDS, rounded(self.totals))),
+            })
+
+    def state(self) -> dict:
+        with self.lock:
+            return {
+                "session_id": self.id,
+                "version": self.version,
+                "ingredient_ids": list(self.ingredients),
+                "totals": dict(zip(TOTAL_FIELDS, rounded(self.totals))),
+            }
+
+class MealSessionStore:
+    """LRU of sessions, idle ones expire after ttl_s."""
+
+    def __init__(self, max_entries=MEAL_SESSION_MAX_ENTRIES, ttl_s=MEAL_SESSION_TTL_S):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def create(self, meal: AnalysisMeal) -> MealSession:
+        session = MealSession(meal)
+        with self.lock:
+            self.sessions[session.id] = session
+            while len(self.sessions) > self.max_entries:
+                self.sessions.popitem(last=False)
+        return session
+
+    def get(self, session_id) -> MealSession | None:
+        now = time.monotonic()
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return None
+            if now - session.touched > self.ttl_s:
+                del self.sessions[session_id]
+                return None
+            session.touched = now
+            self.sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id) -> bool:
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        return len(self.sessions)
+
+meal_sessions = MealSessionStore()
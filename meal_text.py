@@ -0,0 +1,185 @@
+import re
+
+from portions import MASS_GRAMS, VOLUME_ML, normalize_unit
+
+# Rule-based parser for typed meals ("2 eggs, 1 cup rice, 4 oz chicken"), so
+# /text-meal can skip the vision and LLM steps. Each item becomes a quantity,
+# a unit and a food phrase for search_food:
+#
+#   "2 eggs"                     2 each      eggs
+#   "1 1/2 cups of rice"         1.5 cup     rice
+#   "200g chicken breast"        200 g       chicken breast
+#   "a slice of bread"           1 slice     bread
+#   "half a cup oats"            0.5 cup     oats
+#   "chicken breast (200 g)"     200 g       chicken breast
+#   "coffee"                     1 each      coffee
+#
+# Items are split on commas, semicolons, new lines, "+" and "plus", and on
+# "and", "&" and "with" only when a quantity follows ("mac and cheese" and
+# "mac & cheese" stay one food). A count without a unit is "each", a whole one
+# (see portions.py). A mass or volume with no food after it ("3 oz") has no
+# name, and is left unresolved.
+
+# Units that aren't mass or volume, answered by the food's own portions
+COUNT_UNITS = {
+    "each", "serving", "piece", "slice", "large", "medium", "small", "extra large", "clove", "can",
+    "bottle", "bowl", "handful", "stick", "scoop", "bar", "container", "package", "packet", "pinch",
+    "dash", "leaf", "sprig", "fillet", "breast", "thigh", "drumstick", "wing", "patty", "link", "strip",
+}
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "half": 0.5, "dozen": 12, "couple": 2,
+}
+
+FRACTIONS = {"½": "1/2", "⅓": "1/3", "⅔": "2/3", "¼": "1/4", "¾": "3/4", "⅛": "1/8"}
+
+# 2, 2.5, 1/2, 2-3 (a range, its midpoint), each with an optional attached unit (200g, 2x)
+NUMBER = re.compile(r"^(\d+(?:\.\d+)?(?:/\d+)?)(?:-(\d+(?:\.\d+)?))?([a-z]+)?$")
+FRACTION = re.compile(r"^\d+/\d+$")
+
+SPLIT = re.compile(r"[,;\n+]|\bplus\b")
+SPLIT_BEFORE_QUANTITY = re.compile(
+    r"\s*(?:\band\b|\bwith\b|&)\s*(?=(?:\d|[½⅓⅔¼¾⅛]|(?:" + "|".join(NUMBER_WORDS) + r")\b))"
+)
+
+def number_value(text):
+    if "/" in text:
+        numerator, denominator = text.split("/", 1)
+        return float(numerator) / float(denominator) if float(denominator) else None
+    return float(text)
+
+def unit_at(tokens, i):
+    """(unit, tokens used) for a unit starting at tokens[i], or (None, 0)."""
+    for n in (2, 1):
+        if i + n > len(tokens):
+            continue
+        text = " ".join(tokens[i:i + n])
+        unit = normalize_unit(text)
+        if unit in MASS_GRAMS or unit in VOLUME_ML:
+            return unit, n
+        for candidate in (unit, unit[:-1] if unit.endswith("s") else None, unit[:-2] if unit.endswith("es") else None):
+            if candidate in COUNT_UNITS:
+                return candidate, n
+    return None, 0
+
+def attached_unit(suffix):
+    """Unit written onto the number ("200g", "4oz"), "" for a multiplier ("2x"), None if it isn't one."""
+    if suffix is None or suffix == "x":
+        return ""
+    unit, _ = unit_at([suffix], 0)
+    return unit
+
+def quantity_at(tokens, i):
+    """(quantity, unit or None, tokens used) for a quantity starting at tokens[i], or (None, None, 0)."""
+    quantity, unit, j = None, None, i
+    while j < len(tokens):
+        token = tokens[j]
+        match = NUMBER.match(token)
+        if match is not None:
+            low, high, suffix = match.groups()
+            attached = attached_unit(suffix)
+            if attached is None:
+                break
+            value = number_value(low)
+            if value is None:
+                break
+            if high is not None:
+                value = (value + float(high)) / 2
+            # "1 1/2": a fraction right after a whole number adds to it
+            if quantity is not None and FRACTION.match(low) and high is None:
+                quantity += value
+            elif quantity is None:
+                quantity = value
+            else:
+                break
+            j += 1
+            if attached:
+                unit = attached
+                break
+            continue
+        if token in NUMBER_WORDS:
+            value = NUMBER_WORDS[token]
+            # "a dozen", "half a": words combine by multiplying
+            quantity = value if quantity is None else quantity * value
+            j += 1
+            continue
+        break
+
+    if quantity is None:
+        return None, None, 0
+    return quantity, unit, j - i
+
+def parse_item(text):
+    """{"name", "quantity", "unit", "text"} for one typed item, or None if there's no food in it."""
+    original = text.strip()
+    text = original.lower()
+    for symbol, fraction in FRACTIONS.items():
+        text = re.sub(r"(\d)" + symbol, r"\1 " + fraction, text).replace(symbol, fraction)
+    text = re.sub(r"[()\[\]:]", " ", text)
+    text = re.sub(r"(?<=\s)-(?=\s)|^-\s*", " ", text)
+    tokens = [t.strip(".") for t in text.split() if t.strip(".")]
+    if not tokens:
+        return None
+
+    quantity, unit, used = quantity_at(tokens, 0)
+    if used:
+        food = tokens[used:]
+        if unit is None:
+            unit, n = unit_at(food, 0)
+            if n < len(food):
+                food = food[n:]
+            elif unit in COUNT_UNITS:
+                # "2 wings": the unit is the food
+                unit = None
+            else:
+                # "3 oz" of nothing
+                return None
+    else:
+        # Quantity at the end instead: "chicken breast 200 g", "rice - 1 cup", "eggs x2"
+        quantity, unit, food = None, None, tokens
+        for start in range(max(0, len(tokens) - 3), len(tokens)):
+            token = re.sub(r"^x(?=\d)", "", tokens[start])
+            rest = [token] + tokens[start + 1:]
+            q, u, n = quantity_at(rest, 0)
+            if not n or start == 0:
+                continue
+            if u is None:
+                u, m = unit_at(rest, n)
+                n += m
+            if n == len(rest):
+                quantity, unit, food = q, u, tokens[:start]
+                break
+
+    if food and food[0] == "of":
+        food = food[1:]
+    name = " ".join(food).strip(" -")
+    if not name:
+        return None
+    return {
+        "name": name,
+        "quantity": float(quantity) if quantity is not None else 1.0,
+        "unit": unit or "each",
+        "text": original,
+    }
+
+def split_items(text):
+    items = []
+    for part in SPLIT.split(text):
+        items.extend(SPLIT_BEFORE_QUANTITY.split(part.strip()))
+    return [item.strip() for item in items if item and item.strip()]
+
+def parse_meal_text(text):
+    """
+    Items of a typed meal, in order. A part without a food in it ("3 oz") comes
+    back with name None, so it can be reported as unresolved; parts with
+    nothing to read in them at all are left out.
+    """
+    items = []
+    for part in split_items(text):
+        item = parse_item(part)
+        if item is None and re.search(r"\w", part):
+            item = {"name": None, "quantity": None, "unit": None, "text": part}
+        if item is not None:
+            items.append(item)
+    return items
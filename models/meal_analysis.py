@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from pydantic.json_schema import SkipJsonSchema
 
 class FoodPortion(BaseModel):
     id: int
@@ -29,6 +30,9 @@ class AnalysisIngredient(BaseModel):
     selected_portion_id: int
     portions: list[FoodPortion]
     nutrients: AllNutrients
+    # Set on local fallbacks (a weaker match or a category average). Left out of
+    # the JSON schema so it isn't part of the structured outputs asked of the LLM.
+    is_estimated: SkipJsonSchema[bool] = False
 
 class AnalysisMeal(BaseModel):
     id: str = ""
@@ -54,5 +58,17 @@ class AnalysisMeal(BaseModel):
     vitamin_e_float: float
     selenium_float: float
 
+class TextMealAnalysis(AnalysisMeal):
+    # Typed items that didn't resolve to a food, as written
+    unresolved: list[str] = []
+
 class InvalidIngredients(BaseModel):
     ingredients: list[AnalysisIngredient]
+
+class GeneratedFood(BaseModel):
+    # Position of the item in the prompt's list, so foods match up even when some are left out
+    index: int
+    food: AnalysisIngredient
+
+class GeneratedFoods(BaseModel):
+    foods: list[GeneratedFood]
@@ -0,0 +1,310 @@
+import os
+import random
+import threading
+import time
+from dotenv import load_dotenv
+
+from tracing import OPENAI_CALLS, log_event
+
+# Single OpenAI client shared by the app, search and the DB build scripts.
+# The openai package is only imported the first time a client is needed.
+#
+# The client sits on one pooled httpx transport (keep-alive, HTTP/2 when the
+# h2 package is installed, explicit timeouts) and has its own retries turned
+# off. Request-path calls go through call_openai() instead, which gives each
+# kind of call a total time budget, only retries when the backoff still fits
+# in that budget, and trips a per-kind circuit breaker after repeated upstream
+# failures so callers can fail fast to the DB-only path.
+#
+# Each kind of call also draws from a token bucket (OPENAI_<KIND>_RPS, 0 for
+# no limit) before every attempt, so bursts are smoothed to what the account's
+# rate limits allow instead of coming back as upstream 429s. A call that would
+# have to wait past its budget for a token fails right away with
+# RateLimitedError.
+
+OPENAI_TIMEOUT_S = float(os.getenv("OPENAI_TIMEOUT_S", "60"))
+OPENAI_CONNECT_TIMEOUT_S = float(os.getenv("OPENAI_CONNECT_TIMEOUT_S", "5"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "64"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "32"))
+OPENAI_KEEPALIVE_EXPIRY_S = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY_S", "60"))
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "1") == "1"
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+
+# Total budget per kind of call, retries and backoff included
+DEADLINES = {
+    "vision": float(os.getenv("OPENAI_VISION_DEADLINE_S", "45")),
+    "chat": float(os.getenv("OPENAI_CHAT_DEADLINE_S", "30")),
+    "embedding": float(os.getenv("OPENAI_EMBEDDING_DEADLINE_S", "5")),
+}
+
+# Requests per second per kind of call (0: unlimited), and how many may go out at once
+RATE_LIMITS = {
+    "vision": float(os.getenv("OPENAI_VISION_RPS", "0")),
+    "chat": float(os.getenv("OPENAI_CHAT_RPS", "0")),
+    "embedding": float(os.getenv("OPENAI_EMBEDDING_RPS", "0")),
+}
+OPENAI_RATE_BURST = int(os.getenv("OPENAI_RATE_BURST", "10"))
+
+BREAKER_FAILURES = int(os.getenv("OPENAI_BREAKER_FAILURES", "5"))
+BREAKER_RESET_S = float(os.getenv("OPENAI_BREAKER_RESET_S", "30"))
+
+# Don't start an attempt with less time than this left in the budget
+MIN_ATTEMPT_S = 0.5
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+
+_client = None
+_lock = threading.Lock()
+
+def build_http_client():
+    import httpx
+    from openai import DefaultHttpxClient
+
+    http2 = OPENAI_HTTP2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            http2 = False
+
+    return DefaultHttpxClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY_S,
+        ),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT_S, connect=OPENAI_CONNECT_TIMEOUT_S),
+    )
+
+def get_openai_client():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                from openai import OpenAI
+                load_dotenv()
+                _client = OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    http_client=build_http_client(),
+                    max_retries=0,
+                )
+    return _client
+
+def set_openai_client(client):
+    """Swap in a different client (benchmarks use a stub)."""
+    global _client
+    _client = client
+
+# --------------------------------------------------------------------------------
+# Circuit breaker
+# --------------------------------------------------------------------------------
+
+class CircuitOpenError(Exception):
+    def __init__(self, kind, retry_after):
+        super().__init__(f"OpenAI {kind} calls are failing, circuit open for {retry_after:.0f}s")
+        self.kind = kind
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. Opens after `failures` consecutive upstream
+    failures and rejects calls for `reset_s`, then lets a single probe through
+    (half open). The probe's outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, name, failures=BREAKER_FAILURES, reset_s=BREAKER_RESET_S):
+        self.name = name
+        self.failures = failures
+        self.reset_s = reset_s
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_s:
+                self.state = "half_open"
+                self.probe_in_flight = False
+            if self.state == "half_open" and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            if self.state != "closed":
+                log_event("circuit_closed", kind=self.name)
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            self.probe_in_flight = False
+            if self.state == "half_open" or (self.state == "closed" and self.consecutive_failures >= self.failures):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                log_event("circuit_opened", kind=self.name, consecutive_failures=self.consecutive_failures)
+
+    def retry_after(self):
+        with self.lock:
+            if self.state != "open":
+                return 0.0
+            return max(0.0, self.reset_s - (time.monotonic() - self.opened_at))
+
+    def is_open(self):
+        """
+        Whether callers should skip upstream for now. False once the reset
+        window has passed (until a probe is in flight), so the next call
+        goes through allow() and probes.
+        """
+        with self.lock:
+            if self.state == "open":
+                return time.monotonic() - self.opened_at < self.reset_s
+            return self.state == "half_open" and self.probe_in_flight
+
+    def status(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_after_s": round(self.retry_after(), 1),
+        }
+
+breakers = {kind: CircuitBreaker(kind) for kind in DEADLINES}
+
+# --------------------------------------------------------------------------------
+# Rate limits
+# --------------------------------------------------------------------------------
+
+class RateLimitedError(Exception):
+    def __init__(self, kind, retry_after):
+        super().__init__(f"OpenAI {kind} calls are over their rate limit, retry in {retry_after:.0f}s")
+        self.kind = kind
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """`rate` tokens a second, up to `burst` saved up. Waiters reserve tokens ahead, in arrival order."""
+
+    def __init__(self, rate, burst=OPENAI_RATE_BURST):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        """Take a token; returns how long to wait before using it, or None (nothing taken) if over max_wait."""
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+    def wait_for(self):
+        """Seconds until a token is free."""
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            tokens = min(self.burst, self.tokens + (time.monotonic() - self.updated) * self.rate)
+            return max(0.0, (1 - tokens) / self.rate)
+
+    def status(self):
+        return {"rate_per_s": self.rate, "burst": self.burst, "wait_s": round(self.wait_for(), 2)}
+
+buckets = {kind: TokenBucket(RATE_LIMITS[kind]) for kind in DEADLINES}
+
+# --------------------------------------------------------------------------------
+# Calls with deadlines and retries
+# --------------------------------------------------------------------------------
+
+def is_retryable(error):
+    from openai import APIConnectionError, APIStatusError
+    if isinstance(error, APIConnectionError):  # includes timeouts
+        return True
+    return isinstance(error, APIStatusError) and error.status_code in RETRYABLE_STATUS
+
+def retry_delay(error, attempt):
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    # Exponential backoff with full jitter
+    return random.uniform(0, 0.5 * (2 ** attempt))
+
+def call_openai(kind, fn, *args, deadline=None, **kwargs):
+    """
+    Call a client method (e.g. client.chat.completions.create) within the
+    budget for `kind`. Raises CircuitOpenError without calling upstream when
+    the breaker for `kind` is open, and RateLimitedError when its rate limit
+    has no token free within the budget.
+    """
+    breaker = breakers[kind]
+    bucket = buckets[kind]
+    budget = DEADLINES[kind] if deadline is None else deadline
+    start = time.monotonic()
+    attempt = 0
+
+    while True:
+        # An open breaker rejects before a token is taken, so rejected calls don't use up the rate limit
+        if breaker.is_open():
+            OPENAI_CALLS.inc((kind, "rejected"))
+            raise CircuitOpenError(kind, breaker.retry_after())
+
+        # The probe is claimed after the rate limit wait, so a half-open breaker's probe doesn't sit in the queue
+        wait = bucket.reserve(budget - (time.monotonic() - start) - MIN_ATTEMPT_S)
+        if wait is None:
+            OPENAI_CALLS.inc((kind, "throttled"))
+            raise RateLimitedError(kind, bucket.wait_for())
+        if wait > 0:
+            time.sleep(wait)
+
+        if not breaker.allow():
+            OPENAI_CALLS.inc((kind, "rejected"))
+            raise CircuitOpenError(kind, breaker.retry_after())
+
+        remaining = budget - (time.monotonic() - start)
+        try:
+            result = fn(*args, timeout=max(remaining, MIN_ATTEMPT_S), **kwargs)
+        except Exception as e:
+            if not is_retryable(e):
+                # Upstream answered, the request itself was bad
+                breaker.record_success()
+                OPENAI_CALLS.inc((kind, "error"))
+                raise
+
+            breaker.record_failure()
+            delay = retry_delay(e, attempt)
+            remaining = budget - (time.monotonic() - start)
+            if attempt >= OPENAI_MAX_RETRIES or delay + MIN_ATTEMPT_S > remaining:
+                OPENAI_CALLS.inc((kind, "failed"))
+                raise
+
+            OPENAI_CALLS.inc((kind, "retried"))
+            log_event("openai_retry", kind=kind, attempt=attempt + 1, delay_s=round(delay, 2), error=str(e))
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        breaker.record_success()
+        OPENAI_CALLS.inc((kind, "ok"))
+        return result
+
+def upstream_status():
+    return {
+        kind: {**breaker.status(), "deadline_s": DEADLINES[kind], "rate_limit": buckets[kind].status()}
+        for kind, breaker in breakers.items()
+    }
@@ -0,0 +1,197 @@
+import math
+import re
+
+# Portion unit resolution. Turns "4 oz.", "1 cup(s)", "2 tbsp." or "1 ser." into
+# grams for a specific food, using the food's own portions from
+# sr_legacy_food_portion where they exist and standard conversions otherwise.
+#
+#   mass units        fixed conversion (oz, lb, g, mg, kg)
+#   food's portions   grams per unit of a matching modifier (cup, slice, large)
+#   volume units      converted through the food's density, taken from any of
+#                     its volume portions (a tbsp portion answers a cup request)
+#   serving           the food's serving/NLEA serving portion, else its first
+#   each              a whole one ("2 eggs"): the food's medium/large/piece
+#                     portion, else a serving
+#
+# parse_quantity() reads the free-text amounts the legacy endpoints send ("1/2", "1 1/2").
+
+MASS_GRAMS = {
+    "g": 1.0,
+    "mg": 0.001,
+    "kg": 1000.0,
+    "oz": 28.3495,
+    "lb": 453.592,
+}
+
+VOLUME_ML = {
+    "ml": 1.0,
+    "l": 1000.0,
+    "tsp": 4.92892,
+    "tbsp": 14.7868,
+    "fl oz": 29.5735,
+    "cup": 236.588,
+    "pint": 473.176,
+    "quart": 946.353,
+}
+
+# Portions that count whole items, in order of preference for "each"
+COUNT_PORTIONS = ("medium", "large", "piece", "small", "extra large", "item", "fruit", "fillet")
+
+UNIT_ALIASES = {
+    "gram": "g", "grams": "g", "gr": "g", "gm": "g",
+    "milligram": "mg", "milligrams": "mg",
+    "kilogram": "kg", "kilograms": "kg",
+    "ounce": "oz", "ounces": "oz",
+    "pound": "lb", "pounds": "lb", "lbs": "lb",
+    "milliliter": "ml", "milliliters": "ml", "millilitre": "ml", "millilitres": "ml",
+    "liter": "l", "liters": "l", "litre": "l", "litres": "l",
+    "teaspoon": "tsp", "teaspoons": "tsp", "tsps": "tsp",
+    "tablespoon": "tbsp", "tablespoons": "tbsp", "tbsps": "tbsp", "tbs": "tbsp",
+    "fluid ounce": "fl oz", "fluid ounces": "fl oz", "floz": "fl oz",
+    "cups": "cup", "c": "cup",
+    "pints": "pint", "pt": "pint",
+    "quarts": "quart", "qt": "quart",
+    "ser": "serving", "servings": "serving", "nlea serving": "serving",
+    "pieces": "piece", "slices": "slice",
+    "whole": "each", "count": "each", "ea": "each",
+}
+
+def parse_quantity(text):
+    """'4' -> 4.0, '1.5' -> 1.5, '1/2' -> 0.5, '1 1/2' -> 1.5. None if it isn't a number."""
+    if isinstance(text, (int, float)):
+        return float(text)
+    total = 0.0
+    parts = str(text).strip().split()
+    if not parts:
+        return None
+    for part in parts:
+        try:
+            if "/" in part:
+                numerator, denominator = part.split("/", 1)
+                total += float(numerator) / float(denominator)
+            else:
+                total += float(part)
+        except (ValueError, ZeroDivisionError):
+            return None
+    return total
+
+def normalize_unit(text):
+    """'cup(s)' -> 'cup', 'oz.' -> 'oz', 'Tablespoons' -> 'tbsp', 'ser.' -> 'serving'."""
+    if not text:
+        return ""
+    text = text.lower().replace("(s)", "")
+    text = re.sub(r"[^a-z ]", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return UNIT_ALIASES.get(text, text)
+
+def modifier_keys(modifier):
+    """
+    Units a portion modifier answers to: the whole modifier and its leading
+    unit, e.g. 'cup, chopped' -> {'cup chopped', 'cup'} and
+    'serving (3 oz)' -> {'serving oz', 'serving'}.
+    """
+    if not isinstance(modifier, str):
+        return set()
+    head = re.split(r"[,(]", modifier, maxsplit=1)[0]
+    keys = {normalize_unit(modifier), normalize_unit(head)}
+    words = normalize_unit(head).split(" ")
+    for n in (2, 1):
+        candidate = normalize_unit(" ".join(words[:n]))
+        if candidate in MASS_GRAMS or candidate in VOLUME_ML or candidate == "serving":
+            keys.add(candidate)
+            break
+    keys.discard("")
+    return keys
+
+# --------------------------------------------------------------------------------
+# Per-food index
+# --------------------------------------------------------------------------------
+
+def portion_units(portions: list[dict]) -> dict:
+    """Grams per one unit for every unit key the food's portions answer to. Earlier portions win."""
+    units = {}
+    for p in portions:
+        if not p["gram_weight"] or not p["amount"]:
+            continue
+        grams_per_unit = p["gram_weight"] / p["amount"]
+        for key in modifier_keys(p["modifier"]):
+            units.setdefault(key, grams_per_unit)
+    return units
+
+def build_portion_index(portions_by_food: dict) -> dict:
+    return {fdc_id: portion_units(portions) for fdc_id, portions in portions_by_food.items()}
+
+def density(units: dict):
+    """Grams per ml from the first volume portion the food has, if any."""
+    for unit, ml in VOLUME_ML.items():
+        if unit in units:
+            return units[unit] / ml
+    return None
+
+# --------------------------------------------------------------------------------
+# Resolution
+# --------------------------------------------------------------------------------
+
+def to_grams(quantity: float, unit: str, units: dict, portions: list[dict]):
+    """
+    Grams for `quantity` of `unit` of a food, as (grams, method), or None when
+    the unit can't be resolved for this food. `units` is portion_units() of
+    the food's `portions`.
+    """
+    unit = normalize_unit(unit)
+
+    if unit in MASS_GRAMS:
+        return quantity * MASS_GRAMS[unit], "mass"
+
+    if unit in units:
+        return quantity * units[unit], "portion"
+
+    if unit in VOLUME_ML:
+        food_density = density(units)
+        if food_density is not None:
+            return quantity * VOLUME_ML[unit] * food_density, "density"
+        # No volume portion to learn the density from, assume water
+        return quantity * VOLUME_ML[unit], "water_density"
+
+    if unit == "each":
+        for size in COUNT_PORTIONS:
+            if size in units:
+                return quantity * units[size], "count"
+        unit = "serving"
+
+    if unit == "serving":
+        # A bare "100 grams" placeholder portion says nothing about serving size
+        first = next((p for p in portions if "g" not in modifier_keys(p["modifier"])), None)
+        if first is not None and first["gram_weight"]:
+            return quantity * first["gram_weight"] / (first["amount"] or 1.0), "first_portion"
+
+    return None
+
+def closest_portion(portions: list, grams: float, unit: str = None):
+    """
+    The portion to present `grams` in: one matching `unit` if given, otherwise
+    the one whose count comes out closest to 1 (120 g of chicken reads better
+    as 0.7 breast than as 4.2 oz). Works on FoodPortion models or dicts.
+    """
+    if not portions:
+        return None
+
+    def field(p, name):
+        return p[name] if isinstance(p, dict) else getattr(p, name)
+
+    if unit:
+        unit = normalize_unit(unit)
+        # Whole ones read best in the portion they were counted in
+        wanted = [unit] + list(COUNT_PORTIONS) if unit == "each" else [unit]
+        for key in wanted:
+            for p in portions:
+                if key in modifier_keys(field(p, "modifier")):
+                    return p
+
+    if not grams or grams <= 0:
+        return portions[0]
+    return min(
+        (p for p in portions if field(p, "gram_weight")),
+        key=lambda p: abs(math.log(grams / field(p, "gram_weight"))),
+        default=portions[0],
+    )
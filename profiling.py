@@ -0,0 +1,212 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+# Opt-in production profiler. A fraction of requests (PROFILE_SAMPLE_RATE) is
+# profiled, either with cProfile or with a low-overhead stack sampler, and the
+# results are aggregated by function until they are downloaded or reset.
+#
+# cProfile only sees the thread it was enabled on (the event loop), and other
+# requests interleaving on the loop while the sampled one awaits are included.
+# The sampler covers every thread, including the threadpool, so it is the
+# better default for finding where a worker's CPU goes.
+
+MODES = ("sampler", "cprofile")
+
+# --------------------------------------------------------------------------------
+# Stack sampler
+# --------------------------------------------------------------------------------
+
+# Top frames (file, function) of a thread with nothing to do: a condition or
+# queue wait, the event loop's select, an executor worker waiting for work.
+# Matched on the file too, so app code's own get()/wait() calls still count.
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+}
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+class StackSampler:
+    """Samples every thread's stack on an interval while at least one profiled request is active."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.active = 0
+        self.lock = threading.Lock()
+        self.wake = threading.Condition(self.lock)
+        self.thread = None
+
+    def begin(self):
+        with self.lock:
+            self.active += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="stack-sampler", daemon=True)
+                self.thread.start()
+            self.wake.notify()
+
+    def end(self):
+        with self.lock:
+            self.active -= 1
+
+    def run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self.lock:
+                while self.active <= 0:
+                    self.wake.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            sampled = []
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+                # Idle threads sit in a wait/select at the top of the stack, skip them
+                if stack and tuple(stack[0].split(":")[:2]) in IDLE_FRAMES:
+                    continue
+                sampled.append(";".join(reversed(stack)))
+            with self.lock:
+                self.stacks.update(sampled)
+                self.samples += 1
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed-stack format, ready for flamegraph.pl or speedscope."""
+        with self.lock:
+            return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def top_functions(self, limit=30):
+        self_counts = Counter()
+        total_counts = Counter()
+        with self.lock:
+            for stack, count in self.stacks.items():
+                frames = stack.split(";")
+                self_counts[frames[-1]] += count
+                for label in set(frames):
+                    total_counts[label] += count
+            total = sum(self.stacks.values()) or 1
+        return [
+            {"function": label, "self_pct": round(100 * count / total, 2), "total_pct": round(100 * total_counts[label] / total, 2)}
+            for label, count in self_counts.most_common(limit)
+        ]
+
+    def reset(self):
+        with self.lock:
+            self.stacks = Counter()
+            self.samples = 0
+
+# --------------------------------------------------------------------------------
+# Profiler state
+# --------------------------------------------------------------------------------
+
+class Profiler:
+    def __init__(self):
+        self.mode = os.getenv("PROFILE_MODE", "sampler")
+        self.sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+        self.sampler = StackSampler(float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000)
+        self.stats = None
+        self.profiled_requests = 0
+        self.cprofile_lock = threading.Lock()
+
+    def configure(self, mode=None, sample_rate=None):
+        if mode is not None:
+            if mode not in MODES:
+                raise ValueError(f"mode must be one of {MODES}")
+            self.mode = mode
+        if sample_rate is not None:
+            self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+
+    def should_sample(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def profile(self, call_next, request):
+        """Run `call_next(request)` under the configured profiler."""
+        self.profiled_requests += 1
+        if self.mode == "sampler":
+            self.sampler.begin()
+            try:
+                return await call_next(request)
+            finally:
+                self.sampler.end()
+
+        # Only one cProfile can be active per thread, skip if another request holds it
+        if not self.cprofile_lock.acquire(blocking=False):
+            return await call_next(request)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                return await call_next(request)
+            finally:
+                profile.disable()
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+        finally:
+            self.cprofile_lock.release()
+
+    def top_functions(self, limit=30):
+        if self.mode == "sampler":
+            return self.sampler.top_functions(limit)
+        if self.stats is None:
+            return []
+        rows = []
+        for (filename, line, name), (cc, nc, tottime, cumtime, _) in self.stats.stats.items():
+            rows.append({
+                "function": f"{os.path.basename(filename)}:{name}:{line}",
+                "calls": nc,
+                "tottime_ms": round(tottime * 1000, 3),
+                "cumtime_ms": round(cumtime * 1000, 3),
+            })
+        rows.sort(key=lambda r: r["cumtime_ms"], reverse=True)
+        return rows[:limit]
+
+    def pstats_bytes(self) -> bytes:
+        """Marshalled stats, loadable with pstats.Stats(path) or snakeviz."""
+        if self.stats is None:
+            return b""
+        with tempfile.NamedTemporaryFile(suffix=".pstats") as f:
+            self.stats.dump_stats(f.name)
+            with open(f.name, "rb") as dumped:
+                return dumped.read()
+
+    def pstats_text(self, limit=50) -> str:
+        if self.stats is None:
+            return ""
+        out = io.StringIO()
+        stats = pstats.Stats(stream=out)
+        stats.add(self.stats)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+    def status(self):
+        return {
+            "mode": self.mode,
+            "sample_rate": self.sample_rate,
+            "profiled_requests": self.profiled_requests,
+            "sampler_samples": self.sampler.samples,
+        }
+
+    def reset(self):
+        self.stats = None
+        self.profiled_requests = 0
+        self.sampler.reset()
+
+profiler = Profiler()
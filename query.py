@@ -1,14 +1,20 @@
 import sqlite3
 import json
-from db.search_service import get_candidates, rerank_with_embeddings
-from helper import get_nutrients, map_nutrients, get_portions, map_portions
+from db.search_service import get_candidates, rerank_with_embeddings, rerank_lexical
+from helper import get_food, get_nutrients, map_nutrients, get_portions, map_portions, get_portion_units, get_food_categories, get_category_profile, DEFAULT_PORTIONS
 from models.meal_analysis import AnalysisIngredient
 import os
 import re
+import logging
+from tracing import span, timed, log_event
+from singleflight import SingleFlight
+from portions import closest_portion, portion_units, to_grams
+from db.snapshots import current_db_path
 
 # source venv/bin/activate
 
-DB_PATH = os.getenv("DB_PATH", "food.db")
+# Misses scoring at least this much fall back to their best candidate when estimating
+ESTIMATE_MIN_SIMILARITY = float(os.getenv("ESTIMATE_MIN_SIMILARITY", "0.3"))
 
 def normalize_text(text):
     text = text.lower()
@@ -16,74 +22,187 @@ def normalize_text(text):
     text = re.sub(r"\s+", " ", text).strip()
     return text
 
-def search_food(term: str, quantity: float):
-    conn = sqlite3.connect(DB_PATH)
-    normalized_term = normalize_text(term)
-    candidates = get_candidates(normalized_term, conn)
-    top_candidates = rerank_with_embeddings(normalized_term, candidates, conn, top_k=5)
-
-    if not top_candidates:
+# Concurrent searches for the same term, or hydration of the same food, share one in-flight call
+search_flight = SingleFlight("search")
+hydration_flight = SingleFlight("hydration")
+
+def find_candidates(normalized_term, local=False):
+    """Top reranked candidates for an already normalized term. local=True ranks on the text alone, without the embedding call."""
+    conn = sqlite3.connect(current_db_path())
+    try:
+        candidates = get_candidates(normalized_term, conn)
+        if local:
+            return rerank_lexical(normalized_term, candidates, top_k=5)
+        return rerank_with_embeddings(normalized_term, candidates, conn, top_k=5)
+    finally:
         conn.close()
-        return None  # No match found
-    
-    for f in top_candidates:
-        print({
-            "fdc_id": f["fdc_id"],
-            "food": f["description"],
-            "similarity": f["similarity"]
-        })
-    print()
 
-    best = top_candidates[0]  # first = closest match
-    if best["similarity"] < 0.5:
-        return {
-            "is_valid": False,
-            "name": term,
-            "quantity_in_grams": quantity
-        }
-
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT fdc_id, data_type, description, fermented_food_serving_size, CAST(collagen AS REAL) AS collagen
-        FROM sr_legacy_food
-        WHERE fdc_id = ?
-    """, (best["fdc_id"],))
-    food_row = cursor.fetchone()
-    colnames = [desc[0] for desc in cursor.description]
-
-    if not food_row:
-        conn.close()
-        return None
+def load_food_details(fdc_id):
+    """(food_data, mapped nutrients, mapped portions) for fdc_id, or None if it doesn't exist."""
+    conn = sqlite3.connect(current_db_path())
+    try:
+        with span("hydration"):
+            food_data = get_food(conn, fdc_id)
 
-    food_data = dict(zip(colnames, food_row))
+            if not food_data:
+                return None
 
-    # Get nutrient data
-    nutrients = get_nutrients(conn, food_data["fdc_id"])
-    mapped_nutrients = map_nutrients(nutrients, food_data)
+            # Get nutrient data
+            nutrients = get_nutrients(conn, food_data["fdc_id"])
+            mapped_nutrients = map_nutrients(nutrients, food_data)
 
-    # Get portion data
-    portions = get_portions(conn, food_data["fdc_id"])
-    mapped_portions = map_portions(portions)
+            # Get portion data
+            portions = get_portions(conn, food_data["fdc_id"])
+            mapped_portions = map_portions(portions)
 
-    # Get first portion
+        return food_data, mapped_nutrients, mapped_portions
+    finally:
+        conn.close()
+
+def build_ingredient(food_data, mapped_nutrients, mapped_portions, quantity, is_estimated=False, unit=None):
+    # Present the quantity in the portion it reads best in (or the requested unit's)
     selected_portion_id = 1
     selected_gram_weight = 100
-    if len(mapped_portions) > 0:
-        selected_portion_id = mapped_portions[0].id
-        selected_gram_weight = mapped_portions[0].gram_weight
+    selected = closest_portion(mapped_portions, quantity, unit)
+    if selected is not None:
+        selected_portion_id = selected.id
+        selected_gram_weight = selected.gram_weight
 
-    ingredient = AnalysisIngredient(
+    return AnalysisIngredient(
         fdc_id=food_data["fdc_id"],
         description=food_data["description"],
         amount=round(quantity / selected_gram_weight, 2),
         selected_portion_id=selected_portion_id,
         portions=mapped_portions,
-        nutrients=mapped_nutrients
+        nutrients=mapped_nutrients,
+        is_estimated=is_estimated
     )
 
-    conn.close()
+def food_grams(quantity, unit, mapped_portions, fdc_id=None):
+    """
+    Grams for `quantity` of `unit` of a food, or None if the unit doesn't apply
+    to it. No unit means quantity is already grams. Without an fdc_id the units
+    come from mapped_portions alone (estimates, or no food at all).
+    """
+    if unit is None:
+        return quantity
+    portions = [p.model_dump() for p in mapped_portions]
+    if fdc_id is None:
+        units = portion_units(portions)
+    else:
+        conn = sqlite3.connect(current_db_path())
+        try:
+            units = get_portion_units(conn, fdc_id)
+        finally:
+            conn.close()
+    resolved = to_grams(quantity, unit, units, portions)
+    return resolved[0] if resolved is not None else None
+
+def guess_category(conn, top_candidates: list[dict]):
+    """The food category the candidates point to, by similarity-weighted vote."""
+    categories = get_food_categories(conn, [c["fdc_id"] for c in top_candidates])
+    votes = {}
+    for c in top_candidates:
+        category_id = categories.get(c["fdc_id"])
+        if category_id is not None:
+            votes[category_id] = votes.get(category_id, 0.0) + max(float(c["similarity"]), 0.01)
+    return max(votes, key=votes.get) if votes else None
+
+@timed("estimate")
+def estimate_food(term: str, quantity: float, top_candidates: list[dict], unit: str = None):
+    """
+    Local stand-in for a term below the match threshold, flagged is_estimated.
+    Uses the best candidate if it scores at least ESTIMATE_MIN_SIMILARITY,
+    otherwise the mean profile and median portion of the candidates' food
+    category. None if neither is available, or no candidate scores above 0.
+    """
+    best = top_candidates[0]
+    # Nothing in common with any candidate (the lexical rerank scores those 0), so no category to go by either
+    if best["similarity"] <= 0:
+        return None
+    if best["similarity"] >= ESTIMATE_MIN_SIMILARITY:
+        details = hydration_flight.do(best["fdc_id"], load_food_details, best["fdc_id"])
+        if details is not None:
+            grams = food_grams(quantity, unit, details[2], best["fdc_id"])
+            if grams is not None:
+                return build_ingredient(*details, grams, is_estimated=True, unit=unit)
+
+    conn = sqlite3.connect(current_db_path())
+    try:
+        category_id = guess_category(conn, top_candidates)
+        if category_id is None:
+            return None
+        profile = get_category_profile(conn, category_id, "mean")
+        portion = get_category_profile(conn, category_id, "median")
+    finally:
+        conn.close()
+
+    if profile is None:
+        return None
+    portions = DEFAULT_PORTIONS
+    if portion is not None and portion["portion_grams"]:
+        portions = [{"id": 1, "gram_weight": portion["portion_grams"], "amount": 1.0, "modifier": "serving"}]
+    mapped_portions = map_portions(portions)
+    grams = food_grams(quantity, unit, mapped_portions)
+    if grams is None:
+        return None
+    food_data = {"fdc_id": 1, "description": term}
+    return build_ingredient(food_data, profile["nutrients"], mapped_portions, grams, is_estimated=True, unit=unit)
+
+@timed("search_food")
+def search_food(term: str, quantity: float, estimate: bool = False, unit: str = None, local: bool = False):
+    """
+    Best database match for term, or an {"is_valid": False} item when nothing
+    clears the threshold. With estimate=True misses resolve to estimate_food()
+    instead, so no LLM call is needed. quantity is in grams, or in `unit`
+    ("cup(s)", "oz.", "ser.") if one is given; a unit the matched food can't
+    be measured in also comes back as an {"is_valid": False} item. local=True
+    skips the query embedding, so the search makes no network calls.
+    """
+    normalized_term = normalize_text(term)
+    top_candidates = search_flight.do((normalized_term, local), find_candidates, normalized_term, local)
+
+    if not top_candidates:
+        return None  # No match found
+    
+    log_event(
+        "search_candidates",
+        level=logging.DEBUG,
+        term=term,
+        candidates=[{"fdc_id": f["fdc_id"], "food": f["description"], "similarity": round(float(f["similarity"]), 4)} for f in top_candidates]
+    )
 
-    return ingredient
+    best = top_candidates[0]  # first = closest match
+    if best["similarity"] < 0.5:
+        if estimate:
+            estimated = estimate_food(term, quantity, top_candidates, unit)
+            if estimated is not None:
+                return estimated
+        return invalid_item(term, quantity, unit, top_candidates)
+
+    details = hydration_flight.do(best["fdc_id"], load_food_details, best["fdc_id"])
+    if details is None:
+        return None
+    grams = food_grams(quantity, unit, details[2], best["fdc_id"])
+    if grams is None:
+        return invalid_item(term, quantity, unit, top_candidates)
+    # Ranked without embeddings while they were unavailable: a guess, like an estimate
+    return build_ingredient(*details, grams, is_estimated=best.get("degraded", False), unit=unit)
+
+def invalid_item(term, quantity, unit, top_candidates):
+    conn = sqlite3.connect(current_db_path())
+    try:
+        category_id = guess_category(conn, top_candidates)
+    finally:
+        conn.close()
+    return {
+        "is_valid": False,
+        "name": term,
+        # Mass and volume units convert without knowing the food, anything else stays None
+        "quantity_in_grams": food_grams(quantity, unit, []),
+        # Not part of the LLM prompt, used to sanity check what it generates
+        "food_category_id": category_id
+    }
 
 if __name__ == "__main__":
     ingredients = [
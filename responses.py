@@ -0,0 +1,94 @@
+import os
+import typing
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+# Meal payloads are serialized straight from the models with pydantic's
+# model_dump_json (no jsonable_encoder pass) and can be trimmed with a
+# `fields` query parameter:
+#
+#   fields=totals                              name and the *_float totals only
+#   fields=-ingredients_new.portions           everything but the portion lists
+#   fields=name,ingredients_new.description,ingredients_new.nutrients.protein_in_grams
+#
+# Entries are comma separated dotted paths, lists apply to each item and a
+# leading "-" excludes instead of includes. Compression of larger responses
+# is set up in app.py (RESPONSE_COMPRESSION).
+
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "gzip")  # gzip, br or off
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+RESPONSE_COMPRESSION_LEVEL = int(os.getenv("RESPONSE_COMPRESSION_LEVEL", "6"))
+
+def field_aliases(model: type[BaseModel]) -> dict:
+    totals = [name for name in model.model_fields if name.endswith("_float")]
+    return {"totals": ["name", *totals]} if totals else {}
+
+def item_model(annotation):
+    """(model, is_list) for a field that holds a model or a list of them, else (None, False)."""
+    if typing.get_origin(annotation) is list:
+        (annotation,) = typing.get_args(annotation)
+        is_list = True
+    else:
+        is_list = False
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation, is_list
+    return None, False
+
+def selection(model: type[BaseModel], paths: list[str]) -> dict:
+    """Dotted paths as a pydantic include/exclude dict, e.g. {"ingredients_new": {"__all__": {"portions": True}}}."""
+    tree = {}
+    for path in paths:
+        node, current = tree, model
+        parts = path.split(".")
+        for i, part in enumerate(parts):
+            field = current.model_fields.get(part) if current is not None else None
+            if field is None:
+                raise HTTPException(status_code=400, detail=f"Unknown field '{path}'")
+            if i == len(parts) - 1:
+                node[part] = True
+                break
+            if node.get(part) is True:
+                break  # the whole field is already selected
+            current, is_list = item_model(field.annotation)
+            node = node.setdefault(part, {})
+            if is_list:
+                node = node.setdefault("__all__", {})
+    return tree
+
+def parse_fields(model: type[BaseModel], fields: str | None):
+    """(include, exclude) for model_dump_json from a `fields` parameter."""
+    if not fields:
+        return None, None
+    aliases = field_aliases(model)
+    include, exclude = [], []
+    for entry in fields.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        target = exclude if entry.startswith("-") else include
+        entry = entry.lstrip("-")
+        target.extend(aliases.get(entry, [entry]))
+    return selection(model, include) or None, selection(model, exclude) or None
+
+def model_response(model: BaseModel, fields: str | None = None) -> Response:
+    include, exclude = parse_fields(type(model), fields)
+    return Response(
+        content=model.model_dump_json(include=include, exclude=exclude),
+        media_type="application/json"
+    )
+
+def compression_middleware():
+    """(middleware class, options) for RESPONSE_COMPRESSION, or None. Brotli needs the brotli-asgi package."""
+    if RESPONSE_COMPRESSION == "br":
+        try:
+            from brotli_asgi import BrotliMiddleware
+            # Clients that don't accept br still get gzip
+            return BrotliMiddleware, {"minimum_size": RESPONSE_COMPRESSION_MIN_BYTES, "gzip_fallback": True}
+        except ImportError:
+            pass
+    if RESPONSE_COMPRESSION in ("br", "gzip"):
+        from starlette.middleware.gzip import GZipMiddleware
+        return GZipMiddleware, {"minimum_size": RESPONSE_COMPRESSION_MIN_BYTES, "compresslevel": RESPONSE_COMPRESSION_LEVEL}
+    return None
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+
+from tracing import SINGLEFLIGHT_CALLS
+
+# Request coalescing. While a call for a key is in flight, identical calls wait
+# for its result instead of repeating the work (duplicate vision calls from
+# client retries, many users searching the same term at once). Nothing is kept
+# once the call finishes; caching is a separate concern.
+#
+# SingleFlight is for blocking code running on worker threads, AsyncSingleFlight
+# for coroutines on the event loop.
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+
+        if not leader:
+            SINGLEFLIGHT_CALLS.inc((self.name, "shared"))
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        SINGLEFLIGHT_CALLS.inc((self.name, "leader"))
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        with self.lock:
+            return len(self.calls)
+
+class AsyncSingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self.tasks = {}
+
+    async def do(self, key, fn, *args, **kwargs):
+        task = self.tasks.get(key)
+        if task is None:
+            SINGLEFLIGHT_CALLS.inc((self.name, "leader"))
+            task = self.tasks[key] = asyncio.ensure_future(fn(*args, **kwargs))
+            task.add_done_callback(lambda t: self.forget(key, t))
+        else:
+            SINGLEFLIGHT_CALLS.inc((self.name, "shared"))
+        # A caller that disconnects shouldn't cancel the work for everyone else waiting on it
+        return await asyncio.shield(task)
+
+    def forget(self, key, task):
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved in case every waiter went away
+            task.exception()
+
+    def in_flight(self):
+        return len(self.tasks)
@@ -0,0 +1,187 @@
+import httpx
+import openai
+import pytest
+
+import openai_client
+from openai_client import CircuitBreaker, CircuitOpenError, TokenBucket, call_openai
+
+class FakeClock:
+    """Stands in for the time module in openai_client: sleeping moves the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(openai_client, "time", clock)
+    # Full jitter would make backoff random, take the top of the range
+    monkeypatch.setattr(openai_client.random, "uniform", lambda low, high: high)
+    return clock
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    breaker = CircuitBreaker("chat", failures=3, reset_s=30)
+    monkeypatch.setitem(openai_client.breakers, "chat", breaker)
+    monkeypatch.setitem(openai_client.buckets, "chat", TokenBucket(0))
+    return breaker
+
+REQUEST = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+def connection_error():
+    return openai.APIConnectionError(request=REQUEST)
+
+def status_error(status, headers=None):
+    response = httpx.Response(status, request=REQUEST, headers=headers or {})
+    return openai.APIStatusError(f"status {status}", response=response, body=None)
+
+class FakeCall:
+    """A client method that raises or returns the given outcomes in turn, advancing the clock by `duration` each."""
+
+    def __init__(self, clock, *outcomes, duration=0.1):
+        self.clock = clock
+        self.outcomes = list(outcomes)
+        self.duration = duration
+        self.timeouts = []
+
+    def __call__(self, timeout=None, **kwargs):
+        self.timeouts.append(timeout)
+        self.clock.now += self.duration
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    @property
+    def calls(self):
+        return len(self.timeouts)
+
+# --------------------------------------------------------------------------------
+# State transitions
+# --------------------------------------------------------------------------------
+
+def test_opens_after_consecutive_failures(breaker, clock):
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.is_open()
+    assert not breaker.allow()
+    clock.now += 10
+    assert breaker.retry_after() == pytest.approx(20)
+
+def test_success_resets_the_failure_count(breaker):
+    for _ in range(2):
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed"
+
+def test_half_open_after_reset_lets_one_probe_through(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+
+    # Callers checking is_open() go on to call upstream, and the first allow() probes
+    assert not breaker.is_open()
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    # Only one probe at a time
+    assert breaker.is_open()
+    assert not breaker.allow()
+
+def test_probe_success_closes(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert not breaker.is_open()
+    assert breaker.allow() and breaker.allow()
+
+def test_probe_failure_reopens_for_another_window(breaker, clock):
+    for _ in range(3):
+        breaker.record_failure()
+    clock.now += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.retry_after() == pytest.approx(30)
+    clock.now += 29
+    assert breaker.is_open() and not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+# --------------------------------------------------------------------------------
+# call_openai
+# --------------------------------------------------------------------------------
+
+def test_open_breaker_rejects_without_calling_or_taking_a_token(breaker, clock, monkeypatch):
+    bucket = TokenBucket(1, burst=1)
+    monkeypatch.setitem(openai_client.buckets, "chat", bucket)
+    for _ in range(3):
+        breaker.record_failure()
+    fn = FakeCall(clock, "unused")
+
+    with pytest.raises(CircuitOpenError):
+        call_openai("chat", fn)
+    assert fn.calls == 0
+    assert bucket.tokens == 1
+
+def test_non_retryable_error_counts_as_success(breaker, clock):
+    for _ in range(2):
+        breaker.record_failure()
+    fn = FakeCall(clock, status_error(400))
+
+    with pytest.raises(openai.APIStatusError):
+        call_openai("chat", fn)
+    # Upstream answered: no retry, and the earlier failures no longer count
+    assert fn.calls == 1
+    assert breaker.consecutive_failures == 0
+    assert breaker.state == "closed"
+
+def test_retryable_error_is_retried_within_the_deadline(breaker, clock):
+    fn = FakeCall(clock, connection_error(), "ok")
+
+    assert call_openai("chat", fn, deadline=10) == "ok"
+    assert fn.calls == 2
+    # Backoff of the first attempt (0.5 * 2**0 at the top of its jitter)
+    assert clock.slept == [0.5]
+    # Each attempt gets what's left of the budget as its timeout
+    assert fn.timeouts[0] == pytest.approx(10)
+    assert fn.timeouts[1] == pytest.approx(10 - 0.1 - 0.5)
+    assert breaker.state == "closed" and breaker.consecutive_failures == 0
+
+def test_no_retry_when_the_backoff_doesnt_fit(breaker, clock):
+    # Upstream asks for 10s, only 5s of budget
+    fn = FakeCall(clock, status_error(429, {"retry-after": "10"}), "unused")
+
+    with pytest.raises(openai.APIStatusError):
+        call_openai("chat", fn, deadline=5)
+    assert fn.calls == 1
+    assert clock.slept == []
+    assert breaker.consecutive_failures == 1
+
+def test_retries_stop_at_max_retries(breaker, clock, monkeypatch):
+    monkeypatch.setattr(openai_client, "OPENAI_MAX_RETRIES", 2)
+    fn = FakeCall(clock, connection_error(), connection_error(), connection_error(), "unused")
+
+    with pytest.raises(openai.APIConnectionError):
+        call_openai("chat", fn, deadline=60)
+    assert fn.calls == 3
+    # Three failures trip this breaker; the next call fails fast
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        call_openai("chat", FakeCall(clock, "unused"))
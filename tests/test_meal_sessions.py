@@ -0,0 +1,181 @@
+import random
+
+import pytest
+
+import meal_sessions
+from meal_sessions import MealSession, MealSessionStore, SessionError, VersionConflict, NUTRIENT_FIELDS, TOTAL_FIELDS
+from models.meal_analysis import AnalysisIngredient, AnalysisMeal, AllNutrients
+
+def ingredient(i, amount=1.0, portion_id=1):
+    rng = random.Random(i)
+    return AnalysisIngredient(
+        fdc_id=100000 + i,
+        description=f"Food {i}",
+        amount=amount,
+        selected_portion_id=portion_id,
+        portions=[
+            {"id": 1, "gram_weight": 100.0, "amount": 1.0, "modifier": "serving"},
+            {"id": 2, "gram_weight": 28.35, "amount": 1.0, "modifier": "oz"},
+            {"id": 3, "gram_weight": 240.0, "amount": 1.0, "modifier": "cup"},
+        ],
+        nutrients={field: round(rng.uniform(0, 20), 2) for field in AllNutrients.model_fields},
+    )
+
+def expected_totals(ingredients):
+    """What the calculate_* helpers add up to, computed from scratch."""
+    totals = [0.0] * len(NUTRIENT_FIELDS)
+    for ing in ingredients:
+        portion = next(p for p in ing.portions if p.id == ing.selected_portion_id)
+        scale = portion.gram_weight / 100.0 * ing.amount
+        totals = [t + scale * getattr(ing.nutrients, f) for t, f in zip(totals, NUTRIENT_FIELDS)]
+    return dict(zip(TOTAL_FIELDS, [round(t, 2) for t in totals]))
+
+def meal(ingredients):
+    return AnalysisMeal(name="Test meal", ingredients_new=ingredients, **{field: 0.0 for field in TOTAL_FIELDS})
+
+def totals_of(session):
+    return {field: getattr(session.to_meal(), field) for field in TOTAL_FIELDS}
+
+# --------------------------------------------------------------------------------
+# Incremental totals
+# --------------------------------------------------------------------------------
+
+def test_totals_on_create_match_a_full_computation():
+    ingredients = [ingredient(i) for i in range(5)]
+    session = MealSession(meal(ingredients))
+    assert totals_of(session) == expected_totals(ingredients)
+    assert session.state()["ingredient_ids"] == ["0", "1", "2", "3", "4"]
+
+def test_totals_after_random_deltas_match_a_rebuild(monkeypatch):
+    # No periodic rebuild, so the running sums are what's checked
+    monkeypatch.setattr(meal_sessions, "MEAL_SESSION_REBUILD_EVERY", 10 ** 9)
+    rng = random.Random(7)
+    session = MealSession(meal([ingredient(i) for i in range(10)]))
+    next_food = 10
+
+    for _ in range(300):
+        ids = list(session.ingredients)
+        op = rng.choice(["add", "update", "update", "remove"] if len(ids) > 1 else ["add", "update"])
+        if op == "add":
+            edit = {"op": "add", "ingredient": ingredient(next_food, amount=rng.uniform(0.5, 3))}
+            next_food += 1
+        elif op == "update":
+            edit = {"op": "update", "id": rng.choice(ids), "amount": round(rng.uniform(0, 4), 2), "selected_portion_id": rng.choice((1, 2, 3))}
+        else:
+            edit = {"op": "remove", "id": rng.choice(ids)}
+        session.apply([edit])
+
+    incremental = totals_of(session)
+    assert incremental == expected_totals(list(session.ingredients.values()))
+    running = list(session.totals)
+    session.rebuild()
+    assert session.totals == pytest.approx(running, abs=1e-9)
+    assert totals_of(session) == incremental
+
+def test_apply_returns_only_changed_totals():
+    session = MealSession(meal([ingredient(0), ingredient(1)]))
+    before = totals_of(session)
+
+    result = session.apply([{"op": "update", "id": "0", "amount": 2.0}])
+    assert result["version"] == 1
+    assert result["updated"] == ["0"]
+    after = totals_of(session)
+    assert result["totals"] == {field: value for field, value in after.items() if value != before[field]}
+
+    # Nothing moves: nothing reported
+    assert session.apply([{"op": "update", "id": "0", "amount": 2.0}])["totals"] == {}
+
+def test_add_and_remove_ids():
+    session = MealSession(meal([ingredient(0)]))
+    result = session.apply([{"op": "add", "ingredient": ingredient(1)}, {"op": "remove", "id": "0"}])
+    assert result["added"] == ["1"] and result["removed"] == ["0"]
+    assert list(session.ingredients) == ["1"]
+    assert totals_of(session) == expected_totals([ingredient(1)])
+
+def test_periodic_rebuild(monkeypatch):
+    monkeypatch.setattr(meal_sessions, "MEAL_SESSION_REBUILD_EVERY", 3)
+    session = MealSession(meal([ingredient(0)]))
+    session.apply([{"op": "update", "id": "0", "amount": 2.0}] * 2)
+    assert session.edits_since_rebuild == 2
+    session.apply([{"op": "update", "id": "0", "amount": 3.0}])
+    assert session.edits_since_rebuild == 0
+
+# --------------------------------------------------------------------------------
+# Validation and versions
+# --------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("edit", [
+    {"op": "replace", "id": "0"},
+    {"op": "update", "id": "9", "amount": 1.0},
+    {"op": "update", "id": "0", "selected_portion_id": 42},
+    {"op": "update", "id": "0", "amount": -1.0},
+    {"op": "update", "id": "0"},
+    {"op": "add"},
+    {"op": "add", "ingredient": ingredient(5, portion_id=42)},
+])
+def test_invalid_edits_raise(edit):
+    with pytest.raises(SessionError):
+        MealSession(meal([ingredient(0)])).apply([edit])
+
+def test_batches_apply_all_or_none():
+    session = MealSession(meal([ingredient(0), ingredient(1)]))
+    before = (totals_of(session), dict(session.ingredients), session.version)
+    with pytest.raises(SessionError):
+        # Valid on its own, but the batch removes "1" twice
+        session.apply([{"op": "update", "id": "0", "amount": 3.0}, {"op": "remove", "id": "1"}, {"op": "remove", "id": "1"}])
+    assert (totals_of(session), dict(session.ingredients), session.version) == before
+
+def test_stale_version_conflicts():
+    session = MealSession(meal([ingredient(0)]))
+    session.apply([{"op": "update", "id": "0", "amount": 2.0}], version=0)
+    with pytest.raises(VersionConflict) as conflict:
+        session.apply([{"op": "update", "id": "0", "amount": 3.0}], version=0)
+    assert conflict.value.version == 1
+    assert session.ingredients["0"].amount == 2.0
+    # No version: applied regardless
+    assert session.apply([{"op": "update", "id": "0", "amount": 3.0}])["version"] == 2
+
+# --------------------------------------------------------------------------------
+# Store
+# --------------------------------------------------------------------------------
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(meal_sessions, "time", clock)
+    return clock
+
+def test_store_evicts_least_recently_used(clock):
+    store = MealSessionStore(max_entries=2, ttl_s=60)
+    a = store.create(meal([ingredient(0)]))
+    b = store.create(meal([ingredient(1)]))
+    assert store.get(a.id) is a  # a is now the most recent
+    c = store.create(meal([ingredient(2)]))
+    assert len(store) == 2
+    assert store.get(b.id) is None
+    assert store.get(a.id) is a and store.get(c.id) is c
+
+def test_store_expires_idle_sessions(clock):
+    store = MealSessionStore(max_entries=10, ttl_s=60)
+    a = store.create(meal([ingredient(0)]))
+    b = store.create(meal([ingredient(1)]))
+    clock.now = 50
+    assert store.get(a.id) is a  # touched, its idle time starts over
+    clock.now = 100
+    assert store.get(a.id) is a
+    assert store.get(b.id) is None
+    assert len(store) == 1
+
+def test_store_delete(clock):
+    store = MealSessionStore()
+    a = store.create(meal([ingredient(0)]))
+    assert store.delete(a.id)
+    assert not store.delete(a.id)
+    assert store.get(a.id) is None
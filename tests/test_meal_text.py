@@ -0,0 +1,105 @@
+import pytest
+
+from meal_text import parse_meal_text
+from portions import parse_quantity, portion_units, to_grams
+
+# --------------------------------------------------------------------------------
+# parse_meal_text
+# --------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("text, expected", [
+    # Quantities
+    ("2 eggs", [("eggs", 2.0, "each")]),
+    ("2-3 eggs", [("eggs", 2.5, "each")]),
+    ("1 1/2 cups of rice", [("rice", 1.5, "cup")]),
+    ("½ cup milk", [("milk", 0.5, "cup")]),
+    ("1½ cups flour", [("flour", 1.5, "cup")]),
+    ("a slice of bread", [("bread", 1.0, "slice")]),
+    ("half a cup oats", [("oats", 0.5, "cup")]),
+    ("a dozen eggs", [("eggs", 12.0, "each")]),
+    ("2 large eggs", [("eggs", 2.0, "large")]),
+    ("coffee", [("coffee", 1.0, "each")]),
+    # Units attached to the number, or after the food
+    ("200g chicken", [("chicken", 200.0, "g")]),
+    ("chicken breast 200 g", [("chicken breast", 200.0, "g")]),
+    ("chicken breast (200 g)", [("chicken breast", 200.0, "g")]),
+    ("rice - 1 cup", [("rice", 1.0, "cup")]),
+    ("eggs x2", [("eggs", 2.0, "each")]),
+    # A count unit on its own is the food, a mass or volume has none
+    ("2 wings", [("wings", 2.0, "each")]),
+    ("3 oz", [(None, None, None)]),
+    ("3 oz, 2 eggs", [(None, None, None), ("eggs", 2.0, "each")]),
+    # Splitting
+    ("2 eggs, 1 cup white rice; 4 oz chicken", [("eggs", 2.0, "each"), ("white rice", 1.0, "cup"), ("chicken", 4.0, "oz")]),
+    ("toast plus 2 eggs", [("toast", 1.0, "each"), ("eggs", 2.0, "each")]),
+    ("1 cup oats and a banana", [("oats", 1.0, "cup"), ("banana", 1.0, "each")]),
+    ("chicken with 1 cup rice", [("chicken", 1.0, "each"), ("rice", 1.0, "cup")]),
+    ("2 eggs & 1 toast", [("eggs", 2.0, "each"), ("toast", 1.0, "each")]),
+    ("mac and cheese", [("mac and cheese", 1.0, "each")]),
+    ("mac & cheese", [("mac & cheese", 1.0, "each")]),
+    ("", []),
+    (" - , ", []),
+])
+def test_parse_meal_text(text, expected):
+    assert [(i["name"], i["quantity"], i["unit"]) for i in parse_meal_text(text)] == expected
+
+def test_parse_meal_text_keeps_item_text():
+    assert [i["text"] for i in parse_meal_text("2 eggs,  3 oz\n1 banana")] == ["2 eggs", "3 oz", "1 banana"]
+
+# --------------------------------------------------------------------------------
+# parse_quantity
+# --------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("text, expected", [
+    ("4", 4.0),
+    ("1.5", 1.5),
+    ("1/2", 0.5),
+    ("1 1/2", 1.5),
+    (2, 2.0),
+    (0.25, 0.25),
+    ("", None),
+    ("abc", None),
+    ("1/0", None),
+])
+def test_parse_quantity(text, expected):
+    assert parse_quantity(text) == expected
+
+# --------------------------------------------------------------------------------
+# to_grams
+# --------------------------------------------------------------------------------
+
+EGG_PORTIONS = [
+    {"gram_weight": 50.0, "amount": 1.0, "modifier": "large"},
+    {"gram_weight": 136.0, "amount": 1.0, "modifier": "cup, chopped"},
+]
+RICE_PORTIONS = [
+    {"gram_weight": 100.0, "amount": 1.0, "modifier": "g"},
+    {"gram_weight": 158.0, "amount": 1.0, "modifier": "cup"},
+]
+NO_PORTIONS = []
+
+@pytest.mark.parametrize("quantity, unit, portions, expected", [
+    # Mass converts the same for every food
+    (4, "oz.", NO_PORTIONS, (4 * 28.3495, "mass")),
+    (200, "grams", RICE_PORTIONS, (200.0, "mass")),
+    # The food's own portion, by modifier
+    (2, "cup(s)", RICE_PORTIONS, (316.0, "portion")),
+    (2, "large", EGG_PORTIONS, (100.0, "portion")),
+    # Other volumes through the density of a volume portion
+    (1, "tbsp", RICE_PORTIONS, (158.0 / 236.588 * 14.7868, "density")),
+    (1, "cup", NO_PORTIONS, (236.588, "water_density")),
+    # Whole ones: a count portion, else a serving
+    (3, "each", EGG_PORTIONS, (150.0, "count")),
+    (1, "each", RICE_PORTIONS, (158.0, "first_portion")),
+    (1, "ser.", EGG_PORTIONS, (50.0, "first_portion")),
+    # Nothing to resolve it with
+    (1, "slice", EGG_PORTIONS, None),
+    (1, "serving", NO_PORTIONS, None),
+])
+def test_to_grams(quantity, unit, portions, expected):
+    result = to_grams(quantity, unit, portion_units(portions), portions)
+    if expected is None:
+        assert result is None
+    else:
+        assert result[1] == expected[1]
+        assert result[0] == pytest.approx(expected[0])
@@ -0,0 +1,174 @@
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("eatwell")
+
+# Spans are recorded into the trace of the current request (if any) and into
+# process-wide histograms that /metrics renders in Prometheus text format.
+
+_current_trace = contextvars.ContextVar("eatwell_trace", default=None)
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# --------------------------------------------------------------------------------
+# Histograms and counters
+# --------------------------------------------------------------------------------
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels: tuple, seconds: float):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += seconds
+            series["count"] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labels, series in sorted(self.series.items()):
+                label_str = ",".join(f'{k}="{v}"' for k, v in zip(self.label_names, labels))
+                sep = "," if label_str else ""
+                for bound, count in zip(self.buckets, series["counts"]):
+                    lines.append(f'{self.name}_bucket{{{label_str}{sep}le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{label_str}{sep}le="+Inf"}} {series["count"]}')
+                lines.append(f"{self.name}_sum{{{label_str}}} {series['sum']:.6f}")
+                lines.append(f"{self.name}_count{{{label_str}}} {series['count']}")
+        return lines
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels: tuple, n=1):
+        with self.lock:
+            self.series[labels] = self.series.get(labels, 0) + n
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.series.items()):
+                label_str = ",".join(f'{k}="{v}"' for k, v in zip(self.label_names, labels))
+                lines.append(f"{self.name}{{{label_str}}} {value}")
+        return lines
+
+STAGE_DURATION = Histogram("eatwell_stage_duration_seconds", "Time spent in each pipeline stage.", ("stage",))
+REQUEST_DURATION = Histogram("eatwell_request_duration_seconds", "End-to-end request latency.", ("method", "route", "status"))
+
+SINGLEFLIGHT_CALLS = Counter("eatwell_singleflight_calls_total", "Coalesced work: leaders ran it, shared waited on a leader.", ("flight", "role"))
+OPENAI_CALLS = Counter("eatwell_openai_calls_total", "OpenAI call attempts by kind and outcome.", ("kind", "outcome"))
+BATCH_ITEMS = Histogram("eatwell_batch_items", "Items per batched upstream call.", ("batcher",), buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+ADMISSIONS = Counter("eatwell_admissions_total", "Requests by endpoint class: admitted right away, queued first, or shed.", ("pool", "outcome"))
+ADMISSION_WAIT = Histogram("eatwell_admission_wait_seconds", "Time queued requests waited for a slot.", ("pool",))
+
+def render_metrics() -> str:
+    return "\n".join(
+        STAGE_DURATION.render() + REQUEST_DURATION.render() + SINGLEFLIGHT_CALLS.render() + OPENAI_CALLS.render() + BATCH_ITEMS.render()
+        + ADMISSIONS.render() + ADMISSION_WAIT.render()
+    ) + "\n"
+
+# --------------------------------------------------------------------------------
+# Traces and spans
+# --------------------------------------------------------------------------------
+
+class Trace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def add(self, name, duration_ms):
+        with self.lock:
+            self.spans.append((name, duration_ms))
+
+    def totals(self) -> dict:
+        """Total milliseconds and call count per span name, in first-seen order."""
+        totals = {}
+        with self.lock:
+            for name, duration_ms in self.spans:
+                total, count = totals.get(name, (0.0, 0))
+                totals[name] = (total + duration_ms, count + 1)
+        return totals
+
+    def server_timing(self) -> str:
+        entries = []
+        for name, (total, count) in self.totals().items():
+            entry = f"{name};dur={total:.1f}"
+            if count > 1:
+                entry += f';desc="{count} calls"'
+            entries.append(entry)
+        entries.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(entries)
+
+def start_trace():
+    trace = Trace()
+    return trace, _current_trace.set(trace)
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+def current_trace():
+    return _current_trace.get()
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_DURATION.observe((name,), seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, seconds * 1000)
+
+def timed(name):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# --------------------------------------------------------------------------------
+# Structured logs
+# --------------------------------------------------------------------------------
+
+def log_event(event, level=logging.INFO, **fields):
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({"event": event, **fields}, default=str))
+
+def log_request(method, path, route, status, trace: Trace):
+    duration = time.perf_counter() - trace.start
+    REQUEST_DURATION.observe((method, route, str(status)), duration)
+    log_event(
+        "request",
+        method=method,
+        path=path,
+        route=route,
+        status=status,
+        duration_ms=round(duration * 1000, 1),
+        spans={name: round(total, 1) for name, (total, _) in trace.totals().items()},
+    )
@@ -0,0 +1,208 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Cache of parsed vision analyses, keyed by the SHA-256 of the image bytes and
+# the prompt version, so a re-submitted photo skips the GPT-4o call. A 64-bit
+# dHash of each image also catches near-duplicates (the same photo re-encoded
+# or resized by the client) within VISION_CACHE_MAX_DISTANCE bits. Entries
+# expire after VISION_CACHE_TTL_S and the least recently used ones are evicted
+# past VISION_CACHE_MAX_ENTRIES. Set VISION_CACHE_MAX_DISTANCE=0 to only match
+# exact bytes.
+
+VISION_CACHE_ENABLED = os.getenv("VISION_CACHE_ENABLED", "0") == "1"
+VISION_CACHE_PATH = os.getenv("VISION_CACHE_PATH", "vision_cache.db")
+VISION_CACHE_TTL_S = float(os.getenv("VISION_CACHE_TTL_S", str(7 * 24 * 3600)))
+VISION_CACHE_MAX_ENTRIES = int(os.getenv("VISION_CACHE_MAX_ENTRIES", "5000"))
+VISION_CACHE_MAX_DISTANCE = int(os.getenv("VISION_CACHE_MAX_DISTANCE", "4"))
+
+def prompt_version(*parts):
+    """Short hash of everything that shapes the vision output (model, prompt text)."""
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()[:12]
+
+# --------------------------------------------------------------------------------
+# Hashes
+# --------------------------------------------------------------------------------
+
+def content_hash(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+def dhash(image_bytes, size=8):
+    """
+    Difference hash: shrink to (size+1) x size grayscale and record whether each
+    pixel is brighter than its right neighbour. Survives resizing and JPEG
+    re-encoding. Returns None if Pillow is missing or the image can't be decoded.
+    """
+    try:
+        from PIL import Image, ImageOps
+        image = Image.open(io.BytesIO(image_bytes))
+        image.draft("L", (size * 8, size * 8))
+        image = ImageOps.exif_transpose(image).convert("L").resize((size + 1, size), Image.BILINEAR)
+    except Exception:
+        return None
+
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def to_unsigned(value):
+    return value & ((1 << 64) - 1)
+
+# --------------------------------------------------------------------------------
+# Cache
+# --------------------------------------------------------------------------------
+
+class VisionCache:
+    def __init__(self, path=VISION_CACHE_PATH, ttl=VISION_CACHE_TTL_S, max_entries=VISION_CACHE_MAX_ENTRIES,
+                 max_distance=VISION_CACHE_MAX_DISTANCE, enabled=VISION_CACHE_ENABLED):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.enabled = enabled
+        self.counts = {"exact_hits": 0, "near_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self.lock = threading.Lock()
+        self.initialized = False
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        if not self.initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS vision_cache (
+                    sha256 TEXT NOT NULL,
+                    prompt_version TEXT NOT NULL,
+                    dhash INTEGER,
+                    analysis TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (sha256, prompt_version)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_vision_cache_last_used ON vision_cache(last_used_at)")
+            conn.commit()
+            self.initialized = True
+        return conn
+
+    def get(self, image_bytes, version):
+        """
+        Returns (analysis, match) where match is "exact" or "near", or
+        (None, None) on a miss. Blocking, call from a worker thread.
+        """
+        digest = content_hash(image_bytes)
+        now = time.time()
+        conn = self.connect()
+        try:
+            row = conn.execute(
+                "SELECT sha256, analysis FROM vision_cache WHERE sha256 = ? AND prompt_version = ? AND created_at > ?",
+                (digest, version, now - self.ttl)
+            ).fetchone()
+            match = "exact"
+
+            if row is None and self.max_distance > 0:
+                row = self.find_near_duplicate(conn, image_bytes, version, now)
+                match = "near"
+
+            if row is None:
+                self.count("misses")
+                return None, None
+
+            conn.execute(
+                "UPDATE vision_cache SET last_used_at = ?, hits = hits + 1 WHERE sha256 = ? AND prompt_version = ?",
+                (now, row[0], version)
+            )
+            conn.commit()
+            self.count(f"{match}_hits")
+            return json.loads(row[1]), match
+        finally:
+            conn.close()
+
+    def find_near_duplicate(self, conn, image_bytes, version, now):
+        target = dhash(image_bytes)
+        if target is None:
+            return None
+        best, best_distance = None, self.max_distance + 1
+        rows = conn.execute(
+            "SELECT sha256, analysis, dhash FROM vision_cache WHERE prompt_version = ? AND dhash IS NOT NULL AND created_at > ?",
+            (version, now - self.ttl)
+        )
+        for sha256, analysis, value in rows:
+            distance = (to_unsigned(value) ^ target).bit_count()
+            if distance < best_distance:
+                best, best_distance = (sha256, analysis), distance
+        return best
+
+    def put(self, image_bytes, version, analysis):
+        now = time.time()
+        value = dhash(image_bytes) if self.max_distance > 0 else None
+        conn = self.connect()
+        try:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO vision_cache (sha256, prompt_version, dhash, analysis, created_at, last_used_at, hits)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+                """,
+                (content_hash(image_bytes), version, to_signed(value) if value is not None else None, json.dumps(analysis), now, now)
+            )
+            self.count("stores")
+            self.evict(conn, now)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def evict(self, conn, now):
+        removed = conn.execute("DELETE FROM vision_cache WHERE created_at <= ?", (now - self.ttl,)).rowcount
+        removed += conn.execute("""
+            DELETE FROM vision_cache WHERE rowid IN (
+                SELECT rowid FROM vision_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (self.max_entries,)).rowcount
+        if removed:
+            self.count("evictions", removed)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] += n
+
+    def clear(self):
+        conn = self.connect()
+        try:
+            conn.execute("DELETE FROM vision_cache")
+            conn.commit()
+        finally:
+            conn.close()
+        with self.lock:
+            self.counts = {name: 0 for name in self.counts}
+
+    def status(self):
+        status = {
+            "enabled": self.enabled,
+            "path": self.path,
+            "ttl_s": self.ttl,
+            "max_entries": self.max_entries,
+            "max_distance": self.max_distance,
+            **self.counts,
+        }
+        if self.enabled:
+            conn = self.connect()
+            try:
+                status["entries"] = conn.execute("SELECT COUNT(*) FROM vision_cache").fetchone()[0]
+            finally:
+                conn.close()
+        return status
+
+vision_cache = VisionCache()
@@ -0,0 +1,99 @@
+import os
+import sqlite3
+import time
+import logging
+
+from tracing import log_event
+
+# Startup warmup: load the food catalog, embedding matrix and fuzzy index into
+# memory, pull food.db into the OS page cache, prime SQLite's FTS query plans
+# and run a few synthetic searches. /ready reports 503 until this finishes, and
+# stays at 503 if a step in REQUIRED_STEPS failed, until a snapshot reload
+# (db/snapshots.py) makes a catalog live.
+
+WARMUP_TERMS = [t.strip() for t in os.getenv("WARMUP_TERMS", "chicken breast,white rice,broccoli").split(",") if t.strip()]
+
+# Without the catalog searches have no embeddings or fuzzy index to work from
+REQUIRED_STEPS = {"catalog"}
+
+state = {
+    "ready": False,
+    "started_at": None,
+    "duration_ms": None,
+    "components": {},
+    "errors": {},
+}
+
+def timed_step(name, fn):
+    start = time.perf_counter()
+    try:
+        return fn()
+    except Exception as e:
+        state["errors"][name] = str(e)
+        log_event("warmup_step_failed", level=logging.WARNING, step=name, error=str(e))
+    finally:
+        state["components"][name] = round((time.perf_counter() - start) * 1000, 1)
+
+def warm_page_cache(db_path, chunk_size=1 << 20):
+    # Sequential read so the first queries don't page food.db in from disk
+    with open(db_path, "rb") as f:
+        while f.read(chunk_size):
+            pass
+
+def warm_sqlite(db_path):
+    from db.search_service import fts_query, trigram_query
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        for term in WARMUP_TERMS:
+            cursor.execute("SELECT rowid FROM food_search WHERE food_search MATCH ? LIMIT 20", (fts_query(term),)).fetchall()
+            try:
+                cursor.execute("SELECT rowid FROM food_search_trigram WHERE food_search_trigram MATCH ? LIMIT 20", (trigram_query(term),)).fetchall()
+            except sqlite3.OperationalError:
+                pass  # built before the trigram index, search falls back to fuzzy
+            cursor.execute("SELECT fdc_id FROM sr_legacy_food WHERE data_type = 'sr_legacy_food' AND description LIKE ? LIMIT 10", (term + "%",)).fetchall()
+    finally:
+        conn.close()
+
+def warm_searches():
+    from query import search_food
+    # Local: warming up shouldn't pay for query embeddings on every start
+    for term in WARMUP_TERMS:
+        search_food(term, 100.0, local=True)
+
+def run_warmup(db_path, version=None):
+    # Heavy imports (numpy, rapidfuzz, openai) happen here, off the request path
+    from db.catalog import FoodCatalog, set_catalog
+
+    state["started_at"] = time.time()
+    start = time.perf_counter()
+
+    timed_step("page_cache", lambda: warm_page_cache(db_path))
+    catalog = timed_step("catalog", lambda: FoodCatalog(db_path).load())
+    if catalog is not None:
+        catalog.version = version
+        set_catalog(catalog)
+        state["components"].update({f"catalog.{name}": ms for name, ms in catalog.timings.items()})
+    timed_step("sqlite", lambda: warm_sqlite(db_path))
+    timed_step("searches", warm_searches)
+
+    state["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    failed = REQUIRED_STEPS & state["errors"].keys()
+    state["ready"] = not failed
+    if failed:
+        log_event("warmup_failed", level=logging.ERROR, steps=sorted(failed), errors=state["errors"])
+        return state
+    log_event("warmup_complete", duration_ms=state["duration_ms"], components=state["components"], errors=state["errors"])
+    return state
+
+def catalog_loaded(version):
+    """
+    A snapshot reload made a catalog live. If startup warmup failed for want
+    of one (or of a snapshot), the server is ready now.
+    """
+    # The reload redid these steps for the new snapshot
+    for step in ("snapshot", "page_cache", "catalog", "sqlite"):
+        state["errors"].pop(step, None)
+    if not state["ready"]:
+        state["ready"] = True
+        log_event("warmup_recovered", version=version)